@@ -0,0 +1,43 @@
+# Gunicorn settings for the multi-worker deployment.
+#
+# The app is preloaded in the master, which does not import torch (about
+# 0.5 s), so the workers fork and answer /health within a second or so.
+# Each worker then loads the model in its background warm-up: checkpoints
+# are mmap-loaded, so all workers share the weight pages through the page
+# cache instead of each reading its own copy. Every worker gets an equal
+# share of the cores for torch intra-op threads, so workers x threads never
+# oversubscribes.
+#
+#   gunicorn -c gunicorn.conf.py src.api:app
+#
+# Environment: WEB_CONCURRENCY (workers), TORCH_NUM_THREADS (per worker),
+# PORT (default 8000).
+
+import os
+
+from src.serving import (
+    configure_torch_threads,
+    default_workers,
+    limit_thread_env,
+    torch_threads_per_worker,
+)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", default_workers()))
+preload_app = True
+
+# Allow for warm-up on slow cold starts before the worker is considered hung
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+
+torch_threads = torch_threads_per_worker(workers)
+
+# Before torch is imported (by the workers' warm-up)
+limit_thread_env(torch_threads)
+
+
+def post_fork(server, worker):
+    configure_torch_threads(torch_threads)
+    server.log.info(
+        "Worker %s: %d torch thread(s), %d worker(s)", worker.pid, torch_threads, workers
+    )
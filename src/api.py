@@ -1,850 +1,1150 @@
+import asyncio
+import copy
+import hmac
 import io
+import json
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+from fastapi import FastAPI, File, Header, Request, UploadFile
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    PlainTextResponse,
+    StreamingResponse,
+)
 
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import JSONResponse, HTMLResponse
-from PIL import Image
-
+from .arrays import parse_npy, parse_shape, wrap_raw
+from .assets import load_static_assets
+from .backends import (
+    BackendRouter,
+    CascadeBackend,
+    InferenceBackend,
+    UnknownBackendError,
+    make_backend,
+    parse_backend_specs,
+    parse_cascade_thresholds,
+)
+from .batching import MicroBatcher
+from .cache import MISSING, PredictionCache
+from .executor import BoundedExecutor, QueueFullError
 from .inference import (
-    BrainTumorClassifier,
+    ImageDecodeError,
     InvalidImageError,
+    ModelUnavailableError,
     NotBrainMRIError,
 )
+from .metrics import (
+    REJECTIONS,
+    REQUEST_SECONDS,
+    STAGE_SECONDS,
+    UNEXPECTED_ERRORS,
+    registry,
+)
+from .jobs import JobStore, JobWorkers
+from .profiling import Profiler, ProfilerBusyError
+from .study import default_axis, open_volume, score_study, volume_suffix
+from .uploads import (
+    MAX_UPLOAD_BYTES,
+    MULTIPART_OVERHEAD_BYTES,
+    BodySizeLimitMiddleware,
+    UploadTooLargeError,
+    detach_upload,
+    read_body,
+    read_file,
+    read_upload,
+    too_large_response,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background: the socket is served (and /health answers)
+    # while /ready keeps reporting 503 until the model is hot. Importing
+    # this module does not import torch; the warm-up does, on a pool thread.
+    readiness.update(ready=False, reason="warming up")
+    warmup_task = asyncio.create_task(_warm_up())
+    _install_profile_signal()
+    job_workers.start()
+    yield
+    warmup_task.cancel()
+    await asyncio.to_thread(job_workers.stop)
+    profiler.stop()
+
+
+app = FastAPI(
+    title="Brain MRI Tumor Detection API", version="0.1.0", lifespan=lifespan
+)
+
+# Largest volume accepted by /predict/study (spooled to disk, then mmapped)
+STUDY_MAX_BYTES = int(os.environ.get("STUDY_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Oversized uploads are refused while streaming, before they are buffered
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={
+        "/predict": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+        "/predict/array": MAX_UPLOAD_BYTES,
+        "/predict/study": STUDY_MAX_BYTES + MULTIPART_OVERHEAD_BYTES,
+        "/jobs": int(os.environ.get("BATCH_UPLOAD_MAX_BYTES", str(256 * 1024 * 1024))),
+        "/predict/batch": int(
+            os.environ.get("BATCH_UPLOAD_MAX_BYTES", str(256 * 1024 * 1024))
+        ),
+    },
+)
+
+
+@app.exception_handler(UploadTooLargeError)
+async def upload_too_large_handler(request, exc: UploadTooLargeError):
+    # Raised while a body without Content-Length streams in
+    status, message = _describe_error(exc)
+    return too_large_response(message)
+
+
+MODELS_DIR = Path(__file__).resolve().parent.parent / "models"
+
+
+def _build_router() -> Tuple[BackendRouter, List[InferenceBackend]]:
+    """
+    Backends from the environment, and the ones to warm up at startup:
+      - MODEL_PATH: the default model; its engine follows the extension
+        unless INFERENCE_BACKEND (eager / torchscript / onnx) is set
+      - EXTRA_BACKENDS: more models selectable per request, "name=path,..."
+      - FALLBACK_MODEL_PATH: the SimpleCNN checkpoint ("simple_cnn"), used
+        instead of the default while its p99 exceeds LATENCY_BUDGET_MS
+      - CASCADE_THRESHOLDS: "low,high" or a report from src/cascade.py;
+        the default becomes "cascade", where SimpleCNN answers confident
+        cases and escalates the rest to the MODEL_PATH model
+    """
+    default = make_backend(
+        os.environ.get("MODEL_PATH", str(MODELS_DIR / "resnet18_brain_mri_mps.pth")),
+        kind=os.environ.get("INFERENCE_BACKEND") or None,
+    )
+    backends = [default]
+    for name, path in parse_backend_specs(os.environ.get("EXTRA_BACKENDS", "")):
+        backends.append(make_backend(path, name=name))
+    warm = list(backends)
+
+    if all(backend.name != "simple_cnn" for backend in backends):
+        backends.append(
+            make_backend(
+                os.environ.get(
+                    "FALLBACK_MODEL_PATH",
+                    str(MODELS_DIR / "simple_cnn_baseline_mps.pth"),
+                ),
+                kind="simple_cnn",
+            )
+        )
+
+    cascade = os.environ.get("CASCADE_THRESHOLDS")
+    if cascade:
+        cheap = next(backend for backend in backends if backend.name == "simple_cnn")
+        default = CascadeBackend(cheap, default, *parse_cascade_thresholds(cascade))
+        backends.append(default)
+        # Warming the cascade warms both of its models
+        warm = [default] + [b for b in warm if b not in (cheap, default.accurate)]
+
+    budget = os.environ.get("LATENCY_BUDGET_MS")
+    router = BackendRouter(
+        backends,
+        default=default.name,
+        fallback="simple_cnn",
+        latency_budget_ms=float(budget) if budget else None,
+        cooldown_s=float(os.environ.get("LATENCY_FALLBACK_COOLDOWN_S", "30")),
+    )
+    if router.auto_fallback and router.fallback not in warm:
+        warm.append(router.fallback)
+    return router, warm
+
+
+router, warm_backends = _build_router()
+
+# The default backend's classifier
+classifier = router.default.classifier
+
+# Decode, validation and inference run here, never on the event loop
+executor = BoundedExecutor(
+    max_workers=int(os.environ.get("PREDICT_POOL_SIZE", "4")),
+    max_queue=int(os.environ.get("PREDICT_MAX_QUEUE", "32")),
+)
+
+# Concurrent /predict requests are coalesced into one forward pass per
+# backend, at the backend's preferred batch size unless BATCH_MAX_SIZE is set
+batchers = {
+    name: MicroBatcher(
+        backend.predict_batch,
+        max_batch_size=int(
+            os.environ.get("BATCH_MAX_SIZE", str(backend.preferred_batch_size))
+        ),
+        max_wait_ms=float(os.environ.get("BATCH_MAX_WAIT_MS", "5")),
+        executor=executor.pool,
+    )
+    for name, backend in router.backends.items()
+}
+batcher = batchers[router.default.name]
+
+# Seconds clients are asked to wait when the executor queue is full
+RETRY_AFTER_SECONDS = 1
+
+# Repeat uploads of the same scan are answered without decoding again
+prediction_cache = PredictionCache(
+    max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", "1024")),
+    max_bytes=int(os.environ.get("CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+    ttl_seconds=float(os.environ.get("CACHE_TTL_SECONDS", "0")),
+)
+
+
+def _warmup_batch_sizes(max_batch_size: int) -> List[int]:
+    """Batch sizes run during warm-up: WARMUP_BATCH_SIZES, or powers of two
+    up to the batcher's cap (plus the cap itself)."""
+    configured = os.environ.get("WARMUP_BATCH_SIZES")
+    if configured:
+        return [int(size) for size in configured.split(",")]
+    sizes = {max_batch_size}
+    size = 1
+    while size < max_batch_size:
+        sizes.add(size)
+        size *= 2
+    return sorted(sizes)
+
+
+# Warm-up state reported by /ready
+readiness = {"ready": False, "reason": "warming up"}
+
+# Seconds before a failed warm-up is retried, doubling up to the maximum
+WARMUP_RETRY_S = float(os.environ.get("WARMUP_RETRY_S", "5"))
+WARMUP_RETRY_MAX_S = 300.0
+
+
+async def _warm_up() -> None:
+    """
+    Load the models, run dummy batches and start the pool threads. A
+    failed attempt (e.g. a checkpoint not mounted yet) is retried with
+    backoff rather than leaving the worker unready for good.
+    """
+    if not await asyncio.to_thread(executor.warmup):
+        logger.warning("Executor threads were slow to start; the rest start on demand")
+
+    delay = WARMUP_RETRY_S
+    while True:
+        try:
+            for backend in warm_backends:
+                sizes = _warmup_batch_sizes(batchers[backend.name].max_batch_size)
+                await asyncio.get_running_loop().run_in_executor(
+                    executor.pool, backend.warmup, sizes
+                )
+            break
+        except Exception as e:
+            logger.exception("Warm-up failed, retrying in %.0f s", delay)
+            readiness.update(
+                ready=False, reason=f"warm-up failed: {e} (retrying in {delay:.0f} s)"
+            )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARMUP_RETRY_MAX_S)
+    readiness.update(ready=True, reason=None)
 
-app = FastAPI(title="Brain MRI Tumor Detection API", version="0.1.0")
 
-classifier = BrainTumorClassifier(
-    model_path="../models/resnet18_brain_mri_mps.pth"
+# Prediction requests currently being handled (streams until finished)
+in_flight = {"requests": 0}
+
+registry.gauge(
+    "brain_mri_in_flight_requests",
+    "Prediction requests being handled.",
+    lambda: in_flight["requests"],
+)
+registry.gauge(
+    "brain_mri_executor_pending",
+    "Jobs running on or waiting for the executor threads.",
+    lambda: executor.pending,
+)
+registry.gauge(
+    "brain_mri_batch_queue_depth",
+    "Images waiting to be batched, over all backends.",
+    lambda: sum(b.queue_depth for b in batchers.values()),
 )
 
 
+# Job images go through the model this many at a time, so a /predict that
+# arrives during a job batch waits for at most one such chunk
+JOB_CHUNK_SIZE = int(os.environ.get("JOB_CHUNK_SIZE", "2"))
+
+
+def _jobs_may_run() -> bool:
+    """The model is warm and no interactive request is in this process."""
+    return readiness["ready"] and in_flight["requests"] == 0
+
+
+def _wait_for_idle(limit_s: float) -> None:
+    """
+    Blocking: hold a job thread between chunks while interactive requests
+    are in flight, for at most `limit_s` so its claim does not expire.
+    """
+    deadline = time.monotonic() + limit_s
+    pause = 0.01
+    while not _jobs_may_run() and time.monotonic() < deadline:
+        time.sleep(pause)
+        pause = min(pause * 2, 0.5)
+
+
+def _score_job_items(backend_name: str, rows: List[tuple]) -> List[dict]:
+    """
+    Blocking: score claimed job images (from any number of jobs) in forward
+    passes of JOB_CHUNK_SIZE, pausing between them while interactive
+    requests are in flight. Returns one /predict/batch-style line per image.
+    """
+    try:
+        backend = router.get(backend_name)
+    except UnknownBackendError as e:
+        # The backend was configured when the job was queued, not any more
+        status, message = _describe_error(e)
+        return [
+            {"index": index, "filename": filename, "status": status, "error": message}
+            for _, index, filename, _ in rows
+        ]
+
+    lines: List[dict] = []
+    prepared, slots = [], []
+    for job_id, index, filename, data in rows:
+        line = {"index": index, "filename": filename}
+        try:
+            prepared.append(backend.decode_and_validate(data))
+            slots.append(line)
+        except (InvalidImageError, NotBrainMRIError) as e:
+            status, message = _describe_error(e)
+            line.update({"status": status, "error": message})
+        lines.append(line)
+    # Model errors propagate: JobWorkers retries the images one by one at
+    # once, and gives an image up after JOB_MAX_ATTEMPTS tries
+    for start in range(0, len(prepared), JOB_CHUNK_SIZE):
+        if start:
+            _wait_for_idle(job_store.lease_s / 2)
+        chunk = slice(start, start + JOB_CHUNK_SIZE)
+        for line, result in zip(slots[chunk], backend.predict_batch(prepared[chunk])):
+            line.update({**result, "backend": backend.name})
+    return lines
+
+
+# Durable queue behind POST /jobs. JOBS_DB should live on persistent
+# storage (e.g. /home on App Service) for jobs to survive a restart.
+job_store = JobStore(
+    os.environ.get("JOBS_DB", os.path.join(tempfile.gettempdir(), "brain-mri-jobs.sqlite3")),
+    lease_s=float(os.environ.get("JOB_LEASE_S", "300")),
+    max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", "3")),
+)
+
+# Job workers only claim work while the model is warm and no interactive
+# request is being handled in this process; a claimed batch then yields
+# between chunks. Job threads of other gunicorn workers are not paused.
+job_workers = JobWorkers(
+    job_store,
+    _score_job_items,
+    can_run=_jobs_may_run,
+    workers=int(os.environ.get("JOB_WORKERS", "1")),
+    batch_size=int(
+        os.environ.get("JOB_BATCH_SIZE", str(router.default.preferred_batch_size))
+    ),
+    ttl_s=float(os.environ.get("JOB_TTL_S", str(24 * 3600))),
+)
+
+# Most image bytes one job may hold (ZIP members counted uncompressed),
+# and how much larger than the archive a ZIP's images may be
+JOB_MAX_BYTES = int(os.environ.get("JOB_MAX_BYTES", str(256 * 1024 * 1024)))
+ZIP_MAX_RATIO = float(os.environ.get("ZIP_MAX_RATIO", "100"))
+
+# Longest a GET /jobs/{id}?wait=... long-poll is held open
+JOB_MAX_WAIT_S = float(os.environ.get("JOB_MAX_WAIT_S", "30"))
+
+registry.gauge(
+    "brain_mri_job_images_queued",
+    "Job images waiting to be scored (all workers sharing JOBS_DB).",
+    job_store.queued,
+)
+
+
+# On-demand profiling of this worker (see src/profiling.py). Started by
+# POST /admin/profile when PROFILING_TOKEN is set, or by SIGUSR2 sent to
+# the worker process for PROFILE_REQUESTS requests / PROFILE_SECONDS.
+profiler = Profiler(
+    # A cascade shares its classifiers with the backends it is made of
+    list({id(b.classifier): b.classifier for b in router.backends.values()}.values()),
+    output_dir=os.environ.get("PROFILE_DIR", "/tmp/brain-mri-profiles"),
+    sample_interval_ms=float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "5")),
+)
+PROFILING_TOKEN = os.environ.get("PROFILING_TOKEN", "")
+PROFILE_REQUESTS = int(os.environ.get("PROFILE_REQUESTS", "100"))
+PROFILE_SECONDS = float(os.environ.get("PROFILE_SECONDS", "30"))
+
+
+def _toggle_profiling() -> None:
+    """SIGUSR2: start a capture with the defaults, or end the running one."""
+    if profiler.active:
+        # Writing the files takes a moment; keep it off the event loop
+        threading.Thread(target=profiler.stop, name="profile-writer").start()
+        return
+    try:
+        profiler.start(PROFILE_REQUESTS, PROFILE_SECONDS)
+    except ProfilerBusyError:
+        pass
+
+
+def _install_profile_signal() -> None:
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR2, _toggle_profiling)
+    except (ValueError, RuntimeError, NotImplementedError, AttributeError):
+        # Not the main thread (e.g. the test client) or not a Unix loop
+        logger.debug("SIGUSR2 profiling toggle not installed")
+
+
+# UI files, read and precompressed once at startup
+static_assets = load_static_assets()
+
+# Largest number of images accepted by one /predict/batch request
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "512"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+
+async def _run_when_free(slots: asyncio.Semaphore, fn, *args):
+    """
+    Run `fn` on the executor, waiting (instead of failing) while the queue
+    is full. Used by bulk endpoints, which should slow down, not error out.
+    """
+    async with slots:
+        while True:
+            try:
+                return await executor.run(fn, *args)
+            except QueueFullError:
+                await asyncio.sleep(0.05)
+
+
+async def _classify(
+    contents,
+    decode_slots: Optional[asyncio.Semaphore] = None,
+    backend: Optional[InferenceBackend] = None,
+    original_size: Optional[Tuple[int, int]] = None,
+    pixels: Optional[np.ndarray] = None,
+) -> dict:
+    """
+    Decode, validate and classify uploaded bytes on `backend` (by default
+    the router's choice), going through the prediction cache. Raises the
+    same errors as the classifier. The result names the backend used.
+
+    With `decode_slots`, decoding waits for a free executor slot instead
+    of raising QueueFullError. `original_size` is the size declared for a
+    client-downscaled upload (see _declared_size). `pixels` is an array
+    view of `contents` (see src/arrays.py), validated without decoding.
+    """
+    backend = backend or router.select()
+    namespace = backend.model_path or ""
+    if original_size is not None:
+        # The size rules run on the declared size, so it is part of the answer
+        namespace += "|%dx%d" % original_size
+    if pixels is not None:
+        namespace += f"|array{pixels.shape}"
+    key = prediction_cache.make_key(contents, namespace)
+    cached = prediction_cache.get(key)
+    if cached is not MISSING:
+        if isinstance(cached, Exception):
+            raise copy.copy(cached)  # keeps the reason, fresh traceback
+        return {**cached, "backend": backend.name}
+
+    started = time.perf_counter()
+    try:
+        if pixels is not None:
+            image = await executor.run(backend.validate_array, pixels)
+        elif decode_slots is None:
+            image = await executor.run(
+                backend.decode_and_validate, contents, original_size
+            )
+        else:
+            image = await _run_when_free(
+                decode_slots, backend.decode_and_validate, contents, original_size
+            )
+    except (InvalidImageError, NotBrainMRIError) as e:
+        prediction_cache.put(key, e)
+        raise
+
+    result = await batchers[backend.name].submit(image)
+    router.record(backend, (time.perf_counter() - started) * 1000.0)
+    prediction_cache.put(key, result)
+    return {**result, "backend": backend.name}
+
+
+# Reason codes for refusals that do not carry their own
+REJECTION_REASONS = {
+    UploadTooLargeError: "upload_too_large",
+    QueueFullError: "queue_full",
+    UnknownBackendError: "unknown_backend",
+    ModelUnavailableError: "model_unavailable",
+}
+
+
+# Invalid inputs from machine clients, whose own message says what is wrong
+SPECIFIC_INVALID_REASONS = {
+    "bad_array",
+    "unsupported_array",
+    "bad_declared_size",
+    "declared_size_mismatch",
+    "bad_volume",
+    "unsupported_volume",
+    "blank_volume",
+}
+
+
+def _describe_error(e: Exception) -> Tuple[int, str]:
+    """
+    Map a pipeline error to the HTTP status and message shown to users,
+    counting it in the rejection / unexpected-error metrics.
+    """
+    reason = getattr(e, "reason", None) or REJECTION_REASONS.get(type(e))
+    if reason is not None:
+        REJECTIONS.inc(error=type(e).__name__, reason=reason)
+    else:
+        UNEXPECTED_ERRORS.inc(error=type(e).__name__)
+        logger.error("Unexpected error in prediction pipeline", exc_info=e)
+
+    if isinstance(e, UploadTooLargeError):
+        return e.status_code, e.detail
+    if isinstance(e, QueueFullError):
+        return 429, "The server is busy. Please try again shortly."
+    if isinstance(e, ImageDecodeError):
+        return 400, "Invalid image file. Please upload a JPG or PNG brain MRI image."
+    if isinstance(e, InvalidImageError):
+        if e.reason in SPECIFIC_INVALID_REASONS:
+            return 400, str(e)
+        return 400, "Invalid image file. Please upload a clear JPG or PNG image."
+    if isinstance(e, UnknownBackendError):
+        return 400, str(e)
+    if isinstance(e, NotBrainMRIError):
+        # Include the specific reason from the classifier
+        return 400, str(e)
+    if isinstance(e, ModelUnavailableError):
+        return 503, "The model is not available right now. Please try again later."
+    return 500, f"Unexpected server error: {str(e)}"
+
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 only once the model is loaded and warmed up."""
+    if readiness["ready"]:
+        return {"status": "ready"}
+    return JSONResponse(
+        {"status": "not_ready", "reason": readiness["reason"]}, status_code=503
+    )
+
+
+@app.get("/stats")
+def stats():
+    return {
+        "batching": batcher.stats(),
+        "batching_by_backend": {name: b.stats() for name, b in batchers.items()},
+        "backends": router.stats(),
+        "executor": executor.stats(),
+        "cache": prediction_cache.stats(),
+        "jobs": job_workers.stats(),
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint (this worker process only)."""
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def _profiling_refused(token: Optional[str]) -> Optional[JSONResponse]:
+    """The error response for an admin request, or None when it may proceed."""
+    if not PROFILING_TOKEN:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    if not token or not hmac.compare_digest(token, PROFILING_TOKEN):
+        return JSONResponse({"error": "Invalid admin token."}, status_code=403)
+    return None
+
+
+@app.post("/admin/profile", include_in_schema=False)
+def start_profile(
+    requests: Optional[int] = None,
+    seconds: Optional[float] = None,
+    x_admin_token: Optional[str] = Header(None),
+):
+    """
+    Profile this worker for the next `requests` prediction requests and/or
+    `seconds` (the PROFILE_* defaults when neither is given). Needs the
+    PROFILING_TOKEN in an X-Admin-Token header.
+    """
+    refused = _profiling_refused(x_admin_token)
+    if refused is not None:
+        return refused
+    if requests is None and seconds is None:
+        requests, seconds = PROFILE_REQUESTS, PROFILE_SECONDS
+    if (requests is not None and requests < 1) or (seconds is not None and seconds <= 0):
+        return JSONResponse(
+            {"error": "requests and seconds must be positive."}, status_code=400
+        )
+    try:
+        return profiler.start(requests, seconds)
+    except ProfilerBusyError as e:
+        return JSONResponse({"error": str(e)}, status_code=409)
+
+
+@app.get("/admin/profile", include_in_schema=False)
+def profile_status(x_admin_token: Optional[str] = Header(None)):
+    """The running capture, if any, and the last one written."""
+    refused = _profiling_refused(x_admin_token)
+    if refused is not None:
+        return refused
+    return profiler.status()
+
+
+@app.delete("/admin/profile", include_in_schema=False)
+def stop_profile(x_admin_token: Optional[str] = Header(None)):
+    """End the running capture early and write its files."""
+    refused = _profiling_refused(x_admin_token)
+    if refused is not None:
+        return refused
+    if profiler.stop() is None:
+        return JSONResponse({"error": "No profile is being captured."}, status_code=409)
+    return profiler.status()
+
+
 @app.get("/", response_class=HTMLResponse)
-def index():
-    return """
-    <!DOCTYPE html>
-    <html lang="en">
-      <head>
-        <title>Brain MRI Tumor Detection</title>
-        <meta charset="utf-8" />
-        <meta
-          name="viewport"
-          content="width=device-width, initial-scale=1, shrink-to-fit=no"
-        />
-
-        <!-- Google Fonts -->
-        <link
-          href="https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap"
-          rel="stylesheet"
-        />
-
-        <!-- Bootstrap CSS -->
-        <link
-          href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css"
-          rel="stylesheet"
-        />
-
-        <style>
-          :root {
-            --bg-gradient-start: #0f172a;
-            --bg-gradient-end: #020617;
-            --card-bg: rgba(15, 23, 42, 0.9);
-            --accent: #4ade80;
-            --accent-soft: rgba(74, 222, 128, 0.15);
-            --accent-strong: #22c55e;
-            --danger: #f97373;
-            --text-main: #e5e7eb;
-            --text-muted: #9ca3af;
-            --border-soft: rgba(148, 163, 184, 0.3);
-          }
-
-          * {
-            box-sizing: border-box;
-          }
-
-          body {
-            margin: 0;
-            min-height: 100vh;
-            font-family: "Inter", system-ui, -apple-system, BlinkMacSystemFont,
-              "Segoe UI", sans-serif;
-            background: radial-gradient(circle at top left, #1d283a, #020617 45%),
-              radial-gradient(circle at bottom right, #0f172a, #020617 55%);
-            color: var(--text-main);
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            padding: 24px 12px;
-          }
-
-          .page-wrapper {
-            width: 100%;
-            max-width: 980px;
-          }
-
-          .hero-card {
-            background: linear-gradient(
-              135deg,
-              rgba(15, 23, 42, 0.96),
-              rgba(15, 23, 42, 0.92)
-            );
-            border-radius: 18px;
-            border: 1px solid var(--border-soft);
-            box-shadow: 0 24px 80px rgba(15, 23, 42, 0.8);
-            overflow: hidden;
-            position: relative;
-            padding: 28px 26px;
-          }
-
-          @media (min-width: 768px) {
-            .hero-card {
-              padding: 34px 32px;
-            }
-          }
-
-          .hero-card::before {
-            content: "";
-            position: absolute;
-            inset: 0;
-            pointer-events: none;
-            background: radial-gradient(
-              circle at top right,
-              rgba(74, 222, 128, 0.16),
-              transparent 55%
-            );
-            opacity: 0.7;
-          }
-
-          .glass-tag {
-            display: inline-flex;
-            align-items: center;
-            gap: 6px;
-            padding: 4px 10px;
-            border-radius: 999px;
-            font-size: 11px;
-            letter-spacing: 0.06em;
-            text-transform: uppercase;
-            color: var(--accent);
-            background: rgba(15, 23, 42, 0.9);
-            border: 1px solid rgba(74, 222, 128, 0.4);
-            box-shadow: 0 5px 16px rgba(15, 23, 42, 0.8);
-            margin-bottom: 14px;
-          }
-
-          .glow-dot {
-            width: 7px;
-            height: 7px;
-            border-radius: 999px;
-            background: var(--accent);
-            box-shadow: 0 0 0 4px rgba(74, 222, 128, 0.35);
-          }
-
-          .hero-title {
-            font-size: clamp(26px, 3vw, 32px);
-            font-weight: 600;
-            letter-spacing: 0.02em;
-            margin-bottom: 8px;
-          }
-
-          .hero-subtitle {
-            font-size: 14px;
-            color: var(--text-muted);
-            max-width: 460px;
-          }
-
-          .hero-subtitle span {
-            color: var(--accent);
-            font-weight: 500;
-          }
-
-          .layout-grid {
-            margin-top: 24px;
-          }
-
-          @media (min-width: 992px) {
-            .layout-grid {
-              display: grid;
-              grid-template-columns: minmax(0, 1.3fr) minmax(0, 1fr);
-              gap: 26px;
-              align-items: stretch;
-            }
-          }
-
-          .upload-panel {
-            background: rgba(15, 23, 42, 0.92);
-            border-radius: 16px;
-            padding: 18px 16px 18px;
-            border: 1px solid rgba(148, 163, 184, 0.4);
-            position: relative;
-            overflow: hidden;
-          }
-
-          .upload-panel::before {
-            content: "";
-            position: absolute;
-            inset: 0;
-            background: linear-gradient(
-              135deg,
-              rgba(148, 163, 184, 0.15),
-              transparent 60%
-            );
-            opacity: 0.4;
-            pointer-events: none;
-          }
-
-          .upload-header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 12px;
-          }
-
-          .upload-title {
-            font-size: 16px;
-            font-weight: 500;
-          }
-
-          .upload-pill {
-            font-size: 11px;
-            padding: 3px 9px;
-            border-radius: 999px;
-            border: 1px solid rgba(148, 163, 184, 0.5);
-            color: var(--text-muted);
-          }
-
-          .upload-dropzone {
-            position: relative;
-            margin-top: 10px;
-            padding: 16px 14px;
-            border-radius: 14px;
-            border: 1px dashed rgba(148, 163, 184, 0.6);
-            background: radial-gradient(
-              circle at top,
-              rgba(15, 23, 42, 0.9),
-              rgba(15, 23, 42, 0.94)
-            );
-            cursor: pointer;
-            transition: border-color 0.2s ease, background 0.2s ease,
-              transform 0.1s ease;
-          }
-
-          .upload-dropzone.hover {
-            border-color: var(--accent);
-            background: radial-gradient(
-              circle at top,
-              rgba(34, 197, 94, 0.1),
-              rgba(15, 23, 42, 0.96)
-            );
-            transform: translateY(-1px);
-          }
-
-          .upload-icon-circle {
-            width: 38px;
-            height: 38px;
-            border-radius: 999px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            margin-bottom: 8px;
-            background: var(--accent-soft);
-            color: var(--accent-strong);
-          }
-
-          .upload-icon-circle svg {
-            width: 20px;
-            height: 20px;
-          }
-
-          .upload-main-text {
-            font-size: 14px;
-            font-weight: 500;
-          }
-
-          .upload-secondary-text {
-            font-size: 12px;
-            color: var(--text-muted);
-          }
-
-          .upload-hint-list {
-            margin-top: 14px;
-            padding-left: 0;
-            list-style: none;
-            font-size: 12px;
-            color: var(--text-muted);
-          }
-
-          .upload-hint-list li {
-            display: flex;
-            align-items: center;
-            gap: 6px;
-            margin-bottom: 4px;
-          }
-
-          .hint-dot {
-            width: 6px;
-            height: 6px;
-            border-radius: 999px;
-            background: rgba(148, 163, 184, 0.8);
-          }
-
-          .hint-key {
-            color: var(--accent);
-            font-weight: 500;
-          }
-
-          .hidden-input {
-            display: none;
-          }
-
-          .primary-btn {
-            margin-top: 16px;
-            width: 100%;
-            border-radius: 999px;
-            border: none;
-            outline: none;
-            padding: 10px 16px;
-            font-size: 14px;
-            font-weight: 500;
-            background: linear-gradient(135deg, #4ade80, #22c55e);
-            color: #022c22;
-            display: inline-flex;
-            align-items: center;
-            justify-content: center;
-            gap: 8px;
-            cursor: pointer;
-            box-shadow: 0 14px 40px rgba(34, 197, 94, 0.35);
-            transition: transform 0.12s ease, box-shadow 0.15s ease,
-              filter 0.15s ease;
-          }
-
-          .primary-btn span.loader {
-            display: none;
-            width: 16px;
-            height: 16px;
-            border-radius: 999px;
-            border: 2px solid rgba(15, 23, 42, 0.5);
-            border-top-color: #022c22;
-            animation: spin 0.9s linear infinite;
-          }
-
-          .primary-btn.loading span.loader {
-            display: inline-block;
-          }
-
-          .primary-btn.loading span.btn-label {
-            opacity: 0.7;
-          }
-
-          .primary-btn:hover {
-            transform: translateY(-1px);
-            box-shadow: 0 18px 50px rgba(34, 197, 94, 0.45);
-            filter: brightness(1.03);
-          }
-
-          .primary-btn:active {
-            transform: translateY(0);
-            box-shadow: 0 10px 28px rgba(34, 197, 94, 0.32);
-          }
-
-          @keyframes spin {
-            to {
-              transform: rotate(360deg);
-            }
-          }
-
-          .preview-panel {
-            margin-top: 18px;
-            border-radius: 14px;
-            border: 1px solid rgba(148, 163, 184, 0.5);
-            background: radial-gradient(
-              circle at top,
-              rgba(15, 23, 42, 0.88),
-              rgba(15, 23, 42, 0.96)
-            );
-            padding: 12px;
-          }
-
-          .preview-header {
-            font-size: 12px;
-            color: var(--text-muted);
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 6px;
-          }
-
-          .preview-chip {
-            font-size: 11px;
-            border-radius: 999px;
-            padding: 2px 8px;
-            background: rgba(31, 41, 55, 0.9);
-          }
-
-          #preview {
-            display: none;
-            width: 100%;
-            max-height: 260px;
-            object-fit: contain;
-            border-radius: 10px;
-            border: 1px solid rgba(30, 64, 175, 0.4);
-            background: radial-gradient(
-              circle at top,
-              rgba(15, 23, 42, 0.9),
-              rgba(15, 23, 42, 1)
-            );
-          }
-
-          .right-panel {
-            margin-top: 22px;
-          }
-
-          @media (min-width: 992px) {
-            .right-panel {
-              margin-top: 0;
-            }
-          }
-
-          .result-card {
-            border-radius: 16px;
-            border: 1px solid rgba(148, 163, 184, 0.45);
-            background: radial-gradient(
-              circle at top,
-              rgba(15, 23, 42, 0.88),
-              rgba(15, 23, 42, 0.98)
-            );
-            padding: 18px 16px;
-            position: relative;
-            overflow: hidden;
-          }
-
-          .result-card::before {
-            content: "";
-            position: absolute;
-            width: 180px;
-            height: 180px;
-            border-radius: 999px;
-            background: radial-gradient(
-              circle,
-              rgba(74, 222, 128, 0.16),
-              transparent 60%
-            );
-            right: -40px;
-            top: -40px;
-            opacity: 0.9;
-          }
-
-          .result-title {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 8px;
-          }
-
-          .result-title-text {
-            font-size: 15px;
-            font-weight: 500;
-          }
-
-          .badge-soft {
-            font-size: 11px;
-            padding: 3px 8px;
-            border-radius: 999px;
-            background: rgba(15, 23, 42, 0.9);
-            border: 1px solid rgba(148, 163, 184, 0.5);
-            color: var(--text-muted);
-          }
-
-          #result {
-            margin-top: 6px;
-            font-size: 14px;
-          }
-
-          .result-neutral {
-            color: var(--text-muted);
-          }
-
-          .result-success {
-            color: var(--accent-strong);
-          }
-
-          .result-danger {
-            color: var(--danger);
-          }
-
-          .pill-label {
-            display: inline-flex;
-            align-items: center;
-            gap: 6px;
-            padding: 3px 10px;
-            border-radius: 999px;
-            font-size: 12px;
-          }
-
-          .pill-label.good {
-            background: rgba(22, 163, 74, 0.1);
-            color: #bbf7d0;
-            border: 1px solid rgba(34, 197, 94, 0.6);
-          }
-
-          .pill-label.bad {
-            background: rgba(248, 113, 113, 0.08);
-            color: #fecaca;
-            border: 1px solid rgba(248, 113, 113, 0.6);
-          }
-
-          .pill-dot {
-            width: 7px;
-            height: 7px;
-            border-radius: 999px;
-          }
-
-          .pill-dot.good {
-            background: #22c55e;
-            box-shadow: 0 0 0 3px rgba(34, 197, 94, 0.4);
-          }
-
-          .pill-dot.bad {
-            background: #ef4444;
-            box-shadow: 0 0 0 3px rgba(248, 113, 113, 0.4);
-          }
-
-          .footer-note {
-            font-size: 11px;
-            color: var(--text-muted);
-            margin-top: 10px;
-          }
-        </style>
-      </head>
-      <body>
-        <div class="page-wrapper mx-auto">
-          <div class="hero-card">
-            <div class="glass-tag">
-              <span class="glow-dot"></span>
-              REAL‑TIME MRI IMAGE CHECK
-            </div>
-
-            <div class="d-flex flex-column flex-md-row justify-content-between">
-              <div>
-                <h1 class="hero-title">Brain MRI Tumor Detection Demo</h1>
-                <p class="hero-subtitle mb-0">
-                  Upload a
-                  <span>clear brain MRI slice</span> (JPG/PNG) and get a quick,
-                  AI‑powered indication. This tool is for learning and
-                  experimentation only — <strong>not</strong> for medical use.
-                </p>
-              </div>
-            </div>
-
-            <div class="layout-grid">
-              <!-- LEFT: Upload + preview -->
-              <div>
-                <div class="upload-panel">
-                  <div class="upload-header">
-                    <div>
-                      <div class="upload-title">Upload MRI image</div>
-                      <div class="text-muted" style="font-size: 11px;">
-                        Please upload a single axial brain MRI slice.
-                      </div>
-                    </div>
-                    <div class="upload-pill">JPG / PNG · &lt; 5 MP · &lt; 10 MB</div>
-                  </div>
-
-                  <form id="upload-form">
-                    <label
-                      for="file"
-                      class="upload-dropzone"
-                      id="dropzone"
-                    >
-                      <div class="upload-icon-circle">
-                        <svg
-                          xmlns="http://www.w3.org/2000/svg"
-                          fill="none"
-                          viewBox="0 0 24 24"
-                          stroke="currentColor"
-                        >
-                          <path
-                            stroke-linecap="round"
-                            stroke-linejoin="round"
-                            stroke-width="1.7"
-                            d="M4 16v1a3 3 0 003 3h10a3 3 0 003-3v-1M8 12l4-4m0 0l4 4m-4-4v12"
-                          />
-                        </svg>
-                      </div>
-                      <div class="upload-main-text mb-1">
-                        Click to browse, or drag &amp; drop an MRI image
-                      </div>
-                      <div class="upload-secondary-text">
-                        Accepted: <strong>.jpg</strong>, <strong>.jpeg</strong>,
-                        <strong>.png</strong> · Recommended: square, clear brain
-                        MRI slice.
-                      </div>
-
-                      <ul class="upload-hint-list mt-2 mb-0">
-                        <li>
-                          <span class="hint-dot"></span>
-                          <span class="hint-key">Clarity:</span> in‑focus brain
-                          MRI, minimal noise.
-                        </li>
-                        <li>
-                          <span class="hint-dot"></span>
-                          <span class="hint-key">Size:</span> up to ~5 megapixels
-                          (e.g. 2200×2200).
-                        </li>
-                        <li>
-                          <span class="hint-dot"></span>
-                          <span class="hint-key">Content:</span> single axial
-                          slice, no text overlays or screenshots.
-                        </li>
-                      </ul>
-                    </label>
-
-                    <input
-                      class="hidden-input"
-                      type="file"
-                      id="file"
-                      name="file"
-                      accept="image/*"
-                      required
-                    />
-
-                    <button type="submit" class="primary-btn mt-2" id="submit-btn">
-                      <span class="loader"></span>
-                      <span class="btn-label">Run prediction</span>
-                    </button>
-                  </form>
-
-                  <div class="preview-panel mt-3">
-                    <div class="preview-header">
-                      <span>Image preview</span>
-                      <span class="preview-chip" id="preview-meta">No file selected</span>
-                    </div>
-                    <img id="preview" alt="MRI preview" />
-                  </div>
-
-                  <div class="footer-note">
-                    This demo does <strong>not</strong> store your images. All
-                    processing happens in memory for the current session only.
-                  </div>
-                </div>
-              </div>
-
-              <!-- RIGHT: Result -->
-              <div class="right-panel">
-                <div class="result-card">
-                  <div class="result-title">
-                    <div class="result-title-text">Model output</div>
-                    <span class="badge-soft" id="status-pill">Waiting for image…</span>
-                  </div>
-                  <div id="result" class="result-neutral">
-                    Upload a suitable MRI image to see the predicted label and confidence.
-                  </div>
-                </div>
-              </div>
-            </div>
-          </div>
-        </div>
-
-        <!-- Bootstrap JS (optional) -->
-        <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js"></script>
-
-        <script>
-          const fileInput = document.getElementById('file');
-          const dropzone = document.getElementById('dropzone');
-          const previewImg = document.getElementById('preview');
-          const previewMeta = document.getElementById('preview-meta');
-          const form = document.getElementById('upload-form');
-          const resultDiv = document.getElementById('result');
-          const statusPill = document.getElementById('status-pill');
-          const submitBtn = document.getElementById('submit-btn');
-
-          function setButtonLoading(isLoading) {
-            if (isLoading) {
-              submitBtn.classList.add('loading');
-              submitBtn.disabled = true;
-            } else {
-              submitBtn.classList.remove('loading');
-              submitBtn.disabled = false;
-            }
-          }
-
-          // Update preview when a file is selected
-          fileInput.addEventListener('change', (event) => {
-            const file = event.target.files[0];
-            if (!file) {
-              previewImg.style.display = 'none';
-              previewMeta.textContent = 'No file selected';
-              return;
-            }
-
-            const reader = new FileReader();
-            reader.onload = (e) => {
-              previewImg.src = e.target.result;
-              previewImg.style.display = 'block';
-            };
-            reader.readAsDataURL(file);
-
-            const sizeMB = (file.size / (1024 * 1024)).toFixed(2);
-            previewMeta.textContent = `${file.name} · ${sizeMB} MB`;
-          });
-
-          // Drag & drop behavior
-          ;['dragenter', 'dragover'].forEach(evtName => {
-            dropzone.addEventListener(evtName, (e) => {
-              e.preventDefault();
-              e.stopPropagation();
-              dropzone.classList.add('hover');
-            });
-          });
-
-          ;['dragleave', 'dragend', 'drop'].forEach(evtName => {
-            dropzone.addEventListener(evtName, (e) => {
-              e.preventDefault();
-              e.stopPropagation();
-              if (evtName !== 'drop') {
-                dropzone.classList.remove('hover');
-              }
-            });
-          });
-
-          dropzone.addEventListener('drop', (e) => {
-            dropzone.classList.remove('hover');
-            const dt = e.dataTransfer;
-            const files = dt.files;
-            if (files && files[0]) {
-              fileInput.files = files;
-              fileInput.dispatchEvent(new Event('change'));
-            }
-          });
-
-          // Handle form submit via JavaScript fetch
-          form.addEventListener('submit', async (event) => {
-            event.preventDefault();
-            const file = fileInput.files[0];
-            if (!file) {
-              alert('Please select an image first.');
-              return;
-            }
-
-            const formData = new FormData();
-            formData.append('file', file);
-
-            setButtonLoading(true);
-            resultDiv.className = 'result-neutral';
-            resultDiv.innerHTML = '<span class="text-muted">Running prediction…</span>';
-            statusPill.textContent = 'Processing…';
-
-            try {
-              const response = await fetch('/predict', {
-                method: 'POST',
-                body: formData,
-              });
-
-              if (!response.ok) {
-                let message = 'Unexpected error';
-                try {
-                  const data = await response.json();
-                  if (data && data.error) {
-                    message = data.error;
-                  }
-                } catch (_) {
-                  const text = await response.text();
-                  message = text || message;
-                }
-                resultDiv.className = 'result-danger';
-                resultDiv.textContent = message;
-                statusPill.textContent = 'Upload issue';
-                return;
-              }
-
-              const data = await response.json();
-              const probPercent = (data.probability * 100).toFixed(1);
-
-              const isTumor = data.label_name === 'tumor';
-              const pillClass = isTumor ? 'pill-label bad' : 'pill-label good';
-              const dotClass = isTumor ? 'pill-dot bad' : 'pill-dot good';
-              const labelText = isTumor ? 'Tumor detected' : 'No tumor detected';
-
-              resultDiv.className = isTumor ? 'result-danger' : 'result-success';
-              statusPill.textContent = 'Result ready';
-
-              resultDiv.innerHTML = `
-                <div class="${pillClass}">
-                  <span class="${dotClass} pill-dot"></span>
-                  <span>${labelText}</span>
-                </div>
-                <div class="mt-2">
-                  <div><strong>Confidence:</strong> ${probPercent}%</div>
-                  <div><strong>File:</strong> ${data.filename}</div>
-                </div>
-              `;
-            } catch (err) {
-              console.error(err);
-              resultDiv.className = 'result-danger';
-              resultDiv.textContent = 'Unexpected error. Please try again.';
-              statusPill.textContent = 'Error';
-            } finally {
-              setButtonLoading(false);
-            }
-          });
-        </script>
-      </body>
-    </html>
+def index(request: Request):
+    return static_assets["index.html"].response(request)
+
+
+@app.get("/static/{name:path}", include_in_schema=False)
+def static_file(name: str, request: Request):
+    asset = static_assets.get(name)
+    if asset is None:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    return asset.response(request)
+
+
+def _declared_size(
+    width: Optional[str], height: Optional[str]
+) -> Optional[Tuple[int, int]]:
+    """
+    The original (width, height) a client declares, with the
+    X-Original-Width / X-Original-Height headers, for an image it
+    downscaled to the model's resolution before upload (the web UI's
+    "Shrink before upload" option). None when the headers are absent.
     """
+    if width is None and height is None:
+        return None
+    try:
+        size = (int(width), int(height))
+    except (TypeError, ValueError):
+        size = (0, 0)
+    if min(size) < 1:
+        raise InvalidImageError(
+            "X-Original-Width and X-Original-Height must both be positive integers.",
+            "bad_declared_size",
+        )
+    return size
 
 
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(
+    file: UploadFile = File(...),
+    backend: Optional[str] = None,
+    x_original_width: Optional[str] = Header(None),
+    x_original_height: Optional[str] = Header(None),
+):
+    """
+    Classify one slice; `?backend=name` picks a configured backend.
+    Uploads downscaled by the client declare their original size in the
+    X-Original-Width / X-Original-Height headers.
+    """
+    started = time.perf_counter()
+    in_flight["requests"] += 1
     try:
-        contents = await file.read()
+        response = await _predict_one(
+            file, backend, (x_original_width, x_original_height)
+        )
+    finally:
+        in_flight["requests"] -= 1
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        endpoint="/predict",
+        status=str(response.status_code),
+    )
+    if profiler.active:
+        profiler.request_finished()
+    return response
+
+
+async def _predict_one(
+    file: UploadFile, backend: Optional[str], declared: Tuple[Optional[str], ...]
+) -> JSONResponse:
+    try:
+        try:
+            chosen = router.select(backend)
+            original_size = _declared_size(*declared)
+        except (UnknownBackendError, InvalidImageError) as e:
+            status, message = _describe_error(e)
+            return JSONResponse({"error": message}, status_code=status)
+
+        # Reject very large files (e.g. screenshots / photos > 10 MB)
+        try:
+            with STAGE_SECONDS.time(stage="upload_read"):
+                contents = await read_upload(file, MAX_UPLOAD_BYTES)
+        except UploadTooLargeError as e:
+            status, message = _describe_error(e)
+            return too_large_response(message)
 
-        # Reject very large files up front (e.g. screenshots / photos > 10 MB)
-        max_bytes = 10 * 1024 * 1024  # 10 MB
-        if len(contents) > max_bytes:
+        try:
+            result = await _classify(
+                contents, backend=chosen, original_size=original_size
+            )
+        except QueueFullError as e:
+            status, message = _describe_error(e)
             return JSONResponse(
-                {
-                    "error": "File is too large. Please upload a brain MRI image under 10 MB."
-                },
-                status_code=400,
+                {"error": message},
+                status_code=status,
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
             )
+        except (InvalidImageError, NotBrainMRIError, ModelUnavailableError) as e:
+            status, message = _describe_error(e)
+            return JSONResponse({"error": message}, status_code=status)
 
-        try:
-            image = Image.open(io.BytesIO(contents)).convert("RGB")
-        except Exception:
+        with STAGE_SECONDS.time(stage="serialize"):
             return JSONResponse(
                 {
-                    "error": "Invalid image file. Please upload a JPG or PNG brain MRI image."
-                },
-                status_code=400,
+                    "filename": file.filename,
+                    "label": result["label"],
+                    "label_name": result["label_name"],
+                    "probability": result["probability"],
+                    "backend": result["backend"],
+                }
             )
+    except Exception as e:
+        status, message = _describe_error(e)
+        return JSONResponse({"error": message}, status_code=status)
+
 
+@app.post("/predict/array")
+async def predict_array(request: Request, backend: Optional[str] = None):
+    """
+    Classify one slice sent as uint8 pixels instead of an image file: an
+    .npy file (Content-Type: application/x-npy), or raw bytes with an
+    X-Array-Shape header ("H,W" or "H,W,3"). `?backend=name` as for /predict.
+    """
+    started = time.perf_counter()
+    in_flight["requests"] += 1
+    try:
+        response = await _predict_array(request, backend)
+    finally:
+        in_flight["requests"] -= 1
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        endpoint="/predict/array",
+        status=str(response.status_code),
+    )
+    if profiler.active:
+        profiler.request_finished()
+    return response
+
+
+async def _predict_array(request: Request, backend: Optional[str]) -> JSONResponse:
+    try:
         try:
-            result = classifier.predict_image_from_pil(image)
-        except InvalidImageError:
+            chosen = router.select(backend)
+            with STAGE_SECONDS.time(stage="upload_read"):
+                contents = await read_body(request, MAX_UPLOAD_BYTES)
+            # Only headers are parsed here; the pixels stay in `contents`
+            shape = request.headers.get("x-array-shape")
+            if shape is not None:
+                pixels = wrap_raw(contents, parse_shape(shape))
+            else:
+                pixels = parse_npy(contents)
+            result = await _classify(contents, backend=chosen, pixels=pixels)
+        except UploadTooLargeError as e:
+            status, message = _describe_error(e)
+            return too_large_response(message)
+        except QueueFullError as e:
+            status, message = _describe_error(e)
             return JSONResponse(
-                {
-                    "error": "Invalid image file. Please upload a clear JPG or PNG image."
-                },
-                status_code=400,
+                {"error": message},
+                status_code=status,
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
             )
-        except NotBrainMRIError as e:
-            # Include the specific reason from the classifier
+        except (
+            UnknownBackendError,
+            InvalidImageError,
+            NotBrainMRIError,
+            ModelUnavailableError,
+        ) as e:
+            status, message = _describe_error(e)
+            return JSONResponse({"error": message}, status_code=status)
+
+        with STAGE_SECONDS.time(stage="serialize"):
             return JSONResponse(
-                {"error": str(e)},
-                status_code=400,
+                {
+                    "shape": list(pixels.shape),
+                    "label": result["label"],
+                    "label_name": result["label_name"],
+                    "probability": result["probability"],
+                    "backend": result["backend"],
+                }
             )
-
+    except Exception as e:
+        status, message = _describe_error(e)
+        return JSONResponse({"error": message}, status_code=status)
+
+
+@app.post("/predict/study")
+async def predict_study(
+    file: UploadFile = File(...),
+    backend: Optional[str] = None,
+    axis: Optional[int] = None,
+    stride: int = 1,
+    early_exit: bool = True,
+):
+    """
+    Classify a whole 3D study (.npy, .nii or .nii.gz volume; see
+    src/study.py). The upload is spooled to disk and memory-mapped, and
+    only every `stride`-th slice is read. With `early_exit` (default),
+    scoring stops once enough slices are confidently tumor.
+    """
+    started = time.perf_counter()
+    in_flight["requests"] += 1
+    try:
+        response = await _predict_study(file, backend, axis, stride, early_exit)
+    finally:
+        in_flight["requests"] -= 1
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        endpoint="/predict/study",
+        status=str(response.status_code),
+    )
+    if profiler.active:
+        profiler.request_finished()
+    return response
+
+
+def _spool_volume(upload: UploadFile) -> str:
+    """Copy an uploaded volume to a named temporary file, for mmap."""
+    suffix = volume_suffix(upload.filename or "") or ".npy"
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+        upload.file.seek(0)
+        shutil.copyfileobj(upload.file, f, length=1024 * 1024)
+        return f.name
+
+
+def _score_volume(
+    backend: InferenceBackend, path: str, axis: Optional[int], stride: int, early_exit: bool
+) -> dict:
+    """Blocking: open the spooled volume lazily and score it."""
+    return score_study(
+        backend.classifier,
+        open_volume(path),
+        axis=default_axis(path) if axis is None else axis,
+        stride=stride,
+        batch_size=backend.preferred_batch_size,
+        early_exit=early_exit,
+    )
+
+
+async def _predict_study(
+    file: UploadFile,
+    backend: Optional[str],
+    axis: Optional[int],
+    stride: int,
+    early_exit: bool,
+) -> JSONResponse:
+    path = None
+    try:
+        chosen = router.select(backend)
+        path = await asyncio.to_thread(_spool_volume, file)
+        result = await executor.run(
+            _score_volume, chosen, path, axis, stride, early_exit
+        )
+    except QueueFullError as e:
+        status, message = _describe_error(e)
         return JSONResponse(
-            {
-                "filename": file.filename,
-                "label": result["label"],
-                "label_name": result["label_name"],
-                "probability": result["probability"],
-            }
+            {"error": message},
+            status_code=status,
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
         )
     except Exception as e:
-        return JSONResponse(
-            {"error": f"Unexpected server error: {str(e)}"},
-            status_code=500,
-        )
\ No newline at end of file
+        status, message = _describe_error(e)
+        return JSONResponse({"error": message}, status_code=status)
+    finally:
+        if path is not None:
+            os.unlink(path)
+
+    return JSONResponse(
+        {"filename": file.filename, **result, "backend": chosen.name}
+    )
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    files: List[UploadFile] = File(...), backend: Optional[str] = None
+):
+    """
+    Queue images for background scoring and return at once with a job id:
+    several `files` parts or a single ZIP archive, as for /predict/batch.
+    Poll (or long-poll with `?wait=seconds`) GET /jobs/{id} for results.
+    """
+    try:
+        chosen = router.select(backend)
+    except UnknownBackendError as e:
+        status, message = _describe_error(e)
+        return JSONResponse({"error": message}, status_code=status)
+
+    try:
+        sources = await asyncio.to_thread(_job_sources, files)
+    except zipfile.BadZipFile:
+        return JSONResponse({"error": "Invalid ZIP archive."}, status_code=400)
+    except UploadTooLargeError as e:
+        status, message = _describe_error(e)
+        return too_large_response(message)
+    if not sources or len(sources) > BATCH_MAX_FILES:
+        if not sources:
+            message = "No images found in the upload."
+        else:
+            message = f"Too many images. Please send at most {BATCH_MAX_FILES} per job."
+        return JSONResponse({"error": message}, status_code=400)
+
+    job_id = await asyncio.to_thread(
+        job_store.create, chosen.name, _read_job_items(sources), len(sources)
+    )
+    return JSONResponse(
+        {"id": job_id, "status": "queued", "total": len(sources), "url": f"/jobs/{job_id}"},
+        status_code=202,
+        headers={"Location": f"/jobs/{job_id}"},
+    )
+
+
+def _job_sources(files: List[UploadFile]) -> List[tuple]:
+    """
+    Blocking: (filename, loader, *args) per image of a /jobs upload. Raises
+    UploadTooLargeError, before anything is decompressed, when the images
+    add up to more than JOB_MAX_BYTES or a ZIP expands suspiciously much.
+    """
+    too_large = UploadTooLargeError(
+        "The images add up to too much data. Please send at most "
+        f"{JOB_MAX_BYTES // (1024 * 1024)} MB per job."
+    )
+    if len(files) == 1 and _is_zip_upload(files[0]):
+        members = _zip_members(files[0].file)
+        expanded = sum(info.file_size for _, _, info in members)
+        compressed = sum(info.compress_size for _, _, info in members)
+        if expanded > JOB_MAX_BYTES or expanded > ZIP_MAX_RATIO * max(compressed, 1):
+            raise too_large
+        return [(name, _read_zip_member, archive, info) for name, archive, info in members]
+
+    if sum(upload.file.seek(0, io.SEEK_END) for upload in files) > JOB_MAX_BYTES:
+        raise too_large
+    return [(upload.filename, read_file, upload.file, MAX_UPLOAD_BYTES) for upload in files]
+
+
+def _read_job_items(sources: List[tuple]) -> Iterator[tuple]:
+    """Blocking generator: (filename, bytes or None, error line or None) per image."""
+    for index, (filename, load, *args) in enumerate(sources):
+        try:
+            yield filename, load(*args), None
+        except UploadTooLargeError as e:
+            status, message = _describe_error(e)
+            error = {"index": index, "filename": filename, "status": status, "error": message}
+            yield filename, None, error
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """
+    A job's progress, with one result line per image (in upload order)
+    once `status` is "done". With `?wait=seconds` (at most JOB_MAX_WAIT_S)
+    the response is held until the job finishes or the time is up.
+    """
+    deadline = time.monotonic() + min(max(wait, 0.0), JOB_MAX_WAIT_S)
+    while True:
+        job = await asyncio.to_thread(job_store.get, job_id)
+        if job is None:
+            return JSONResponse({"error": "Job not found."}, status_code=404)
+        if job["status"] == "done" or time.monotonic() >= deadline:
+            return job
+        await asyncio.sleep(0.1)
+
+
+def _zip_members(fileobj) -> List[Tuple[str, zipfile.ZipFile, zipfile.ZipInfo]]:
+    """List the image entries of a ZIP archive (skipping folders and junk)."""
+    archive = zipfile.ZipFile(fileobj)
+    members = []
+    for info in archive.infolist():
+        name = info.filename
+        base = os.path.basename(name)
+        if info.is_dir() or name.startswith("__MACOSX/") or base.startswith("."):
+            continue
+        if not base.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        members.append((name, archive, info))
+    return members
+
+
+def _read_zip_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> bytes:
+    # The declared size is checked first; ZipExtFile never inflates past it
+    if info.file_size > MAX_UPLOAD_BYTES:
+        raise UploadTooLargeError()
+    return archive.read(info)
+
+
+def _is_zip_upload(upload: UploadFile) -> bool:
+    return upload.content_type in (
+        "application/zip",
+        "application/x-zip-compressed",
+    ) or (upload.filename or "").lower().endswith(".zip")
+
+
+@app.post("/predict/batch")
+async def predict_batch(
+    files: List[UploadFile] = File(...), backend: Optional[str] = None
+):
+    """
+    Classify many slices in one request: either a multipart list of images
+    or a single ZIP archive of them. `?backend=name` picks a backend.
+
+    Results are streamed back as NDJSON, one line per image, in completion
+    order. Each line carries the image's `index` and `filename`, plus either
+    the prediction or an `error` with its HTTP-equivalent `status`.
+    """
+    started = time.perf_counter()
+    in_flight["requests"] += 1
+
+    def finished(status: int) -> None:
+        in_flight["requests"] -= 1
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            endpoint="/predict/batch",
+            status=str(status),
+        )
+        if profiler.active:
+            profiler.request_finished()
+
+    try:
+        response = await _predict_many(files, backend, finished)
+    except BaseException:
+        finished(500)
+        raise
+    if not isinstance(response, StreamingResponse):
+        finished(response.status_code)
+    return response
+
+
+class _CleanupStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse that calls `cleanup` once it has been sent or
+    abandoned. A client that disconnects before the first chunk cancels the
+    response before the body generator starts, so the generator's own
+    `finally` is not a place that always runs.
+    """
+
+    def __init__(self, content, cleanup, **kwargs) -> None:
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                # Stops the work of a generator left suspended at a yield
+                await self.body_iterator.aclose()
+            finally:
+                self.cleanup()
+
+
+async def _predict_many(files: List[UploadFile], backend: Optional[str], finished):
+    """Body of /predict/batch; the stream calls `finished(200)` when done."""
+    try:
+        chosen = router.select(backend)
+    except UnknownBackendError as e:
+        status, message = _describe_error(e)
+        return JSONResponse({"error": message}, status_code=status)
+
+    # The response outlives this function, so keep the uploads open
+    owned = [detach_upload(upload) for upload in files]
+
+    def close_owned():
+        for fileobj in owned:
+            fileobj.close()
+
+    items = []  # (filename, blocking loader returning bytes, *args)
+    try:
+        if len(files) == 1 and _is_zip_upload(files[0]):
+            try:
+                members = _zip_members(owned[0])
+            except zipfile.BadZipFile:
+                close_owned()
+                return JSONResponse({"error": "Invalid ZIP archive."}, status_code=400)
+            for name, archive, info in members:
+                items.append((name, _read_zip_member, archive, info))
+        else:
+            for upload, fileobj in zip(files, owned):
+                items.append((upload.filename, read_file, fileobj, MAX_UPLOAD_BYTES))
+    except Exception as e:
+        close_owned()
+        status, message = _describe_error(e)
+        return JSONResponse({"error": message}, status_code=status)
+
+    if not items or len(items) > BATCH_MAX_FILES:
+        close_owned()
+        if not items:
+            message = "No images found in the upload."
+        else:
+            message = f"Too many images. Please send at most {BATCH_MAX_FILES} per batch."
+        return JSONResponse({"error": message}, status_code=400)
+
+    # Decode at most as many images at once as the pool has threads; the
+    # decoded images then meet in the micro-batcher as model-sized batches.
+    decode_slots = asyncio.Semaphore(executor.max_workers)
+
+    async def run_item(index: int, filename: str, load, *args) -> dict:
+        line = {"index": index, "filename": filename}
+        try:
+            contents = await _run_when_free(decode_slots, load, *args)
+            line.update(await _classify(contents, decode_slots, chosen))
+        except Exception as e:
+            status, message = _describe_error(e)
+            line.update({"status": status, "error": message})
+        return line
+
+    async def lines():
+        tasks = [
+            asyncio.ensure_future(run_item(index, *item))
+            for index, item in enumerate(items)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def cleanup() -> None:
+        close_owned()
+        finished(200)
+
+    return _CleanupStreamingResponse(
+        lines(), cleanup, media_type="application/x-ndjson"
+    )
@@ -0,0 +1,84 @@
+"""
+Raw pixel uploads for /predict/array.
+
+A request body is either an .npy file (Content-Type application/x-npy) or
+bare uint8 pixels with an X-Array-Shape header ("H,W" or "H,W,C"). Either
+way the pixels are wrapped with np.frombuffer as a view of the received
+buffer: nothing is encoded, decoded or copied before the resize.
+"""
+
+import ast
+from typing import Tuple, Union
+
+import numpy as np
+
+from .inference import InvalidImageError
+
+NPY_MAGIC = b"\x93NUMPY"
+
+# Generous bound on the .npy header (it is ~128 bytes for plain arrays)
+NPY_MAX_HEADER_BYTES = 64 * 1024
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def _bad_array(message: str) -> InvalidImageError:
+    return InvalidImageError(message, "bad_array")
+
+
+def parse_shape(header: str) -> Tuple[int, ...]:
+    """Parse an X-Array-Shape header such as "512,512" or "512,512,3"."""
+    try:
+        shape = tuple(int(part) for part in header.split(","))
+    except ValueError:
+        raise _bad_array("X-Array-Shape must look like 512,512 or 512,512,3.")
+    if len(shape) not in (2, 3) or min(shape) < 1:
+        raise _bad_array("X-Array-Shape must look like 512,512 or 512,512,3.")
+    return shape
+
+
+def wrap_raw(
+    buffer: Buffer,
+    shape: Tuple[int, ...],
+    offset: int = 0,
+    fortran_order: bool = False,
+) -> np.ndarray:
+    """View `buffer` (from `offset`) as a uint8 array of `shape`, without copying."""
+    count = int(np.prod(shape))
+    if len(buffer) - offset != count:
+        raise _bad_array(
+            f"Array data is {len(buffer) - offset} bytes, expected {count} for shape {shape}."
+        )
+    flat = np.frombuffer(buffer, dtype=np.uint8, count=count, offset=offset)
+    return flat.reshape(shape, order="F" if fortran_order else "C")
+
+
+def parse_npy(buffer: Buffer) -> np.ndarray:
+    """View the uint8 array stored in an .npy file's bytes, without copying."""
+    view = memoryview(buffer)
+    if bytes(view[:6]) != NPY_MAGIC or len(view) < 10:
+        raise _bad_array("Not an .npy file.")
+    major = view[6]
+    if major == 1:
+        header_len = int.from_bytes(view[8:10], "little")
+        start = 10
+    elif major in (2, 3):
+        header_len = int.from_bytes(view[8:12], "little")
+        start = 12
+    else:
+        raise _bad_array(f"Unsupported .npy format version {major}.")
+    if header_len > NPY_MAX_HEADER_BYTES or start + header_len > len(view):
+        raise _bad_array("Invalid .npy header.")
+
+    try:
+        header = ast.literal_eval(bytes(view[start : start + header_len]).decode("latin1"))
+        dtype = np.dtype(header["descr"])
+        shape = tuple(header["shape"])
+        fortran_order = bool(header["fortran_order"])
+    except Exception:
+        raise _bad_array("Invalid .npy header.")
+    if dtype != np.uint8:
+        raise _bad_array(f"Arrays must be uint8, got {dtype}.")
+    if len(shape) not in (2, 3):
+        raise _bad_array(f"Arrays must be HxW or HxWxC, got shape {shape}.")
+    return wrap_raw(buffer, shape, start + header_len, fortran_order)
@@ -0,0 +1,108 @@
+import gzip
+import hashlib
+import mimetypes
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+STATIC_DIR = Path(__file__).resolve().parent / "static"
+
+# Versioned vendor files never change under the same URL
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+# Pages keep their URL across deploys: cache for a while, then revalidate
+# cheaply against the ETag
+PAGE_CACHE = "public, max-age=3600"
+
+# Not worth compressing below this size
+MIN_COMPRESS_BYTES = 1024
+
+
+class StaticAsset:
+    """
+    A file held in memory with precomputed gzip / brotli variants and a
+    strong ETag per variant, served with 304 handling.
+    """
+
+    def __init__(self, body: bytes, media_type: str, cache_control: str) -> None:
+        self.media_type = media_type
+        self.cache_control = cache_control
+
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        # encoding -> (ETag, body); identity first, best compression last
+        self.variants: Dict[str, Tuple[str, bytes]] = {
+            "identity": (f'"{digest}"', body)
+        }
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.variants["gzip"] = (
+                f'"{digest}-gz"',
+                gzip.compress(body, compresslevel=9, mtime=0),
+            )
+            if brotli is not None:
+                self.variants["br"] = (f'"{digest}-br"', brotli.compress(body))
+
+    @classmethod
+    def from_file(cls, path: Path, cache_control: str) -> "StaticAsset":
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if media_type.startswith("text/"):
+            media_type += "; charset=utf-8"
+        return cls(path.read_bytes(), media_type, cache_control)
+
+    def _choose_encoding(self, accept_encoding: str) -> str:
+        accepted = set()
+        for part in accept_encoding.split(","):
+            name, _, params = part.strip().partition(";")
+            if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+                continue
+            accepted.add(name.strip().lower())
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and (encoding in accepted or "*" in accepted):
+                return encoding
+        return "identity"
+
+    @staticmethod
+    def _matches(etag: str, if_none_match: Optional[str]) -> bool:
+        # Only the variant being served counts: a cached gzip body is no
+        # use to a client that now asks for br
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in tags
+
+    def response(self, request: Request) -> Response:
+        encoding = self._choose_encoding(request.headers.get("accept-encoding", ""))
+        etag, body = self.variants[encoding]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+
+        if self._matches(etag, request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type=self.media_type, headers=headers)
+
+
+def load_static_assets(root: Path = STATIC_DIR) -> Dict[str, StaticAsset]:
+    """
+    Read every file under `root` once, keyed by its path relative to it.
+    Files in vendor/ carry their version in the name and are immutable.
+    """
+    assets = {}
+    for path in sorted(p for p in root.rglob("*") if p.is_file()):
+        name = path.relative_to(root).as_posix()
+        cache = IMMUTABLE_CACHE if name.startswith("vendor/") else PAGE_CACHE
+        assets[name] = StaticAsset.from_file(path, cache)
+    return assets
@@ -0,0 +1,442 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from .inference import (
+    BrainTumorClassifier,
+    infer_arch,
+    infer_backend,
+    tumor_probability,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownBackendError(ValueError):
+    """Raised when a request names a backend that is not configured."""
+
+
+class InferenceBackend:
+    """
+    One way of executing the classifier: an engine plus the batch size and
+    thread count it runs best with.
+
+    Decoding and validation are shared by every backend (they come from
+    BrainTumorClassifier); backends differ only in how the forward pass
+    runs. Subclasses declare their defaults as class attributes.
+
+    `num_threads` is honoured by engines with their own thread pool (ONNX
+    Runtime). Torch engines share the process-wide intra-op pool sized by
+    src/serving.py, so for them None is the only meaningful value.
+    """
+
+    engine = "eager"
+    arch: Optional[str] = None  # None: inferred from the file name
+    preferred_batch_size = 8
+    num_threads: Optional[int] = None
+
+    def __init__(
+        self,
+        model_path: str,
+        name: Optional[str] = None,
+        preferred_batch_size: Optional[int] = None,
+        num_threads: Optional[int] = None,
+    ) -> None:
+        self.name = name or self.engine
+        if preferred_batch_size is not None:
+            self.preferred_batch_size = preferred_batch_size
+        if num_threads is not None:
+            self.num_threads = num_threads
+        self.classifier = BrainTumorClassifier(
+            model_path=model_path,
+            arch=self.arch,
+            backend=self.engine,
+            num_threads=self.num_threads,
+        )
+
+    @property
+    def model_path(self) -> Optional[str]:
+        return self.classifier.model_path
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.classifier.is_loaded
+
+    def load(self):
+        return self.classifier.load()
+
+    def warmup(self, batch_sizes: Sequence[int] = (1,)) -> None:
+        self.classifier.warmup(batch_sizes)
+
+    def decode_and_validate(
+        self, image_bytes: bytes, original_size: Optional[Tuple[int, int]] = None
+    ) -> Image.Image:
+        return self.classifier.decode_and_validate(image_bytes, original_size)
+
+    def validate_array(self, pixels: np.ndarray) -> np.ndarray:
+        return self.classifier.validate_array(pixels)
+
+    def predict_batch(self, images: List[Image.Image]) -> List[dict]:
+        return self.classifier.predict_batch(images)
+
+    def describe(self) -> dict:
+        return {
+            "engine": self.engine,
+            "arch": self.classifier.arch,
+            "model_path": self.model_path,
+            "preferred_batch_size": self.preferred_batch_size,
+            "num_threads": self.num_threads,
+            "loaded": self.is_loaded,
+        }
+
+
+class EagerBackend(InferenceBackend):
+    """PyTorch checkpoint (.pth) run in eager mode; weights are mmap-shared."""
+
+    engine = "eager"
+
+
+class TorchScriptBackend(InferenceBackend):
+    """Frozen TorchScript artifact (.ts) from src/export.py, fp32 or int8."""
+
+    engine = "torchscript"
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime session for an exported .onnx artifact."""
+
+    engine = "onnx"
+
+
+class SimpleCNNBackend(InferenceBackend):
+    """
+    The baseline SimpleCNN checkpoint: less accurate, but a fraction of
+    ResNet18's cost, so it takes larger batches. Used as the latency
+    fallback.
+    """
+
+    engine = "eager"
+    arch = "simple_cnn"
+    preferred_batch_size = 32
+
+
+class CascadeInput(NamedTuple):
+    """A validated upload for CascadeBackend: the cheap model's prepared
+    input, and the source (image or pixels) to prepare again if escalated."""
+
+    cheap: np.ndarray
+    source: Union[Image.Image, np.ndarray]
+
+
+class CascadeBackend(InferenceBackend):
+    """
+    Two backends in a cascade: `cheap` (SimpleCNN) scores every image and
+    answers when its tumor probability is at most `low` or at least
+    `high`; the images in between are escalated to `accurate` (ResNet18)
+    in one forward pass. The thresholds come from src/cascade.py, which
+    calibrates them on the validation split.
+
+    Uploads are decoded once, at the larger of the two decode sizes, and
+    validated once; the accurate model's resize only runs for escalated
+    images.
+    """
+
+    engine = "cascade"
+
+    def __init__(
+        self,
+        cheap: InferenceBackend,
+        accurate: InferenceBackend,
+        low: float,
+        high: float,
+        name: str = "cascade",
+    ) -> None:
+        if not 0.0 <= low <= 0.5 <= high <= 1.0:
+            raise ValueError(
+                f"Cascade thresholds need 0 <= low <= 0.5 <= high <= 1, got {low}, {high}"
+            )
+        self.name = name
+        self.cheap = cheap
+        self.accurate = accurate
+        self.low = low
+        self.high = high
+        # Batches are sized for the cheap stage; only a fraction of each
+        # one reaches the accurate model
+        self.preferred_batch_size = cheap.preferred_batch_size
+        # Decoding and validation rules are shared, so the accurate
+        # model's classifier stands in for the cascade (e.g. for studies)
+        self.classifier = accurate.classifier
+
+        self._lock = threading.Lock()
+        self.images_total = 0
+        self.escalated_total = 0
+
+    @property
+    def model_path(self) -> Optional[str]:
+        return f"{self.cheap.model_path}>{self.accurate.model_path}@{self.low},{self.high}"
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.cheap.is_loaded and self.accurate.is_loaded
+
+    def load(self):
+        self.cheap.load()
+        return self.accurate.load()
+
+    def warmup(self, batch_sizes: Sequence[int] = (1,)) -> None:
+        self.cheap.warmup(batch_sizes)
+        self.accurate.warmup(batch_sizes)
+
+    def decode_and_validate(
+        self, image_bytes: bytes, original_size: Optional[Tuple[int, int]] = None
+    ) -> CascadeInput:
+        image = self.accurate.classifier.decode_validated(image_bytes, original_size)
+        cheap = self.cheap.classifier
+        model_input, thumb = cheap.preprocessor.prepare(image)
+        cheap._validate_colors(thumb)
+        return CascadeInput(model_input, image)
+
+    def validate_array(self, pixels: np.ndarray) -> CascadeInput:
+        model_input = self.cheap.validate_array(pixels)
+        if pixels.ndim == 3 and pixels.shape[2] == 1:
+            pixels = pixels[:, :, 0]
+        return CascadeInput(model_input, pixels)
+
+    def _accurate_input(self, source: Union[Image.Image, np.ndarray]) -> np.ndarray:
+        preprocessor = self.accurate.classifier.preprocessor
+        if isinstance(source, Image.Image):
+            return preprocessor.crop(preprocessor.frame(source.convert("RGB")))
+        return preprocessor.prepare_array(source)[0]
+
+    def predict_batch(self, images: List) -> List[dict]:
+        """Cheap pass over all inputs (CascadeInput or PIL images), then one
+        accurate pass over the uncertain ones. Results say `escalated`."""
+        items = [
+            CascadeInput(item, item) if isinstance(item, Image.Image) else item
+            for item in images
+        ]
+        results = [
+            {**result, "escalated": False}
+            for result in self.cheap.predict_batch([item.cheap for item in items])
+        ]
+        uncertain = [
+            i
+            for i, result in enumerate(results)
+            if self.low < tumor_probability(result) < self.high
+        ]
+        if uncertain:
+            accurate = self.accurate.predict_batch(
+                [self._accurate_input(items[i].source) for i in uncertain]
+            )
+            for i, result in zip(uncertain, accurate):
+                results[i] = {**result, "escalated": True}
+        with self._lock:
+            self.images_total += len(results)
+            self.escalated_total += len(uncertain)
+        return results
+
+    def describe(self) -> dict:
+        return {
+            "engine": self.engine,
+            "cheap": self.cheap.name,
+            "accurate": self.accurate.name,
+            "thresholds": {"low": self.low, "high": self.high},
+            "preferred_batch_size": self.preferred_batch_size,
+            "loaded": self.is_loaded,
+            "images_total": self.images_total,
+            "escalated_total": self.escalated_total,
+            "escalation_rate": (
+                self.escalated_total / self.images_total if self.images_total else None
+            ),
+        }
+
+
+BACKEND_CLASSES = {
+    "eager": EagerBackend,
+    "torchscript": TorchScriptBackend,
+    "onnx": OnnxBackend,
+    "simple_cnn": SimpleCNNBackend,
+}
+
+
+def make_backend(
+    model_path: str, kind: Optional[str] = None, name: Optional[str] = None
+) -> InferenceBackend:
+    """
+    Backend for a model file. `kind` is one of BACKEND_CLASSES; by default
+    it follows the extension, and eager SimpleCNN checkpoints get the
+    SimpleCNN backend.
+    """
+    if kind is None:
+        kind = infer_backend(model_path)
+        if kind == "eager" and infer_arch(model_path) == "simple_cnn":
+            kind = "simple_cnn"
+    if kind not in BACKEND_CLASSES:
+        raise ValueError(
+            f"Unknown inference backend: {kind!r} (choose from {', '.join(BACKEND_CLASSES)})"
+        )
+    return BACKEND_CLASSES[kind](model_path, name=name or kind)
+
+
+def parse_backend_specs(spec: str) -> List[Tuple[str, str]]:
+    """'onnx=models/a.onnx, int8=models/b.ts' -> [(name, path), ...]"""
+    specs = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, sep, path = part.partition("=")
+        if not sep or not name.strip() or not path.strip():
+            raise ValueError(f"Expected name=path, got {part!r}")
+        specs.append((name.strip(), path.strip()))
+    return specs
+
+
+def parse_cascade_thresholds(spec: str) -> Tuple[float, float]:
+    """
+    'low,high' (e.g. '0.2,0.85'), or the path of a report written by
+    src/cascade.py -> (low, high).
+    """
+    if os.path.isfile(spec):
+        with open(spec) as f:
+            thresholds = json.load(f)["thresholds"]
+        return float(thresholds["low"]), float(thresholds["high"])
+    low, _, high = spec.partition(",")
+    try:
+        return float(low), float(high)
+    except ValueError:
+        raise ValueError(f"Expected low,high or a cascade report path, got {spec!r}")
+
+
+class LatencyWindow:
+    """Latencies of the most recent requests, for percentile estimates."""
+
+    def __init__(self, size: int = 200) -> None:
+        self._samples: deque = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, latency_ms: float) -> None:
+        self._samples.append(latency_ms)
+
+    def percentile(self, q: float) -> float:
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(q / 100.0 * len(ordered)))
+        return ordered[index]
+
+    def clear(self) -> None:
+        self._samples.clear()
+
+
+class BackendRouter:
+    """
+    The configured backends and which one serves each request.
+
+    Requests may name a backend; otherwise the default serves them. With a
+    `latency_budget_ms`, the default's p99 over the last `window` requests
+    is watched, and once it exceeds the budget unnamed requests go to the
+    `fallback` backend for `cooldown_s` seconds before the default is tried
+    again with a fresh window.
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[InferenceBackend],
+        default: str,
+        fallback: Optional[str] = None,
+        latency_budget_ms: Optional[float] = None,
+        window: int = 200,
+        min_samples: int = 50,
+        cooldown_s: float = 30.0,
+    ) -> None:
+        self.backends: Dict[str, InferenceBackend] = {}
+        for backend in backends:
+            if backend.name in self.backends:
+                raise ValueError(f"Duplicate backend name: {backend.name!r}")
+            self.backends[backend.name] = backend
+        for name in (default, fallback):
+            if name is not None and name not in self.backends:
+                raise ValueError(f"Unknown backend: {name!r}")
+
+        self.default = self.backends[default]
+        self.fallback = (
+            self.backends[fallback] if fallback and fallback != default else None
+        )
+        self.latency_budget_ms = latency_budget_ms
+        self.min_samples = min_samples
+        self.cooldown_s = cooldown_s
+
+        self._latency = LatencyWindow(window)
+        self._lock = threading.Lock()
+        self._degraded_until = 0.0
+        self.fallbacks_total = 0
+
+    @property
+    def auto_fallback(self) -> bool:
+        return self.fallback is not None and self.latency_budget_ms is not None
+
+    @property
+    def degraded(self) -> bool:
+        return time.monotonic() < self._degraded_until
+
+    def get(self, name: str) -> InferenceBackend:
+        try:
+            return self.backends[name]
+        except KeyError:
+            raise UnknownBackendError(
+                f"Unknown backend {name!r}. Available: {', '.join(self.backends)}"
+            )
+
+    def select(self, name: Optional[str] = None) -> InferenceBackend:
+        """The backend for one request: the named one, else default / fallback."""
+        if name:
+            return self.get(name)
+        if self.auto_fallback and self.degraded:
+            return self.fallback
+        return self.default
+
+    def record(self, backend: InferenceBackend, latency_ms: float) -> None:
+        """Record a request served by the default backend; may trip the fallback."""
+        if backend is not self.default or not self.auto_fallback:
+            return
+        with self._lock:
+            self._latency.record(latency_ms)
+            if len(self._latency) < self.min_samples:
+                return
+            p99 = self._latency.percentile(99)
+            if p99 <= self.latency_budget_ms:
+                return
+            self._latency.clear()
+            self._degraded_until = time.monotonic() + self.cooldown_s
+            self.fallbacks_total += 1
+        logger.warning(
+            "p99 latency %.0f ms of backend %r exceeds %.0f ms: using %r for %.0f s",
+            p99,
+            self.default.name,
+            self.latency_budget_ms,
+            self.fallback.name,
+            self.cooldown_s,
+        )
+
+    def stats(self) -> dict:
+        return {
+            "default": self.default.name,
+            "fallback": self.fallback.name if self.fallback else None,
+            "latency_budget_ms": self.latency_budget_ms,
+            "degraded": self.auto_fallback and self.degraded,
+            "fallbacks_total": self.fallbacks_total,
+            "default_p99_ms": self._latency.percentile(99),
+            "backends": {
+                name: backend.describe() for name, backend in self.backends.items()
+            },
+        }
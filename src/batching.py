@@ -0,0 +1,147 @@
+import asyncio
+import time
+from collections import Counter
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional, Tuple
+
+from .metrics import STAGE_SECONDS
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent prediction requests into batched forward passes.
+
+    Requests are queued by `submit()`. A background task takes the first
+    queued request, waits up to `max_wait_ms` for more to arrive (or until
+    `max_batch_size` is reached), runs them through `predict_batch` in one
+    call on `executor` (the loop's default executor if None) and resolves
+    each waiting future with its own result.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[List[Any]], List[dict]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must be >= 0")
+
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.executor = executor
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Metrics
+        self.batch_sizes: Counter = Counter()
+        self.requests_total = 0
+        self.batches_total = 0
+        self.queue_wait_total_ms = 0.0
+        self.queue_wait_max_ms = 0.0
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        """Start the batching task on the running loop if needed."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+        return self._queue
+
+    async def submit(self, image: Any) -> dict:
+        """Queue one image and wait for its prediction."""
+        queue = self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await queue.put((image, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self, queue: asyncio.Queue) -> List[Tuple]:
+        """Wait for one request, then gather more until full or timed out."""
+        batch = [await queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # Still take whatever is already waiting, without blocking
+                while len(batch) < self.max_batch_size and not queue.empty():
+                    batch.append(queue.get_nowait())
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect(queue)
+            # Drop requests whose caller already went away
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            self._record(len(batch), [started - item[2] for item in batch])
+
+            images = [item[0] for item in batch]
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.predict_batch, images
+                )
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _record(self, size: int, waits: List[float]) -> None:
+        self.batch_sizes[size] += 1
+        self.batches_total += 1
+        self.requests_total += size
+        for wait in waits:
+            STAGE_SECONDS.observe(wait, stage="queue_wait")
+            wait_ms = wait * 1000.0
+            self.queue_wait_total_ms += wait_ms
+            self.queue_wait_max_ms = max(self.queue_wait_max_ms, wait_ms)
+
+    @property
+    def queue_depth(self) -> int:
+        """Requests waiting to be batched."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        """Batch-size distribution and queue-wait summary."""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "requests_total": self.requests_total,
+            "batches_total": self.batches_total,
+            "mean_batch_size": (
+                self.requests_total / self.batches_total
+                if self.batches_total
+                else 0.0
+            ),
+            "batch_size_distribution": {
+                str(size): count for size, count in sorted(self.batch_sizes.items())
+            },
+            "queue_wait_mean_ms": (
+                self.queue_wait_total_ms / self.requests_total
+                if self.requests_total
+                else 0.0
+            ),
+            "queue_wait_max_ms": self.queue_wait_max_ms,
+        }
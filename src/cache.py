@@ -0,0 +1,125 @@
+import copy
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple, Union
+
+# Returned by PredictionCache.get() when the key is not cached
+MISSING = object()
+
+# Rough per-entry bookkeeping cost (key, OrderedDict node, tuple)
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+def _approx_size(value: Any) -> int:
+    """Cheap estimate of the memory held by a cached value."""
+    if isinstance(value, BaseException):
+        return sys.getsizeof(value) + sum(sys.getsizeof(a) for a in value.args)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items()
+        )
+    return sys.getsizeof(value)
+
+
+class PredictionCache:
+    """
+    LRU cache of prediction results keyed by a hash of the uploaded bytes.
+
+    Values are either a prediction dict or the validation error raised for
+    those bytes, so repeated rejections are answered from the cache too.
+    The cache is bounded by entry count and by approximate memory; entries
+    older than `ttl_seconds` (if set) are treated as misses.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl_seconds: Optional[float] = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds or None
+
+        self._entries: "OrderedDict[bytes, Tuple[Any, float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(data: Union[bytes, bytearray, memoryview], namespace: str = "") -> bytes:
+        """Fast content hash; `namespace` separates e.g. different models."""
+        digest = hashlib.blake2b(data, digest_size=16)
+        if namespace:
+            digest.update(namespace.encode())
+        return digest.digest()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: bytes) -> Any:
+        """Return the cached value, or MISSING."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None:
+                if time.monotonic() - entry[1] > self.ttl_seconds:
+                    self._remove(key)
+                    entry = None
+
+            if entry is None:
+                self.misses += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: bytes, value: Any) -> None:
+        if isinstance(value, BaseException):
+            # The raised error's traceback (and chained errors) reference the
+            # frames that held the upload and the decoded image; cache a
+            # copy with only the message and reason
+            value = copy.copy(value)
+        size = _approx_size(value) + _ENTRY_OVERHEAD_BYTES
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic(), size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: bytes) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,219 @@
+"""
+Calibrate and evaluate the SimpleCNN -> ResNet18 cascade.
+
+In cascade mode (CascadeBackend in src/backends.py) SimpleCNN scores every
+image and answers when its tumor probability is at most `low` or at least
+`high`; only the images in between are escalated to ResNet18. This tool
+picks (low, high) on the held-out validation split: the pair that
+escalates the fewest images while keeping the cascade at least as
+accurate as ResNet18 alone on that split (less `--tolerance`). It then
+reports, on the test split, the escalation rate and accuracy of the
+cascade against each model alone, and the expected cost per image:
+
+    python -m src.cascade --data-dir data_raw
+    CASCADE_THRESHOLDS=reports/cascade_results.json uvicorn src.api:app
+
+The validation split is small (38 images), so the thresholds are only as
+good as it is representative; check the test-split numbers in the report.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from .dataset import Sample, split_dataset
+from .export import REPORTS_DIR, load_batches, measure_latency
+from .inference import BrainTumorClassifier
+
+MODELS_DIR = Path(__file__).resolve().parent.parent / "models"
+
+
+def tumor_probabilities(classifier: BrainTumorClassifier, samples: List[Sample]) -> np.ndarray:
+    """P(tumor) for each sample, with the serving preprocessing."""
+    model = classifier.load()
+    probabilities = []
+    with torch.inference_mode():
+        for images, _ in load_batches(classifier, samples):
+            probabilities.extend(torch.sigmoid(model(images).reshape(-1).float()).tolist())
+    return np.asarray(probabilities)
+
+
+def cascade_predictions(
+    cheap: np.ndarray, accurate: np.ndarray, low: float, high: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(predicted labels, escalated mask), as CascadeBackend decides them."""
+    escalated = (cheap > low) & (cheap < high)
+    probabilities = np.where(escalated, accurate, cheap)
+    return (probabilities >= 0.5).astype(int), escalated
+
+
+def candidate_thresholds(cheap: np.ndarray) -> np.ndarray:
+    """Cut points halfway between consecutive distinct probabilities, plus
+    0, 0.5 and 1 (0.5 on both sides: nothing escalated)."""
+    values = np.unique(cheap)
+    midpoints = (values[:-1] + values[1:]) / 2.0
+    return np.unique(np.concatenate([[0.0, 0.5, 1.0], midpoints]))
+
+
+def calibrate(
+    cheap: np.ndarray, accurate: np.ndarray, labels: np.ndarray, tolerance: float = 0.0
+) -> Tuple[float, float]:
+    """
+    (low, high) that escalate the fewest images while the cascade's
+    accuracy stays within `tolerance` of the accurate model's; ties go to
+    the more accurate pair. (0, 1), escalating everything, always qualifies.
+    """
+    labels = np.asarray(labels)
+    target = np.mean((accurate >= 0.5).astype(int) == labels) - tolerance
+    cuts = candidate_thresholds(cheap)
+
+    best = (len(labels) + 1, 0.0, 0.0, 1.0)  # (escalated, -accuracy, low, high)
+    for low in cuts[cuts <= 0.5]:
+        for high in cuts[cuts >= 0.5]:
+            predictions, escalated = cascade_predictions(cheap, accurate, low, high)
+            accuracy = np.mean(predictions == labels)
+            if accuracy < target - 1e-9:
+                continue
+            best = min(best, (int(escalated.sum()), -accuracy, float(low), float(high)))
+    return best[2], best[3]
+
+
+def summarize(
+    cheap: np.ndarray, accurate: np.ndarray, labels: np.ndarray, low: float, high: float
+) -> dict:
+    """Escalation rate and accuracies of the cascade and of each model alone."""
+    labels = np.asarray(labels)
+    predictions, escalated = cascade_predictions(cheap, accurate, low, high)
+    return {
+        "size": len(labels),
+        "escalated": int(escalated.sum()),
+        "escalation_rate": float(escalated.mean()),
+        "cascade_acc": float(np.mean(predictions == labels)),
+        "cheap_acc": float(np.mean((cheap >= 0.5).astype(int) == labels)),
+        "accurate_acc": float(np.mean((accurate >= 0.5).astype(int) == labels)),
+    }
+
+
+def expected_latency(
+    cheap: Dict[str, float], accurate: Dict[str, float], escalation_rate: float
+) -> Dict[str, float]:
+    """Per-image cost of the cascade: every image pays for the cheap model,
+    the escalated ones for the accurate model too."""
+    return {size: cheap[size] + escalation_rate * accurate[size] for size in cheap}
+
+
+def calibrate_cascade(
+    cheap_path: str,
+    accurate_path: str,
+    data_dir: str,
+    reports_dir: Optional[str] = None,
+    tolerance: float = 0.0,
+) -> Path:
+    """Calibrate on the val split, evaluate on test; returns the report path."""
+    cheap = BrainTumorClassifier(model_path=cheap_path)
+    accurate = BrainTumorClassifier(model_path=accurate_path)
+    splits = split_dataset(data_dir)
+
+    scores = {}
+    for split in ("val", "test"):
+        labels = np.asarray([label for _, label in splits[split]])
+        scores[split] = (
+            tumor_probabilities(cheap, splits[split]),
+            tumor_probabilities(accurate, splits[split]),
+            labels,
+        )
+    low, high = calibrate(*scores["val"], tolerance=tolerance)
+    val = summarize(*scores["val"], low, high)
+    test = summarize(*scores["test"], low, high)
+
+    latency = {
+        "cheap": measure_latency(cheap.load()),
+        "accurate": measure_latency(accurate.load()),
+    }
+    latency["cascade"] = expected_latency(
+        latency["cheap"], latency["accurate"], test["escalation_rate"]
+    )
+
+    report = {
+        "model": f"{cheap.arch} -> {accurate.arch} cascade",
+        "cheap_model": cheap_path,
+        "accurate_model": accurate_path,
+        "train_size": len(splits["train"]),
+        "val_size": len(splits["val"]),
+        "test_size": len(splits["test"]),
+        "thresholds": {"low": low, "high": high},
+        "tolerance": tolerance,
+        "val": val,
+        "test": test,
+        "test_acc": test["cascade_acc"],
+        "latency_ms_per_image": latency,
+        "relative_cost": {
+            size: latency["cascade"][size] / latency["accurate"][size]
+            for size in latency["cascade"]
+        },
+        "torch_threads": torch.get_num_threads(),
+        "notes": (
+            "Thresholds calibrated on the validation split, metrics on the "
+            "held-out test split reproduced from the training notebook. "
+            "Cascade latency is expected cost: cheap model + escalation rate "
+            "x accurate model."
+        ),
+    }
+    reports = Path(reports_dir) if reports_dir else REPORTS_DIR
+    reports.mkdir(parents=True, exist_ok=True)
+    path = reports / "cascade_results.json"
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.cascade",
+        description="Calibrate the SimpleCNN -> ResNet18 cascade thresholds.",
+    )
+    parser.add_argument("--data-dir", required=True, help="data_raw with yes/ and no/")
+    parser.add_argument(
+        "--cheap-model", default=str(MODELS_DIR / "simple_cnn_baseline_mps.pth")
+    )
+    parser.add_argument(
+        "--accurate-model", default=str(MODELS_DIR / "resnet18_brain_mri_mps.pth")
+    )
+    parser.add_argument("--reports-dir", help="Report directory (default: reports/)")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.0,
+        help="Validation accuracy the cascade may lose against the accurate model",
+    )
+    args = parser.parse_args(argv)
+
+    path = calibrate_cascade(
+        args.cheap_model,
+        args.accurate_model,
+        args.data_dir,
+        reports_dir=args.reports_dir,
+        tolerance=args.tolerance,
+    )
+    report = json.loads(path.read_text())
+    test = report["test"]
+    print(
+        f"thresholds low={report['thresholds']['low']:.3f} "
+        f"high={report['thresholds']['high']:.3f}\n"
+        f"test: escalated {test['escalation_rate']:.1%}, "
+        f"cascade acc={test['cascade_acc']:.3f}, "
+        f"accurate model alone acc={test['accurate_acc']:.3f}, "
+        f"cost {report['relative_cost']['batch_1']:.0%} of the accurate model\n"
+        f"report={path}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
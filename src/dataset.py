@@ -0,0 +1,57 @@
+import os
+from typing import Dict, List, Tuple
+
+# Folder name -> label, as in notebooks/00_explore_data.ipynb
+CLASS_TO_LABEL = {"yes": 1, "no": 0}
+
+Sample = Tuple[str, int]
+
+
+def list_labeled_images(root: str) -> List[Sample]:
+    """
+    (path, label) pairs for data_raw/yes and data_raw/no, in the same order
+    the training notebook enumerated them (yes first, os.listdir order).
+    """
+    samples = []
+    for cls in ("yes", "no"):
+        folder = os.path.join(root, cls)
+        for fname in os.listdir(folder):
+            if fname.startswith("."):
+                continue  # skip hidden files like .DS_Store
+            samples.append((os.path.join(folder, fname), CLASS_TO_LABEL[cls]))
+    return samples
+
+
+def split_dataset(root: str, random_state: int = 42) -> Dict[str, List[Sample]]:
+    """
+    Reproduce the notebook's stratified 70 / 15 / 15 train / val / test split.
+
+    Needs scikit-learn (the notebook used train_test_split), which is only
+    required for offline tools, not for serving.
+    """
+    try:
+        from sklearn.model_selection import train_test_split
+    except ImportError:
+        raise SystemExit(
+            "Reproducing the training split needs scikit-learn: pip install scikit-learn"
+        )
+
+    samples = list_labeled_images(root)
+    paths = [path for path, _ in samples]
+    labels = [label for _, label in samples]
+
+    train_paths, temp_paths, train_labels, temp_labels = train_test_split(
+        paths, labels, test_size=0.30, stratify=labels, random_state=random_state
+    )
+    val_paths, test_paths, val_labels, test_labels = train_test_split(
+        temp_paths,
+        temp_labels,
+        test_size=0.50,
+        stratify=temp_labels,
+        random_state=random_state,
+    )
+    return {
+        "train": list(zip(train_paths, train_labels)),
+        "val": list(zip(val_paths, val_labels)),
+        "test": list(zip(test_paths, test_labels)),
+    }
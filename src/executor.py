@@ -0,0 +1,92 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class QueueFullError(Exception):
+    """Raised when the executor already has as much work as it may queue."""
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a hard cap on queued work.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more may
+    wait for a free thread. Anything beyond that is refused immediately with
+    QueueFullError, so callers can shed load instead of piling up requests.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 32) -> None:
+        if max_workers < 1:
+            raise ValueError("max_workers must be >= 1")
+        if max_queue < 0:
+            raise ValueError("max_queue must be >= 0")
+
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="predict"
+        )
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected_total = 0
+
+    @property
+    def pending(self) -> int:
+        """Jobs currently running or waiting for a thread."""
+        return self._pending
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected_total += 1
+                raise QueueFullError("Too many requests in progress")
+            self._pending += 1
+
+    def _release(self) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run `fn(*args)` on the pool, or raise QueueFullError if saturated."""
+        self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, fn, *args)
+        finally:
+            self._release()
+
+    def warmup(self, timeout: float = 10.0) -> bool:
+        """
+        Start every pool thread now instead of on the first requests.
+        Returns False if they were not all running within `timeout` (e.g.
+        on a loaded host); the missing ones then start on demand.
+        """
+        barrier = threading.Barrier(self.max_workers)
+        futures = [
+            self.pool.submit(barrier.wait, timeout) for _ in range(self.max_workers)
+        ]
+        started = True
+        for future in futures:
+            try:
+                future.result()
+            except threading.BrokenBarrierError:
+                started = False
+        return started
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "rejected_total": self.rejected_total,
+        }
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,326 @@
+"""
+Export a training checkpoint to faster CPU inference artifacts.
+
+For a checkpoint such as models/resnet18_brain_mri_mps.pth this writes,
+next to it (or to --out-dir):
+
+    resnet18_brain_mri_fp32.ts            TorchScript, frozen
+    resnet18_brain_mri_int8_dynamic.ts    dynamic int8 (Linear layers)
+    resnet18_brain_mri_int8_static.ts     static int8 (FX, calibrated)
+    resnet18_brain_mri_fp32.onnx          ONNX
+    resnet18_brain_mri_int8_dynamic.onnx  ONNX Runtime dynamic int8
+    resnet18_brain_mri_int8_static.onnx   ONNX Runtime static int8 (QDQ)
+
+and, for every variant (including the eager fp32 baseline), a report in
+reports/ with the same fields as reports/resnet18_results.json plus
+per-image latency, so accuracy can be compared against speed:
+
+    python -m src.export models/resnet18_brain_mri_mps.pth --data-dir data_raw
+
+Any artifact can then be served with MODEL_PATH=models/<artifact>.
+Static quantization needs labelled data for calibration; ONNX variants need
+the onnx and onnxruntime packages; both are skipped (with a message) if
+unavailable.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import torch
+import torch.nn as nn
+from PIL import Image
+
+from .dataset import Sample, split_dataset
+from .inference import INPUT_SIZE, BrainTumorClassifier
+
+REPORTS_DIR = Path(__file__).resolve().parent.parent / "reports"
+
+MODEL_NAMES = {
+    "resnet18": "ResNet18 (transfer learning)",
+    "simple_cnn": "SimpleCNN",
+}
+
+FORMATS = ("torchscript", "onnx")
+PRECISIONS = ("fp32", "int8_dynamic", "int8_static")
+
+
+def artifact_stem(checkpoint: str) -> str:
+    """resnet18_brain_mri_mps.pth -> resnet18_brain_mri"""
+    stem = Path(checkpoint).stem
+    return stem[: -len("_mps")] if stem.endswith("_mps") else stem
+
+
+def load_batches(
+    classifier: BrainTumorClassifier, samples: List[Sample], batch_size: int = 16
+):
+    """Yield (images tensor, labels tensor) using the serving preprocessing."""
+    for start in range(0, len(samples), batch_size):
+        chunk = samples[start : start + batch_size]
+        images = classifier.preprocessor.to_batch(
+            [Image.open(path).convert("RGB") for path, _ in chunk]
+        )
+        yield images, torch.tensor([label for _, label in chunk], dtype=torch.float32)
+
+
+def evaluate(model: Callable, classifier: BrainTumorClassifier, samples: List[Sample]) -> dict:
+    """Test loss / accuracy / confusion matrix, computed as in the notebook."""
+    criterion = nn.BCEWithLogitsLoss(reduction="sum")
+    loss = 0.0
+    cm = [[0, 0], [0, 0]]  # rows: true label, columns: predicted label
+    with torch.inference_mode():
+        for images, labels in load_batches(classifier, samples):
+            logits = model(images).reshape(-1).float()
+            loss += criterion(logits, labels).item()
+            preds = (torch.sigmoid(logits) >= 0.5).long()
+            for true, pred in zip(labels.long().tolist(), preds.tolist()):
+                cm[true][pred] += 1
+    correct = cm[0][0] + cm[1][1]
+    return {
+        "test_loss": loss / len(samples),
+        "test_acc": correct / len(samples),
+        "confusion_matrix": cm,
+    }
+
+
+def measure_latency(
+    model: Callable, batch_sizes=(1, 8), repeats: int = 20
+) -> Dict[str, float]:
+    """Median milliseconds per image for each batch size."""
+    latency = {}
+    with torch.inference_mode():
+        for size in batch_sizes:
+            batch = torch.randn(size, 3, INPUT_SIZE, INPUT_SIZE)
+            for _ in range(3):
+                model(batch)
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                model(batch)
+                timings.append((time.perf_counter() - start) * 1000.0 / size)
+            latency[f"batch_{size}"] = statistics.median(timings)
+    return latency
+
+
+def calibration_batches(
+    classifier: BrainTumorClassifier, samples: List[Sample], limit: int
+) -> List[torch.Tensor]:
+    return [images for images, _ in load_batches(classifier, samples[:limit])]
+
+
+def quantize_static_fx(model: nn.Module, calibration: List[torch.Tensor]) -> nn.Module:
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    example = (torch.zeros(1, 3, INPUT_SIZE, INPUT_SIZE),)
+    prepared = prepare_fx(model, get_default_qconfig_mapping("x86"), example)
+    with torch.inference_mode():
+        for images in calibration:
+            prepared(images)
+    return convert_fx(prepared)
+
+
+def save_torchscript(model: nn.Module, path: Path) -> None:
+    example = torch.zeros(1, 3, INPUT_SIZE, INPUT_SIZE)
+    with torch.inference_mode():
+        scripted = torch.jit.freeze(torch.jit.trace(model, example).eval())
+    torch.jit.save(scripted, str(path))
+
+
+def save_onnx(model: nn.Module, path: Path) -> None:
+    example = torch.zeros(1, 3, INPUT_SIZE, INPUT_SIZE)
+    torch.onnx.export(
+        model,
+        example,
+        str(path),
+        input_names=["input"],
+        output_names=["logit"],
+        dynamic_axes={"input": {0: "batch"}, "logit": {0: "batch"}},
+        dynamo=False,
+    )
+
+
+def quantize_onnx(
+    fp32_path: Path,
+    path: Path,
+    precision: str,
+    calibration: Optional[List[torch.Tensor]] = None,
+) -> None:
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantType,
+        quantize_dynamic,
+        quantize_static,
+    )
+
+    if precision == "int8_dynamic":
+        quantize_dynamic(str(fp32_path), str(path), weight_type=QuantType.QInt8)
+        return
+
+    class Reader(CalibrationDataReader):
+        def __init__(self, batches):
+            self._batches = iter(batches)
+
+        def get_next(self):
+            images = next(self._batches, None)
+            return None if images is None else {"input": images.numpy()}
+
+    quantize_static(str(fp32_path), str(path), Reader(calibration))
+
+
+def write_report(
+    classifier: BrainTumorClassifier,
+    variant: str,
+    artifact: Optional[Path],
+    splits: Optional[Dict[str, List[Sample]]],
+    metrics: Optional[dict],
+    latency: Dict[str, float],
+    reports_dir: Path,
+) -> Path:
+    """Report in the reports/*_results.json format, plus latency / artifact."""
+    report = {
+        "model": f"{MODEL_NAMES[classifier.arch]} - {variant}",
+        "artifact": str(artifact) if artifact else classifier.model_path,
+        "train_size": len(splits["train"]) if splits else None,
+        "val_size": len(splits["val"]) if splits else None,
+        "test_size": len(splits["test"]) if splits else None,
+        "test_loss": metrics["test_loss"] if metrics else None,
+        "test_acc": metrics["test_acc"] if metrics else None,
+        "confusion_matrix": metrics["confusion_matrix"] if metrics else None,
+        "latency_ms_per_image": latency,
+        "size_mb": (
+            os.path.getsize(artifact) / 1e6
+            if artifact
+            else os.path.getsize(classifier.model_path) / 1e6
+        ),
+        "torch_threads": torch.get_num_threads(),
+        "notes": (
+            "Held-out test split reproduced from the training notebook."
+            if metrics
+            else "No labelled data given (--data-dir); latency only."
+        ),
+    }
+    name = artifact.stem if artifact else f"{artifact_stem(classifier.model_path)}_eager_fp32"
+    path = reports_dir / f"{name}_results.json"
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def export(
+    checkpoint: str,
+    data_dir: Optional[str] = None,
+    out_dir: Optional[str] = None,
+    reports_dir: Optional[str] = None,
+    formats=FORMATS,
+    precisions=PRECISIONS,
+    calibration_size: int = 64,
+) -> List[Path]:
+    """Write the requested artifacts and their reports; returns report paths."""
+    classifier = BrainTumorClassifier(model_path=checkpoint, backend="eager")
+    model = classifier.load()
+
+    out = Path(out_dir) if out_dir else Path(checkpoint).resolve().parent
+    reports = Path(reports_dir) if reports_dir else REPORTS_DIR
+    out.mkdir(parents=True, exist_ok=True)
+    reports.mkdir(parents=True, exist_ok=True)
+
+    splits = split_dataset(data_dir) if data_dir else None
+    calibration = (
+        calibration_batches(classifier, splits["train"], calibration_size)
+        if splits
+        else None
+    )
+
+    def report(variant, artifact, runnable):
+        metrics = evaluate(runnable, classifier, splits["test"]) if splits else None
+        path = write_report(
+            classifier, variant, artifact, splits, metrics, measure_latency(runnable), reports
+        )
+        acc = f"{metrics['test_acc']:.3f}" if metrics else "n/a"
+        print(f"{variant:<28} acc={acc}  report={path}", file=sys.stderr)
+        written.append(path)
+
+    written: List[Path] = []
+    stem = artifact_stem(checkpoint)
+    report("eager fp32", None, model)
+
+    if "torchscript" in formats:
+        for precision in precisions:
+            if precision == "int8_static" and not calibration:
+                print("skipping int8_static TorchScript: needs --data-dir", file=sys.stderr)
+                continue
+            if precision == "int8_dynamic":
+                quantized = torch.ao.quantization.quantize_dynamic(
+                    model, {nn.Linear}, dtype=torch.qint8
+                )
+            elif precision == "int8_static":
+                quantized = quantize_static_fx(model, calibration)
+            else:
+                quantized = model
+            path = out / f"{stem}_{precision}.ts"
+            save_torchscript(quantized, path)
+            report(f"torchscript {precision}", path, torch.jit.load(str(path)))
+
+    if "onnx" in formats:
+        try:
+            import onnx  # noqa: F401  (needed by torch.onnx.export)
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            print("skipping ONNX: pip install onnx onnxruntime", file=sys.stderr)
+            return written
+
+        fp32_path = out / f"{stem}_fp32.onnx"
+        save_onnx(model, fp32_path)
+        for precision in precisions:
+            if precision == "int8_static" and not calibration:
+                print("skipping int8_static ONNX: needs --data-dir", file=sys.stderr)
+                continue
+            path = fp32_path
+            if precision != "fp32":
+                path = out / f"{stem}_{precision}.onnx"
+                quantize_onnx(fp32_path, path, precision, calibration)
+            runnable = BrainTumorClassifier(model_path=str(path), arch=classifier.arch).load()
+            report(f"onnx {precision}", path, runnable)
+
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.export",
+        description="Export a checkpoint to quantized TorchScript / ONNX artifacts.",
+    )
+    parser.add_argument("checkpoint", help="e.g. models/resnet18_brain_mri_mps.pth")
+    parser.add_argument(
+        "--data-dir",
+        help="data_raw with yes/ and no/: enables accuracy and static quantization",
+    )
+    parser.add_argument("--out-dir", help="Artifact directory (default: next to checkpoint)")
+    parser.add_argument("--reports-dir", help="Report directory (default: reports/)")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument(
+        "--precisions", nargs="+", choices=PRECISIONS, default=list(PRECISIONS)
+    )
+    parser.add_argument("--calibration-size", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    export(
+        args.checkpoint,
+        data_dir=args.data_dir,
+        out_dir=args.out_dir,
+        reports_dir=args.reports_dir,
+        formats=args.formats,
+        precisions=args.precisions,
+        calibration_size=args.calibration_size,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
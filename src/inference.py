@@ -1,107 +1,478 @@
+import os
+import threading
+from functools import cached_property
 from io import BytesIO
-from typing import Optional, Tuple
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
 
+import numpy as np
 from PIL import Image
 
+from .metrics import BATCH_SIZE, STAGE_SECONDS
+from .preprocessing import Preprocessor
+
+if TYPE_CHECKING:
+    import torch.nn as nn
+
+# torch (and torchvision) are imported on first use rather than here, so the
+# API can bind its socket before paying for them; see src/models.py
+
+# Binary labels used during training (see notebooks/00_explore_data.ipynb):
+# folder "yes" -> 1 (tumor), folder "no" -> 0 (no tumor).
+LABEL_NAMES = {0: "no_tumor", 1: "tumor"}
+
+# ImageNet statistics used by ResNet18_Weights.DEFAULT.transforms()
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# Source modes accepted before conversion to RGB (8-bit JPEG / PNG modes)
+SOURCE_MODES = ("L", "LA", "P", "PA", "RGB", "RGBA", "CMYK", "YCbCr")
+
+# Smallest decoded size (per side) each architecture's transform needs
+DECODE_SIZES = {"resnet18": 256, "simple_cnn": 224}
+
+# Spatial size of the tensors fed to both networks
+INPUT_SIZE = 224
+
 
 class InvalidImageError(Exception):
     """Raised when the input is not a valid image."""
 
+    default_reason = "invalid_image"
+
+    def __init__(self, message: str = "", reason: Optional[str] = None) -> None:
+        super().__init__(message)
+        # Short machine-readable cause, e.g. for rejection metrics
+        self.reason = reason or self.default_reason
+
+
+class ImageDecodeError(InvalidImageError):
+    """Raised when the uploaded bytes cannot be decoded as an image."""
+
+    default_reason = "decode_failed"
+
 
 class NotBrainMRIError(Exception):
     """Raised when the image is valid but clearly not a brain MRI."""
 
+    default_reason = "not_mri"
+
+    def __init__(self, message: str = "", reason: Optional[str] = None) -> None:
+        super().__init__(message)
+        self.reason = reason or self.default_reason
+
+
+class ModelUnavailableError(RuntimeError):
+    """Raised when the model checkpoint cannot be found or loaded."""
+
+
+def infer_arch(model_path: str) -> str:
+    """Guess the architecture from a checkpoint file name."""
+    name = os.path.basename(model_path).lower()
+    if "simple_cnn" in name:
+        return "simple_cnn"
+    return "resnet18"
+
+
+def infer_backend(model_path: str) -> str:
+    """Pick the execution engine from the model file's extension."""
+    suffix = os.path.splitext(model_path)[1].lower()
+    if suffix in (".ts", ".pt"):
+        return "torchscript"
+    if suffix == ".onnx":
+        return "onnx"
+    return "eager"
+
+
+def tumor_probability(result: dict) -> float:
+    """P(tumor) from a prediction dict (whose `probability` is for its label)."""
+    if result["label"] == 1:
+        return result["probability"]
+    return 1.0 - result["probability"]
+
+
+def build_transform(arch: str):
+    """
+    Evaluation transform matching the one used at training time:
+      - ResNet18: resize 256, center crop 224, ImageNet normalization
+      - SimpleCNN: resize to 224x224, no normalization
+    """
+    from torchvision import transforms
+
+    if arch == "resnet18":
+        return transforms.Compose(
+            [
+                transforms.Resize(256),
+                transforms.CenterCrop(224),
+                transforms.ToTensor(),
+                transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD),
+            ]
+        )
+    return transforms.Compose(
+        [
+            transforms.Resize((224, 224)),
+            transforms.ToTensor(),
+        ]
+    )
+
+
+def build_preprocessor(arch: str) -> Preprocessor:
+    """The serving-time equivalent of build_transform(arch)."""
+    if arch == "resnet18":
+        return Preprocessor(
+            INPUT_SIZE, resize_short=256, mean=IMAGENET_MEAN, std=IMAGENET_STD
+        )
+    return Preprocessor(INPUT_SIZE)
+
+
+def _color_stats(thumb) -> Tuple[float, float]:
+    """
+    Color heuristics for an RGB thumbnail (PIL image or HxWx3 uint8 array):
+      - avg_diff: mean of |r-g| + |g-b| + |b-r| per pixel
+      - ratio_bright_sat: share of (pixel, test) pairs that are very bright
+        (max channel > 230) or very saturated (max - min > 80)
+    """
+    pixels = np.asarray(thumb)  # (H, W, 3) uint8
+    n = pixels.shape[0] * pixels.shape[1]
+
+    high = pixels.max(axis=2)
+    spread = high - pixels.min(axis=2)  # never negative, safe in uint8
+
+    # For three values, |r-g| + |g-b| + |b-r| == 2 * (max - min)
+    avg_diff = 2 * int(spread.sum(dtype=np.int64)) / n
+
+    bright_or_saturated = int(np.count_nonzero(high > 230)) + int(
+        np.count_nonzero(spread > 80)
+    )
+    ratio_bright_sat = bright_or_saturated / (n * 2.0)
+    return avg_diff, ratio_bright_sat
+
 
 class BrainTumorClassifier:
     """
-    Dummy classifier used only to get the deployment working.
+    Brain MRI tumor classifier backed by a PyTorch checkpoint.
 
     - Validates that the uploaded file is an image.
     - Applies stricter heuristics to reject obvious non‑MRI images.
-    - Always returns a fixed prediction for valid MRI‑like images (for now).
+    - Loads the ResNet18 / SimpleCNN checkpoint once (CPU, eval mode) on
+      first use and runs batched forward passes.
     """
 
-    def __init__(self, model_path: Optional[str] = None) -> None:
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        arch: Optional[str] = None,
+        model: Optional["nn.Module"] = None,
+        backend: Optional[str] = None,
+        num_threads: Optional[int] = None,
+    ) -> None:
         self.model_path = model_path
+        self.num_threads = num_threads
+        self.backend = backend or (infer_backend(model_path) if model_path else "eager")
+        if self.backend not in ("eager", "torchscript", "onnx"):
+            raise ValueError(f"Unknown inference backend: {self.backend!r}")
+        self.arch = arch or (infer_arch(model_path) if model_path else "resnet18")
+        if self.arch not in DECODE_SIZES:
+            raise ValueError(f"Unknown model architecture: {self.arch!r}")
+        self.preprocessor = build_preprocessor(self.arch)
+        self.decode_size = DECODE_SIZES[self.arch]
+
+        self._model = model
+        if self._model is not None:
+            self._model.eval()
+        self._load_lock = threading.Lock()
+
+    @cached_property
+    def transform(self):
+        """The training-time transform (a reference; serving uses `preprocessor`)."""
+        return build_transform(self.arch)
 
-    def _validate_image(self, image: Image.Image) -> None:
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self) -> "nn.Module":
         """
-        Raise:
-          - InvalidImageError if image is invalid
-          - NotBrainMRIError if it looks clearly not like a brain MRI
+        Load the checkpoint (once) and return the model in eval mode.
+
+        Safe to call from several threads; only the first call hits the disk.
         """
-        # Basic validity: mode and size
-        if image.mode not in ("RGB", "L"):
-            raise InvalidImageError("Unsupported image mode")
+        if self._model is not None:
+            return self._model
 
-        width, height = image.size  # type: Tuple[int, int]
+        with self._load_lock:
+            if self._model is not None:
+                return self._model
+
+            if not self.model_path or not os.path.isfile(self.model_path):
+                raise ModelUnavailableError(
+                    f"Model checkpoint not found: {self.model_path}"
+                )
 
+            try:
+                model = self._load_model()
+            except ModelUnavailableError:
+                raise
+            except Exception as e:
+                raise ModelUnavailableError(
+                    f"Could not load model checkpoint {self.model_path}: {e}"
+                ) from e
+
+            model.eval()
+            self._model = model
+            return model
+
+    def _load_model(self):
+        """Build the model for the configured backend from `model_path`."""
+        import torch
+
+        from .models import OnnxModel, build_model
+
+        if self.backend == "torchscript":
+            # Exported artifacts (see src/export.py), possibly int8-quantized
+            return torch.jit.load(self.model_path, map_location="cpu")
+        if self.backend == "onnx":
+            return OnnxModel(self.model_path, self.num_threads)
+
+        model = build_model(self.arch)
+        # mmap + assign: the parameters stay backed by the checkpoint
+        # file's pages, which forked / sibling workers share through
+        # the page cache instead of each holding a private copy.
+        state_dict = torch.load(
+            self.model_path, map_location="cpu", weights_only=True, mmap=True
+        )
+        model.load_state_dict(state_dict, assign=True)
+        return model
+
+    def _validate_size(self, width: int, height: int) -> None:
+        """Raise NotBrainMRIError for implausible slice dimensions."""
         # Reject too small or too big (most MRIs are moderate size)
         if width < 160 or height < 160:
-            raise NotBrainMRIError("Image too small to be a brain MRI")
+            raise NotBrainMRIError("Image too small to be a brain MRI", "too_small")
         if width > 1200 or height > 1200:
             raise NotBrainMRIError(
-                "Image resolution is unusually large for a single MRI slice."
+                "Image resolution is unusually large for a single MRI slice.",
+                "too_large",
             )
 
         # Brain MRI slices are quite close to square
         aspect_ratio = max(width, height) / min(width, height)
         if aspect_ratio > 1.2:
             raise NotBrainMRIError(
-                "Image does not look like a brain MRI (unusual aspect ratio)."
+                "Image does not look like a brain MRI (unusual aspect ratio).",
+                "aspect_ratio",
             )
 
-        # Reject very colorful images (screenshots, photos, etc.)
+    def _validate_colors(self, thumb: np.ndarray) -> None:
+        """Raise NotBrainMRIError for very colorful / bright RGB images."""
+        # Reject very colorful images (screenshots, photos, etc.), judged on
+        # the 64x64 thumbnail from Preprocessor.thumbnail
+        avg_diff, ratio_bright_sat = _color_stats(thumb)
+
+        # Typical MRIs are mostly mid‑gray with low color variation
+        if avg_diff > 30 or ratio_bright_sat > 0.15:
+            raise NotBrainMRIError(
+                "Image colors / brightness suggest it is not a typical brain MRI scan.",
+                "color",
+            )
+
+    def _validate_header(
+        self, image: Image.Image, original_size: Optional[Tuple[int, int]] = None
+    ) -> None:
+        """
+        Fast-reject stage on a lazily opened image: only the mode and size
+        from the file header are used, no pixel data is decoded.
+
+        `original_size` is the (width, height) a client declares for an
+        image it downscaled before upload; the size rules then apply to it,
+        and the upload must be a downscale of it.
+        """
+        if image.mode not in SOURCE_MODES:
+            raise InvalidImageError("Unsupported image mode", "unsupported_mode")
+
+        width, height = image.size  # type: Tuple[int, int]
+        if original_size is None:
+            self._validate_size(width, height)
+            return
+
+        declared_width, declared_height = original_size
+        # Same aspect ratio up to the client's rounding, and not upscaled
+        if (
+            width > declared_width
+            or height > declared_height
+            or abs(width * declared_height - height * declared_width)
+            > max(declared_width, declared_height)
+        ):
+            raise InvalidImageError(
+                "Image size does not match the declared original size",
+                "declared_size_mismatch",
+            )
+        self._validate_size(declared_width, declared_height)
+
+    def _validate_image(self, image: Image.Image) -> np.ndarray:
+        """
+        Raise:
+          - InvalidImageError if image is invalid
+          - NotBrainMRIError if it looks clearly not like a brain MRI
+        Returns the prepared model input.
+        """
+        # Basic validity: mode and size
+        if image.mode not in ("RGB", "L"):
+            raise InvalidImageError("Unsupported image mode", "unsupported_mode")
+
+        width, height = image.size  # type: Tuple[int, int]
+        self._validate_size(width, height)
+
+        with STAGE_SECONDS.time(stage="preprocess"):
+            model_input, thumb = self.preprocessor.prepare(image.convert("RGB"))
         if image.mode == "RGB":
-            # Downsample to speed up stats
-            thumb = image.resize((64, 64))
-            pixels = list(thumb.getdata())
-
-            # Simple color “spread” measure
-            diffs = [
-                abs(r - g) + abs(g - b) + abs(b - r)
-                for (r, g, b) in pixels
-            ]
-            avg_diff = sum(diffs) / len(diffs)
-
-            # Count how many pixels are very bright or very saturated
-            bright_or_saturated = 0
-            for (r, g, b) in pixels:
-                if max(r, g, b) > 230:
-                    bright_or_saturated += 1
-                if max(r, g, b) - min(r, g, b) > 80:
-                    bright_or_saturated += 1
-
-            ratio_bright_sat = bright_or_saturated / (len(pixels) * 2.0)
-
-            # Typical MRIs are mostly mid‑gray with low color variation
-            if avg_diff > 30 or ratio_bright_sat > 0.15:
-                raise NotBrainMRIError(
-                    "Image colors / brightness suggest it is not a typical brain MRI scan."
-                )
+            with STAGE_SECONDS.time(stage="validate"):
+                self._validate_colors(thumb)
+        return model_input
+
+    def warmup(self, batch_sizes: Sequence[int] = (1,)) -> None:
+        """
+        Load the model and run a dummy forward pass at each batch size, so
+        the first real requests do not pay for lazy initialisation.
+        """
+        import torch
+
+        model = self.load()
+        with torch.inference_mode():
+            for size in batch_sizes:
+                model(torch.zeros(size, 3, INPUT_SIZE, INPUT_SIZE))
+
+    def predict_batch(self, images: List) -> List[dict]:
+        """
+        Run a single forward pass over a list of (already validated)
+        inputs, either prepared arrays from decode_and_validate() or PIL
+        images, and return one prediction dict per image, in input order.
+        """
+        if not images:
+            return []
+
+        import torch
+
+        model = self.load()
+        with STAGE_SECONDS.time(stage="batch_assembly"):
+            batch = self.preprocessor.to_batch(images)
+
+        with STAGE_SECONDS.time(stage="inference"), torch.inference_mode():
+            logits = model(batch).reshape(-1)
+            tumor_probs = torch.sigmoid(logits).tolist()
+        BATCH_SIZE.observe(len(images))
+
+        results = []
+        for p_tumor in tumor_probs:
+            label = 1 if p_tumor >= 0.5 else 0
+            results.append(
+                {
+                    "label": label,
+                    "label_name": LABEL_NAMES[label],
+                    "probability": p_tumor if label == 1 else 1.0 - p_tumor,
+                }
+            )
+        return results
 
     def predict_image_from_pil(self, image: Image.Image) -> dict:
         """
         Accepts a PIL image and returns a prediction dict
         or raises a validation error.
         """
-        self._validate_image(image)
+        return self.predict_batch([self._validate_image(image)])[0]
+
+    def decode(self, image_bytes: bytes) -> Image.Image:
+        """Decode raw bytes into an RGB PIL image."""
+        try:
+            return Image.open(BytesIO(image_bytes)).convert("RGB")
+        except Exception:
+            raise ImageDecodeError("Could not open image")
+
+    def decode_validated(
+        self, image_bytes: bytes, original_size: Optional[Tuple[int, int]] = None
+    ) -> Image.Image:
+        """
+        Decode raw bytes into an RGB image, running the size, aspect and
+        mode rules on the header (or on `original_size`, see
+        _validate_header) before any pixel data is decoded. JPEGs are
+        decoded at a reduced DCT scale that is still at least as large as
+        the model input.
+        """
+        with STAGE_SECONDS.time(stage="header"):
+            try:
+                image = Image.open(BytesIO(image_bytes))
+            except Exception:
+                raise ImageDecodeError("Could not open image")
+
+            self._validate_header(image, original_size)
+
+        with STAGE_SECONDS.time(stage="decode"):
+            if image.format == "JPEG":
+                image.draft("RGB", (self.decode_size, self.decode_size))
+
+            try:
+                return image.convert("RGB")
+            except Exception:
+                raise ImageDecodeError("Could not open image")
+
+    def decode_and_validate(
+        self, image_bytes: bytes, original_size: Optional[Tuple[int, int]] = None
+    ) -> np.ndarray:
+        """
+        CPU-bound half of the request pipeline: decode, resize once and
+        validate. Returns the prepared model input (a uint8 HxWx3 array)
+        that predict_batch() writes straight into the batch tensor.
+
+        Uploads already downscaled by the client to the resize target (see
+        `original_size` in _validate_header) skip the resize.
+        """
+        image = self.decode_validated(image_bytes, original_size)
+        with STAGE_SECONDS.time(stage="preprocess"):
+            model_input, thumb = self.preprocessor.prepare(image)
+        with STAGE_SECONDS.time(stage="validate"):
+            self._validate_colors(thumb)
+        return model_input
+
+    def validate_array(self, pixels: np.ndarray) -> np.ndarray:
+        """
+        decode_and_validate() for pixels that arrive as an array (see
+        src/arrays.py): uint8 HxW grayscale, HxWx1 or HxWx3 RGB. The same
+        size and color rules apply; there is nothing to decode.
+        """
+        if pixels.ndim == 3 and pixels.shape[2] == 1:
+            pixels = pixels[:, :, 0]
+        if pixels.dtype != np.uint8 or not (
+            pixels.ndim == 2 or (pixels.ndim == 3 and pixels.shape[2] == 3)
+        ):
+            raise InvalidImageError(
+                "Arrays must be uint8 HxW (grayscale) or HxWx3 (RGB)",
+                "unsupported_array",
+            )
 
-        # Dummy prediction for now
-        return {
-            "label": 0,
-            "label_name": "no_tumor",
-            "probability": 0.95,
-        }
+        height, width = pixels.shape[:2]
+        with STAGE_SECONDS.time(stage="header"):
+            self._validate_size(width, height)
+        with STAGE_SECONDS.time(stage="preprocess"):
+            model_input, thumb = self.preprocessor.prepare_array(pixels)
+        if pixels.ndim == 3:
+            with STAGE_SECONDS.time(stage="validate"):
+                self._validate_colors(thumb)
+        return model_input
 
     def predict(self, image_bytes: bytes) -> str:
         """
         Alternate interface: accept raw bytes and return a string.
         """
-        try:
-            img = Image.open(BytesIO(image_bytes)).convert("RGB")
-        except Exception:
-            raise InvalidImageError("Could not open image")
+        result = self.predict_batch([self.decode_and_validate(image_bytes)])[0]
+        if result["label"] == 1:
+            return f"Tumor ({result['probability']:.1%})"
+        return f"No Tumor ({result['probability']:.1%})"
+
+
+def __getattr__(name: str):
+    # The network definitions moved to src/models.py; keep them importable
+    # from here without importing torch along with this module
+    if name in ("SimpleCNN", "build_model", "OnnxModel"):
+        from . import models
 
-        self._validate_image(img)
-        return "No Tumor (dummy prediction)"
\ No newline at end of file
+        return getattr(models, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,419 @@
+"""
+Asynchronous prediction jobs on a local SQLite queue.
+
+POST /jobs stores the uploaded images in a SQLite database (no broker)
+and returns at once; background worker threads drain it, batching images
+across jobs, and GET /jobs/{id} reports progress and, when done, one
+result per image. Several gunicorn workers can share one database: items
+are claimed in a write transaction, and a claim that is not completed
+within `lease_s` (e.g. its worker was killed) is handed out again.
+
+Workers only take work while `can_run()` allows it; the API pauses them
+while interactive requests are in flight in the same process, so bulk jobs
+mostly soak up idle capacity.
+"""
+
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    backend TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    filename TEXT,
+    data BLOB,
+    status TEXT NOT NULL,
+    claimed_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS items_by_status ON items (status, claimed_at);
+"""
+
+# Item states: queued -> running -> done (its result is then stored)
+QUEUED, RUNNING, DONE = "queued", "running", "done"
+
+# Images inserted per transaction by JobStore.create
+CREATE_CHUNK = 16
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class JobStore:
+    """The durable queue: jobs, their images and their results."""
+
+    def __init__(self, path: str, lease_s: float = 300.0, max_attempts: int = 3) -> None:
+        self.path = path
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # The store is created at import, i.e. in the gunicorn master under
+        # preload_app: no connection may be left open to be inherited by
+        # the forked workers (SQLite handles must not cross a fork)
+        db = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+            columns = {row[1] for row in db.execute("PRAGMA table_info(items)")}
+            if "attempts" not in columns:  # created before attempts were counted
+                db.execute(
+                    "ALTER TABLE items ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"
+                )
+        finally:
+            db.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        This thread's connection, opened on first use (sqlite3 connections
+        are not shareable between threads, nor between processes).
+        """
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def create(
+        self,
+        backend: str,
+        items: Iterable[Tuple[str, Optional[Buffer], Optional[dict]]],
+        total: Optional[int] = None,
+    ) -> str:
+        """
+        Queue a job. Each item is (filename, image bytes, None), or
+        (filename, None, error line) for an upload that already failed.
+
+        `items` may be a generator that reads the images as it goes (pass
+        `total`): they are inserted CREATE_CHUNK at a time, so only a chunk
+        is ever held in memory. If it raises, the partial job is deleted.
+        """
+        if total is None:
+            total = len(items)
+        job_id = uuid.uuid4().hex
+        db = self._connect()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "INSERT INTO jobs (id, backend, status, total, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (job_id, backend, QUEUED, total, time.time()),
+            )
+
+        count = 0
+        try:
+            iterator = iter(items)
+            while True:
+                chunk = list(itertools.islice(iterator, CREATE_CHUNK))
+                if not chunk:
+                    break
+                rows = [
+                    (
+                        job_id,
+                        count + offset,
+                        filename,
+                        data,
+                        QUEUED if error is None else DONE,
+                        None if error is None else json.dumps(error),
+                    )
+                    for offset, (filename, data, error) in enumerate(chunk)
+                ]
+                count += len(chunk)
+                failed = sum(1 for _, _, error in chunk if error is not None)
+                with db:
+                    db.execute("BEGIN IMMEDIATE")
+                    db.executemany(
+                        "INSERT INTO items (job_id, idx, filename, data, status, result)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    db.execute(
+                        "UPDATE jobs SET completed = completed + ? WHERE id = ?",
+                        (failed, job_id),
+                    )
+                del chunk, rows
+            if count != total:
+                raise ValueError(f"Job has {count} items, expected {total}")
+        except BaseException:
+            self._delete([job_id])
+            raise
+
+        # Every upload may have failed already
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?"
+                " WHERE id = ? AND completed >= total",
+                (DONE, time.time(), job_id),
+            )
+        return job_id
+
+    def claim(self, limit: int) -> Tuple[Optional[str], List[tuple]]:
+        """
+        Take up to `limit` items for one backend, oldest job first:
+        (backend, [(job_id, index, filename, data), ...]). Each claim is an
+        attempt; items already tried `max_attempts` times are finished with
+        an error line instead of being handed out again.
+        """
+        now = time.time()
+        stale = now - self.lease_s
+        claimable = "(i.status = ? OR (i.status = ? AND i.claimed_at < ?))"
+        db = self._connect()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            exhausted = db.execute(
+                f"SELECT i.job_id, i.idx, i.filename FROM items i WHERE {claimable}"
+                " AND i.attempts >= ?",
+                (QUEUED, RUNNING, stale, self.max_attempts),
+            ).fetchall()
+            if exhausted:
+                message = f"Could not score this image after {self.max_attempts} attempts."
+                failed = []
+                for job_id, index, filename in exhausted:
+                    line = {"index": index, "filename": filename, "status": 500, "error": message}
+                    failed.append((job_id, index, line))
+                self._finish(db, failed, now)
+
+            first = db.execute(
+                "SELECT j.backend FROM items i JOIN jobs j ON j.id = i.job_id"
+                f" WHERE {claimable} ORDER BY j.created_at, i.idx LIMIT 1",
+                (QUEUED, RUNNING, stale),
+            ).fetchone()
+            if first is None:
+                return None, []
+            backend = first[0]
+            rows = db.execute(
+                "SELECT i.job_id, i.idx, i.filename, i.data FROM items i"
+                f" JOIN jobs j ON j.id = i.job_id WHERE j.backend = ? AND {claimable}"
+                " ORDER BY j.created_at, i.idx LIMIT ?",
+                (backend, QUEUED, RUNNING, stale, limit),
+            ).fetchall()
+            db.executemany(
+                "UPDATE items SET status = ?, claimed_at = ?, attempts = attempts + 1"
+                " WHERE job_id = ? AND idx = ?",
+                [(RUNNING, now, job_id, index) for job_id, index, _, _ in rows],
+            )
+            db.executemany(
+                "UPDATE jobs SET status = ? WHERE id = ? AND status = ?",
+                [(RUNNING, job_id, QUEUED) for job_id in {row[0] for row in rows}],
+            )
+        return backend, rows
+
+    def release(self, items: Sequence[Tuple[str, int]]) -> None:
+        """Put claimed (job_id, index) items back in the queue to be retried."""
+        db = self._connect()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.executemany(
+                "UPDATE items SET status = ?, claimed_at = NULL"
+                " WHERE job_id = ? AND idx = ? AND status = ?",
+                [(QUEUED, job_id, index, RUNNING) for job_id, index in items],
+            )
+
+    def complete(self, results: Sequence[Tuple[str, int, dict]]) -> None:
+        """Store (job_id, index, result line) and finish jobs with no work left."""
+        db = self._connect()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            self._finish(db, results, time.time())
+
+    @staticmethod
+    def _finish(
+        db: sqlite3.Connection, results: Sequence[Tuple[str, int, dict]], now: float
+    ) -> None:
+        """complete() inside the caller's transaction."""
+        finished = []
+        for job_id, index, line in results:
+            # Drop the image once it is scored; only the result is kept
+            cursor = db.execute(
+                "UPDATE items SET status = ?, result = ?, data = NULL"
+                " WHERE job_id = ? AND idx = ? AND status != ?",
+                (DONE, json.dumps(line), job_id, index, DONE),
+            )
+            if cursor.rowcount:
+                finished.append(job_id)
+        for job_id in set(finished):
+            db.execute(
+                "UPDATE jobs SET completed = completed + ? WHERE id = ?",
+                (finished.count(job_id), job_id),
+            )
+            db.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?"
+                " WHERE id = ? AND completed >= total",
+                (DONE, now, job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """The job's state, with its results (in input order) once done."""
+        db = self._connect()
+        row = db.execute(
+            "SELECT id, backend, status, total, completed, created_at, finished_at"
+            " FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "backend", "status", "total", "completed", "created_at", "finished_at")
+        job = dict(zip(keys, row))
+        if job["status"] == DONE:
+            job["results"] = [
+                json.loads(result)
+                for (result,) in db.execute(
+                    "SELECT result FROM items WHERE job_id = ? ORDER BY idx", (job_id,)
+                )
+            ]
+        return job
+
+    def queued(self) -> int:
+        """Images waiting to be (re)scored, over all jobs."""
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM items WHERE status != ?", (DONE,)
+        ).fetchone()[0]
+
+    def purge(self, older_than_s: float) -> int:
+        """Delete finished jobs older than `older_than_s`; returns how many."""
+        cutoff = time.time() - older_than_s
+        ids = [
+            job_id
+            for (job_id,) in self._connect().execute(
+                "SELECT id FROM jobs WHERE status = ? AND finished_at < ?",
+                (DONE, cutoff),
+            )
+        ]
+        self._delete(ids)
+        return len(ids)
+
+    def _delete(self, ids: List[str]) -> None:
+        db = self._connect()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.executemany("DELETE FROM items WHERE job_id = ?", [(i,) for i in ids])
+            db.executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in ids])
+
+
+class JobWorkers:
+    """
+    Threads that drain a JobStore: claim a batch of images (possibly from
+    several jobs), decode and validate them, run one forward pass, store
+    the results. `process(backend_name, items)` does the scoring and
+    returns one result line per item.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        process: Callable[[str, List[tuple]], List[dict]],
+        can_run: Callable[[], bool] = lambda: True,
+        workers: int = 1,
+        batch_size: int = 8,
+        idle_s: float = 0.5,
+        ttl_s: float = 24 * 3600.0,
+    ) -> None:
+        self.store = store
+        self.process = process
+        self.can_run = can_run
+        self.workers = workers
+        self.batch_size = batch_size
+        self.idle_s = idle_s
+        self.ttl_s = ttl_s
+        self.images_total = 0
+        self.paused_total = 0
+
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._last_purge = 0.0
+
+    def start(self) -> None:
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"jobs_{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_once(self) -> int:
+        """Claim and score one batch; returns the number of images scored."""
+        backend, rows = self.store.claim(self.batch_size)
+        if not rows:
+            return 0
+        try:
+            lines = self.process(backend, rows)
+        except Exception as e:
+            logger.exception("Job batch of %d failed: %s", len(rows), e)
+            if len(rows) == 1:
+                self.store.release([(rows[0][0], rows[0][1])])
+                return 0
+            # One bad image must not sink the rest: retry them one by one,
+            # so only the culprit is released (and failed after max_attempts)
+            lines = []
+            for row in rows:
+                try:
+                    lines.extend(self.process(backend, [row]))
+                except Exception:
+                    self.store.release([(row[0], row[1])])
+                    lines.append(None)
+        done = [
+            (job_id, index, line)
+            for (job_id, index, _, _), line in zip(rows, lines)
+            if line is not None
+        ]
+        self.store.complete(done)
+        self.images_total += len(done)
+        return len(done)
+
+    def _run(self) -> None:
+        # Back off exponentially while interactive requests are running
+        pause = 0.01
+        while not self._stop.is_set():
+            if not self.can_run():
+                self.paused_total += 1
+                self._stop.wait(pause)
+                pause = min(pause * 2, self.idle_s)
+                continue
+            pause = 0.01
+            try:
+                scored = self.run_once()
+                if time.monotonic() - self._last_purge > 600:
+                    self._last_purge = time.monotonic()
+                    self.store.purge(self.ttl_s)
+            except sqlite3.Error:
+                logger.exception("Job queue error")
+                scored = 0
+            if not scored:
+                self._stop.wait(self.idle_s)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "images_total": self.images_total,
+            "paused_total": self.paused_total,
+            "queued": self.store.queued(),
+        }
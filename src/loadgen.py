@@ -0,0 +1,410 @@
+"""
+Capacity test: launch the app locally and replay a mix of uploads at
+increasing concurrency.
+
+    python -m src.loadgen --workers 2 --concurrency 1 4 16 --duration 30 \\
+        --output reports/capacity_2_workers.json
+
+The app is started under gunicorn (gunicorn.conf.py, as deployed) or
+uvicorn and polled on /ready before any load is sent. Each concurrency
+level runs for --duration seconds after a short warm-up. The mix is
+drawn from a seeded RNG, so a report can be regenerated:
+
+  - valid:     MRI-like PNG slices of varying size, expecting 200
+  - rejected:  too small / too colorful images, expecting 400
+  - oversized: an 11 MB upload, expecting 413
+
+The report has throughput, latency percentiles per kind and error rates
+for every level. It also samples the server's CPU use and resident
+memory (RSS, plus PSS, which counts shared model pages once) from /proc.
+`sustainable_rps` is the best throughput of any level that stayed within
+--p99-budget-ms with at most --max-error-rate unexpected responses.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .serving import available_cpus
+
+ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_MIX = {"valid": 0.85, "rejected": 0.10, "oversized": 0.05}
+
+
+@dataclass
+class Payload:
+    kind: str
+    filename: str
+    body: bytes
+    expected_status: int
+
+
+def _png(image: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _mri_like(size: int, shade: int, rng: np.random.Generator) -> Image.Image:
+    """Noisy grayscale disc, roughly like an axial slice."""
+    image = Image.new("L", (size, size), 0)
+    margin = size // 8
+    ImageDraw.Draw(image).ellipse(
+        (margin, margin, size - margin, size - margin), fill=shade
+    )
+    pixels = np.asarray(image, dtype=np.int16) + rng.normal(0, 10, (size, size))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).convert("RGB")
+
+
+def make_payloads(seed: int = 0, variants: int = 16) -> Dict[str, List[Payload]]:
+    """Deterministic upload bodies for each kind of request."""
+    rng = np.random.default_rng(seed)
+    valid = [
+        Payload(
+            "valid",
+            f"slice{i}.png",
+            _png(_mri_like(int(rng.choice([224, 256, 512])), int(rng.integers(60, 200)), rng)),
+            200,
+        )
+        for i in range(variants)
+    ]
+    colorful = Image.fromarray(rng.integers(0, 256, (256, 256, 3), dtype=np.uint8))
+    rejected = [
+        Payload("rejected", "tiny.png", _png(_mri_like(64, 120, rng)), 400),
+        Payload("rejected", "photo.png", _png(colorful), 400),
+    ]
+    oversized = [
+        Payload("oversized", "huge.png", b"\0" * (11 * 1024 * 1024), 413),
+    ]
+    return {"valid": valid, "rejected": rejected, "oversized": oversized}
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """'valid=0.8,rejected=0.2' -> weights normalized to 1."""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown request kind {name!r} in --mix")
+        mix[name] = float(weight)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("--mix weights must add up to more than 0")
+    return {name: weight / total for name, weight in mix.items()}
+
+
+def percentile(ordered: Sequence[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+def summarize(samples: List[Tuple[str, int, float]], elapsed: float) -> dict:
+    """
+    Aggregate (kind, status, latency_ms) samples; status 0 is a
+    connection error.
+    """
+    by_kind: Dict[str, List[Tuple[int, float]]] = {}
+    for kind, status, latency in samples:
+        by_kind.setdefault(kind, []).append((status, latency))
+
+    expected = {"valid": 200, "rejected": 400, "oversized": 413}
+    kinds = {}
+    unexpected_total = 0
+    for kind, results in sorted(by_kind.items()):
+        latencies = sorted(latency for _, latency in results)
+        statuses: Dict[str, int] = {}
+        for status, _ in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        unexpected = sum(1 for status, _ in results if status != expected[kind])
+        unexpected_total += unexpected
+        kinds[kind] = {
+            "requests": len(results),
+            "statuses": statuses,
+            "unexpected": unexpected,
+            "latency_ms": {
+                "mean": statistics.fmean(latencies),
+                "p50": percentile(latencies, 50),
+                "p90": percentile(latencies, 90),
+                "p99": percentile(latencies, 99),
+                "max": latencies[-1],
+            },
+        }
+
+    total = len(samples)
+    return {
+        "requests": total,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "error_rate": unexpected_total / total if total else 0.0,
+        "rate_limited": sum(1 for _, status, _ in samples if status == 429),
+        "kinds": kinds,
+    }
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    payloads: Dict[str, List[Payload]],
+    mix: Dict[str, float],
+    concurrency: int,
+    duration: float,
+    warmup: float = 0.0,
+    seed: int = 0,
+) -> Tuple[List[Tuple[str, int, float]], float]:
+    """
+    Keep `concurrency` requests in flight for `warmup + duration` seconds.
+    Returns the samples completed after the warm-up, and the measured time.
+    """
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+    samples: List[Tuple[str, int, float]] = []
+
+    async def user(index: int) -> None:
+        rng = random.Random(seed * 1000 + index)
+        while time.perf_counter() < stop_at:
+            payload = rng.choice(payloads[rng.choices(kinds, weights)[0]])
+            files = {"file": (payload.filename, payload.body, "image/png")}
+            t0 = time.perf_counter()
+            try:
+                status = (await client.post("/predict", files=files)).status_code
+            except httpx.HTTPError:
+                status = 0
+            t1 = time.perf_counter()
+            if t0 >= measure_from:
+                samples.append((payload.kind, status, (t1 - t0) * 1000.0))
+
+    await asyncio.gather(*(user(i) for i in range(concurrency)))
+    return samples, time.perf_counter() - measure_from
+
+
+class ProcessSampler:
+    """CPU time and memory of a process tree, read from /proc (Linux)."""
+
+    def __init__(self, pid: int) -> None:
+        self.pid = pid
+        self._ticks = os.sysconf("SC_CLK_TCK")
+
+    def _tree(self) -> List[int]:
+        pids = [self.pid]
+        for pid in pids:
+            for task in Path(f"/proc/{pid}/task").glob("*/children"):
+                try:
+                    pids.extend(int(child) for child in task.read_text().split())
+                except OSError:
+                    pass
+        return pids
+
+    def cpu_seconds(self) -> float:
+        total = 0
+        for pid in self._tree():
+            try:
+                fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            total += int(fields[11]) + int(fields[12])  # utime + stime
+        return total / self._ticks
+
+    def memory_mb(self) -> Dict[str, float]:
+        rss = pss = 0
+        for pid in self._tree():
+            try:
+                for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1])
+            except OSError:
+                continue
+        return {"rss_mb": rss / 1024.0, "pss_mb": pss / 1024.0}
+
+
+def server_command(server: str, port: int) -> List[str]:
+    if server == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "src.api:app"]
+    return [
+        sys.executable, "-m", "uvicorn", "src.api:app",
+        "--host", "127.0.0.1", "--port", str(port),
+    ]
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Server exited with status {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise SystemExit(f"Server not ready after {timeout:.0f} s (check MODEL_PATH)")
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def _measure(args, base_url: str, sampler: Optional[ProcessSampler]) -> List[dict]:
+    payloads = make_payloads(args.seed)
+    mix = parse_mix(args.mix)
+    levels = []
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=limits) as client:
+        for concurrency in args.concurrency:
+            cpu_before = sampler.cpu_seconds() if sampler else None
+            samples, elapsed = await run_level(
+                client, payloads, mix, concurrency, args.duration, args.warmup, args.seed
+            )
+            level = {"concurrency": concurrency, **summarize(samples, elapsed)}
+            if sampler:
+                # Includes the warm-up; CPU use is a rate, so that is harmless
+                spent = sampler.cpu_seconds() - cpu_before
+                level["server_cpu_percent"] = 100.0 * spent / (elapsed + args.warmup)
+                level.update(sampler.memory_mb())
+            levels.append(level)
+            p99 = level["kinds"].get("valid", {}).get("latency_ms", {}).get("p99")
+            print(
+                f"concurrency {concurrency:>3}: {level['throughput_rps']:7.1f} req/s, "
+                f"valid p99 {p99 or 0:7.1f} ms, errors {level['error_rate']:.1%}",
+                file=sys.stderr,
+            )
+    return levels
+
+
+def sustainable(levels: List[dict], p99_budget_ms: float, max_error_rate: float) -> dict:
+    """Best level that met the latency budget and the error-rate limit."""
+    best = None
+    for level in levels:
+        p99 = level["kinds"].get("valid", {}).get("latency_ms", {}).get("p99")
+        if p99 is None or p99 > p99_budget_ms or level["error_rate"] > max_error_rate:
+            continue
+        if best is None or level["throughput_rps"] > best["throughput_rps"]:
+            best = level
+    return {
+        "p99_budget_ms": p99_budget_ms,
+        "max_error_rate": max_error_rate,
+        "sustainable_rps": best["throughput_rps"] if best else None,
+        "at_concurrency": best["concurrency"] if best else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.loadgen",
+        description="Launch the app locally and measure its capacity.",
+    )
+    parser.add_argument("--server", choices=["gunicorn", "uvicorn"], default="gunicorn")
+    parser.add_argument("--workers", type=int, default=None, help="WEB_CONCURRENCY for gunicorn")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--url", help="Load an already running server instead of launching one"
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per level")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Unmeasured seconds per level")
+    parser.add_argument(
+        "--mix",
+        default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+        help="Request kinds and weights, e.g. valid=0.9,rejected=0.1",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--p99-budget-ms", type=float, default=1000.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument(
+        "--keep-cache",
+        action="store_true",
+        help="Leave the prediction cache on (off by default: repeats would be cache hits)",
+    )
+    parser.add_argument("--ready-timeout", type=float, default=180.0)
+    parser.add_argument("-o", "--output", help="Write the JSON report here")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, PORT=str(args.port))
+    if args.workers:
+        env["WEB_CONCURRENCY"] = str(args.workers)
+    if not args.keep_cache:
+        env["CACHE_MAX_ENTRIES"] = "0"
+
+    process = None
+    sampler = None
+    base_url = args.url
+    if base_url is None:
+        base_url = f"http://127.0.0.1:{args.port}"
+        process = subprocess.Popen(server_command(args.server, args.port), cwd=ROOT, env=env)
+    try:
+        if process is not None:
+            wait_until_ready(base_url, process, args.ready_timeout)
+            if Path(f"/proc/{process.pid}").exists():
+                sampler = ProcessSampler(process.pid)
+        idle_memory = sampler.memory_mb() if sampler else None
+        levels = asyncio.run(_measure(args, base_url, sampler))
+    finally:
+        if process is not None:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "config": {
+            "server": args.server if args.url is None else "external",
+            "url": args.url,
+            "workers": env.get("WEB_CONCURRENCY"),
+            "torch_threads": os.environ.get("TORCH_NUM_THREADS"),
+            "model_path": os.environ.get("MODEL_PATH"),
+            "cache": args.keep_cache,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "mix": parse_mix(args.mix),
+            "seed": args.seed,
+        },
+        "machine": {
+            "cpus": available_cpus(),
+            "processor": platform.processor() or platform.machine(),
+            "python": platform.python_version(),
+        },
+        "idle_memory": idle_memory,
+        "levels": levels,
+        "capacity": sustainable(levels, args.p99_budget_ms, args.max_error_rate),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(text + "\n")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
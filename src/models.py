@@ -0,0 +1,85 @@
+"""
+Network definitions and model runtimes.
+
+Kept apart from src/inference.py so that importing the API does not import
+torch: this module is only loaded when a model is built or loaded.
+"""
+
+from typing import Optional
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from .inference import ModelUnavailableError
+from .serving import apply_torch_threads
+
+# The gunicorn worker's thread budget, deferred until torch is imported
+apply_torch_threads()
+
+
+class SimpleCNN(nn.Module):
+    """Baseline CNN, identical to the one trained in the notebook."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.conv1 = nn.Conv2d(3, 16, kernel_size=3, padding=1)
+        self.pool = nn.MaxPool2d(2, 2)
+        self.conv2 = nn.Conv2d(16, 32, kernel_size=3, padding=1)
+        self.conv3 = nn.Conv2d(32, 64, kernel_size=3, padding=1)
+
+        # 224x224 -> after 3 pool layers: 28x28
+        self.fc1 = nn.Linear(64 * 28 * 28, 128)
+        self.fc2 = nn.Linear(128, 1)  # binary output (logit)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        x = self.pool(F.relu(self.conv1(x)))
+        x = self.pool(F.relu(self.conv2(x)))
+        x = self.pool(F.relu(self.conv3(x)))
+        x = torch.flatten(x, 1)  # also valid for channels-last (quantized) tensors
+        x = F.relu(self.fc1(x))
+        return self.fc2(x)
+
+
+def build_model(arch: str) -> nn.Module:
+    """Create an untrained network for the given architecture name."""
+    if arch == "resnet18":
+        # torchvision.models imports every architecture; only pay for it here
+        from torchvision.models import resnet18
+
+        model = resnet18(weights=None)
+        model.fc = nn.Linear(model.fc.in_features, 1)
+        return model
+    if arch == "simple_cnn":
+        return SimpleCNN()
+    raise ValueError(f"Unknown model architecture: {arch!r}")
+
+
+class OnnxModel:
+    """
+    ONNX Runtime session with the same call convention as the PyTorch
+    models: takes a float32 NCHW tensor and returns a tensor of logits.
+    """
+
+    def __init__(self, path: str, num_threads: Optional[int] = None) -> None:
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ModelUnavailableError(
+                "ONNX models need onnxruntime: pip install onnxruntime"
+            )
+        # ONNX Runtime has its own thread pool; size it like torch's
+        # (the per-worker budget from src/serving.py) unless told otherwise
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads or torch.get_num_threads()
+        self.session = ort.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def eval(self) -> "OnnxModel":
+        return self
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        (logits,) = self.session.run(None, {self.input_name: batch.numpy()})
+        return torch.from_numpy(logits)
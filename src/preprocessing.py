@@ -0,0 +1,141 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+if TYPE_CHECKING:
+    import torch
+
+# Same filter torchvision's Resize applies to PIL images at training time
+RESAMPLE = Image.BILINEAR
+
+# Size and filter (PIL's resize default) of the color-check thumbnail
+THUMBNAIL_SIZE = 64
+THUMBNAIL_RESAMPLE = Image.BICUBIC
+
+
+@lru_cache(maxsize=None)
+def pin_memory() -> bool:
+    """Page-locked batches only help (and only work) with a CUDA device."""
+    import torch
+
+    return torch.cuda.is_available()
+
+
+class Preprocessor:
+    """
+    Image -> model-ready tensor, equivalent to build_transform(arch) but
+    with one resize per image and no intermediate tensors:
+
+      1. frame(): a single bilinear resize of the decoded RGB image
+         (ResNet18: short side 256; SimpleCNN: 224x224) into a uint8
+         HxWx3 array;
+      2. crop(): a view of that array, the model input (center 224x224);
+         thumbnail() separately shrinks the decoded image to 64x64 for
+         the color checks;
+      3. to_batch(): each crop is written straight into a preallocated
+         float32 NCHW batch (pinned when CUDA is available), then the
+         whole batch is scaled and normalized in place.
+    """
+
+    def __init__(
+        self,
+        input_size: int,
+        resize_short: Optional[int] = None,
+        mean: Optional[Sequence[float]] = None,
+        std: Optional[Sequence[float]] = None,
+    ) -> None:
+        self.input_size = input_size
+        self.resize_short = resize_short
+
+        # x / 255, then (x - mean) / std, folded into one multiply-subtract
+        mean = np.asarray(mean if mean is not None else (0.0, 0.0, 0.0), np.float32)
+        std = np.asarray(std if std is not None else (1.0, 1.0, 1.0), np.float32)
+        self._scale = (1.0 / (255.0 * std)).reshape(1, 3, 1, 1)
+        self._shift = (mean / std).reshape(1, 3, 1, 1)
+
+    def frame_size(self, width: int, height: int) -> Tuple[int, int]:
+        """(width, height) of the single resize for a width x height image."""
+        if self.resize_short is None:
+            return (self.input_size, self.input_size)
+        if width <= height:
+            # Same rounding as torchvision.transforms.Resize(int)
+            return (self.resize_short, int(self.resize_short * height / width))
+        return (int(self.resize_short * width / height), self.resize_short)
+
+    def frame(self, image: Image.Image) -> np.ndarray:
+        """Resize an RGB image once; returns the uint8 HxWx3 pixels."""
+        size = self.frame_size(*image.size)
+        if image.size != size:
+            image = image.resize(size, RESAMPLE)
+        return np.asarray(image)
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        """Center input_size x input_size view (torchvision CenterCrop offsets)."""
+        height, width = frame.shape[:2]
+        top = int(round((height - self.input_size) / 2.0))
+        left = int(round((width - self.input_size) / 2.0))
+        return frame[top : top + self.input_size, left : left + self.input_size]
+
+    @staticmethod
+    def thumbnail(image: Image.Image) -> np.ndarray:
+        """
+        THUMBNAIL_SIZE x THUMBNAIL_SIZE pixels of the decoded image for the
+        color checks, area-averaged exactly like the original
+        image.resize((64, 64)), so decisions do not depend on the
+        architecture's frame size.
+        """
+        return np.asarray(image.resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), THUMBNAIL_RESAMPLE))
+
+    def prepare(self, image: Image.Image) -> Tuple[np.ndarray, np.ndarray]:
+        """(model input, color-check thumbnail) for an RGB image."""
+        return self.crop(self.frame(image)), self.thumbnail(image)
+
+    def prepare_array(
+        self, pixels: np.ndarray
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        prepare() for uint8 HxW (grayscale) or HxWx3 (RGB) pixels. Arrays
+        already at the resize target are used as they are (no copy);
+        grayscale stays single-channel, to_batch() expands it, and has no
+        thumbnail (the color checks only apply to RGB).
+        """
+        height, width = pixels.shape[:2]
+        size = self.frame_size(width, height)
+        image = None
+        if (width, height) == size:
+            frame = pixels
+        else:
+            image = Image.fromarray(pixels)
+            frame = np.asarray(image.resize(size, RESAMPLE))
+        thumb = None
+        if pixels.ndim == 3:
+            thumb = self.thumbnail(image or Image.fromarray(pixels))
+        return self.crop(frame), thumb
+
+    def to_batch(
+        self, items: Sequence[Union[np.ndarray, Image.Image]]
+    ) -> "torch.Tensor":
+        """
+        Float32 NCHW batch from prepared crops (or PIL images, which are
+        prepared on the fly).
+        """
+        import torch
+
+        size = self.input_size
+        batch = torch.empty(
+            (len(items), 3, size, size), dtype=torch.float32, pin_memory=pin_memory()
+        )
+        out = batch.numpy()
+        for i, item in enumerate(items):
+            if isinstance(item, Image.Image):
+                item = self.crop(self.frame(item.convert("RGB")))
+            # HWC uint8 -> CHW float32 in a single strided copy; grayscale
+            # HW is broadcast to the three channels
+            source = item[None] if item.ndim == 2 else item.transpose(2, 0, 1)
+            np.copyto(out[i], source, casting="unsafe")
+        # In place on the tensor's memory, through its NumPy view
+        np.multiply(out, self._scale, out=out)
+        np.subtract(out, self._shift, out=out)
+        return batch
@@ -0,0 +1,336 @@
+"""
+On-demand profiling of a live worker.
+
+A capture runs for the next N prediction requests or T seconds, whichever
+comes first, and writes to PROFILE_DIR/<timestamp>-<pid>/:
+
+    stacks.folded    sampled Python stacks of every thread (flamegraph.pl,
+                     speedscope, ...), one "frame;frame;... count" per line
+    cprofile.pstats  deterministic profile of the classifier methods
+    cprofile.txt     its top functions by cumulative time
+    torch_ops.txt    torch.profiler operator totals over all forward passes
+    torch_trace_*.json  Chrome traces of the first few forward passes
+    summary.json     what was captured
+
+When no capture is running nothing is wrapped or sampled: the classifier
+methods are only replaced on the instances for the duration of a capture.
+"""
+
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Classifier methods wrapped with cProfile while a capture runs
+PROFILED_METHODS = ("decode_and_validate", "predict_batch", "predict_image_from_pil")
+
+# Forward passes exported as full Chrome traces (the rest are only totalled)
+TORCH_TRACES = 3
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a capture is requested while another one is running."""
+
+
+class StackSampler:
+    """Samples the Python stacks of all threads at a fixed interval."""
+
+    def __init__(self, interval_s: float = 0.005) -> None:
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name="profile-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_folded(self, path: Path) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Capture:
+    """One profiling run; see the module docstring for what it records."""
+
+    def __init__(
+        self,
+        classifiers: Sequence,
+        directory: Path,
+        max_requests: Optional[int],
+        max_seconds: Optional[float],
+        sample_interval_s: float,
+    ) -> None:
+        self.classifiers = list(classifiers)
+        self.directory = directory
+        self.max_requests = max_requests
+        self.max_seconds = max_seconds
+        self.requests = 0
+        self.started = time.monotonic()
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+        self.sampler = StackSampler(sample_interval_s)
+        self._local = threading.local()
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+        # torch.profiler only sees the thread that started it, so each
+        # forward pass is profiled on its own and the results are totalled
+        self._torch_lock = threading.Lock()
+        self._torch_ops: Dict[str, List[float]] = {}
+        self._torch_passes = 0
+
+    # -- wrapping -----------------------------------------------------------
+
+    def install(self) -> None:
+        for classifier in self.classifiers:
+            for name in PROFILED_METHODS:
+                original = getattr(classifier, name)
+                if name == "predict_batch":
+                    wrapped = self._wrap(self._with_torch_profiler(original))
+                else:
+                    wrapped = self._wrap(original)
+                setattr(classifier, name, wrapped)  # shadows the class method
+        self.sampler.start()
+
+    def uninstall(self) -> None:
+        for classifier in self.classifiers:
+            for name in PROFILED_METHODS:
+                classifier.__dict__.pop(name, None)
+        self.sampler.stop()
+
+    def _thread_profile(self) -> cProfile.Profile:
+        profile = getattr(self._local, "profile", None)
+        if profile is None:
+            profile = self._local.profile = cProfile.Profile()
+            self._local.depth = 0
+            with self._lock:
+                self._profiles.append(profile)
+        return profile
+
+    def _wrap(self, fn):
+        def profiled(*args, **kwargs):
+            profile = self._thread_profile()
+            # Nested profiled calls (predict -> predict_batch) share one run
+            self._local.depth += 1
+            if self._local.depth == 1:
+                profile.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._local.depth -= 1
+                if self._local.depth == 0:
+                    profile.disable()
+
+        return profiled
+
+    def _with_torch_profiler(self, fn):
+        from torch.profiler import ProfilerActivity, profile
+
+        def profiled(*args, **kwargs):
+            # One torch.profiler session per process at a time
+            if not self._torch_lock.acquire(blocking=False):
+                return fn(*args, **kwargs)
+            try:
+                with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as prof:
+                    result = fn(*args, **kwargs)
+                self._add_torch_pass(prof)
+                return result
+            finally:
+                self._torch_lock.release()
+
+        return profiled
+
+    def _add_torch_pass(self, prof) -> None:
+        index = self._torch_passes
+        self._torch_passes += 1
+        for event in prof.key_averages():
+            totals = self._torch_ops.setdefault(event.key, [0, 0.0, 0.0])
+            totals[0] += event.count
+            totals[1] += event.self_cpu_time_total
+            totals[2] += event.cpu_time_total
+        if index < TORCH_TRACES:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            prof.export_chrome_trace(str(self.directory / f"torch_trace_{index}.json"))
+
+    # -- results ------------------------------------------------------------
+
+    def write(self) -> dict:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = [p.name for p in self.directory.glob("torch_trace_*.json")]
+
+        self.sampler.write_folded(self.directory / "stacks.folded")
+        files.append("stacks.folded")
+
+        with self._lock:
+            profiles = list(self._profiles)
+        if profiles:
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(str(self.directory / "cprofile.pstats"))
+            text = io.StringIO()
+            pstats.Stats(str(self.directory / "cprofile.pstats"), stream=text).sort_stats(
+                "cumulative"
+            ).print_stats(50)
+            (self.directory / "cprofile.txt").write_text(text.getvalue())
+            files += ["cprofile.pstats", "cprofile.txt"]
+
+        if self._torch_ops:
+            rows = sorted(self._torch_ops.items(), key=lambda item: -item[1][1])
+            lines = [f"{'operator':<48} {'calls':>8} {'self ms':>10} {'total ms':>10}"]
+            for key, (count, self_us, total_us) in rows:
+                lines.append(
+                    f"{key[:48]:<48} {count:>8} {self_us / 1000:>10.2f} {total_us / 1000:>10.2f}"
+                )
+            (self.directory / "torch_ops.txt").write_text("\n".join(lines) + "\n")
+            files.append("torch_ops.txt")
+
+        summary = {
+            "started_at": self.started_at,
+            "duration_s": time.monotonic() - self.started,
+            "requests": self.requests,
+            "max_requests": self.max_requests,
+            "max_seconds": self.max_seconds,
+            "stack_samples": self.sampler.samples,
+            "forward_passes": self._torch_passes,
+            "pid": os.getpid(),
+            "files": sorted(files),
+        }
+        (self.directory / "summary.json").write_text(json.dumps(summary, indent=2))
+        return summary
+
+
+class Profiler:
+    """
+    Starts and stops captures on a set of classifiers. `active` is the only
+    thing the request path checks.
+    """
+
+    def __init__(
+        self,
+        classifiers: Sequence,
+        output_dir: str,
+        sample_interval_ms: float = 5.0,
+    ) -> None:
+        self.classifiers = classifiers
+        self.output_dir = Path(output_dir)
+        self.sample_interval_s = sample_interval_ms / 1000.0
+        self.active = False
+        self.last: Optional[dict] = None
+
+        self._capture: Optional[Capture] = None
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def start(
+        self, max_requests: Optional[int] = None, max_seconds: Optional[float] = None
+    ) -> dict:
+        """Begin a capture; at least one limit must be given."""
+        if not max_requests and not max_seconds:
+            raise ValueError("Give a number of requests and/or seconds to profile")
+        with self._lock:
+            if self._capture is not None:
+                raise ProfilerBusyError("A profile is already being captured")
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            capture = Capture(
+                self.classifiers,
+                self.output_dir / f"{stamp}-{os.getpid()}",
+                max_requests,
+                max_seconds,
+                self.sample_interval_s,
+            )
+            capture.install()
+            self._capture = capture
+            self.active = True
+            if max_seconds:
+                self._timer = threading.Timer(max_seconds, self.stop)
+                self._timer.daemon = True
+                self._timer.start()
+        logger.warning(
+            "Profiling the next %s request(s) / %s s into %s",
+            max_requests or "any number of",
+            max_seconds or "unlimited",
+            capture.directory,
+        )
+        return self.status()
+
+    def request_finished(self) -> None:
+        """Called by the routes after each request while `active`."""
+        capture = self._capture
+        if capture is None:
+            return
+        with self._lock:
+            capture.requests += 1
+            done = capture.max_requests and capture.requests >= capture.max_requests
+        if done:
+            # Writing the files takes a moment; keep it off the event loop
+            threading.Thread(target=self.stop, name="profile-writer").start()
+
+    def stop(self) -> Optional[dict]:
+        """End the capture (if any) and write its files; returns its summary."""
+        with self._lock:
+            capture, self._capture = self._capture, None
+            self.active = False
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if capture is None:
+            return None
+        capture.uninstall()
+        summary = capture.write()
+        summary["directory"] = str(capture.directory)
+        self.last = summary
+        logger.warning("Profile written to %s", capture.directory)
+        return summary
+
+    def status(self) -> dict:
+        capture = self._capture
+        running = None
+        if capture is not None:
+            running = {
+                "directory": str(capture.directory),
+                "requests": capture.requests,
+                "max_requests": capture.max_requests,
+                "max_seconds": capture.max_seconds,
+                "elapsed_s": time.monotonic() - capture.started,
+            }
+        return {"active": capture is not None, "running": running, "last": self.last}
@@ -0,0 +1,284 @@
+"""
+Offline bulk scoring of MRI slices.
+
+Walks a directory tree (e.g. data_raw/yes, data_raw/no), decodes and
+validates images in a pool of worker processes, runs the classifier in
+batches in the main process and appends results to a CSV file or a
+Parquet dataset after every batch. Re-running with --resume skips every
+image already present in the output, so an interrupted backfill picks up
+where it stopped.
+
+    python -m src.score data_raw --output reports/scores.csv
+    python -m src.score data_raw --output reports/scores.parquet --resume
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Set, Tuple
+
+from .dataset import CLASS_TO_LABEL
+from .inference import BrainTumorClassifier, InvalidImageError, NotBrainMRIError
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+COLUMNS = ["path", "true_label", "label", "label_name", "probability", "error"]
+
+DEFAULT_MODEL_PATH = str(
+    Path(__file__).resolve().parent.parent / "models" / "resnet18_brain_mri_mps.pth"
+)
+
+# Per-process classifier used by the decode workers (no model is loaded)
+_worker_classifier: Optional[BrainTumorClassifier] = None
+
+
+def iter_images(root: str) -> Iterator[str]:
+    """Yield image paths under `root` in a stable (sorted) order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.startswith("."):
+                continue
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(dirpath, name)
+
+
+def true_label(path: str) -> Optional[int]:
+    """Ground-truth label from a yes/no parent folder, if there is one."""
+    return CLASS_TO_LABEL.get(os.path.basename(os.path.dirname(path)).lower())
+
+
+def _init_worker(arch: str) -> None:
+    global _worker_classifier
+    _worker_classifier = BrainTumorClassifier(arch=arch)
+
+
+def _decode(path: str):
+    """Worker: read, decode and validate one file. Returns (path, image, error)."""
+    try:
+        with open(path, "rb") as f:
+            image = _worker_classifier.decode_and_validate(f.read())
+        return path, image, None
+    except (InvalidImageError, NotBrainMRIError) as e:
+        return path, None, str(e)
+    except OSError as e:
+        return path, None, f"Could not read file: {e}"
+
+
+class CsvSink:
+    """Append-only CSV output; flushed after every batch."""
+
+    def __init__(self, path: str, resume: bool) -> None:
+        self.path = path
+        exists = resume and os.path.isfile(path) and os.path.getsize(path) > 0
+        self._file = open(path, "a" if exists else "w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=COLUMNS)
+        if not exists:
+            self._writer.writeheader()
+
+    @staticmethod
+    def done_paths(path: str) -> Set[str]:
+        if not os.path.isfile(path):
+            return set()
+        with open(path, newline="") as f:
+            return {row["path"] for row in csv.DictReader(f)}
+
+    def write(self, rows: List[dict]) -> None:
+        self._writer.writerows(rows)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetSink:
+    """
+    Parquet dataset written as one part file per batch, so every completed
+    batch is durable without rewriting earlier ones. Needs pyarrow.
+    """
+
+    def __init__(self, path: str, resume: bool) -> None:
+        pa, pq = self._pyarrow()
+        self._pa, self._pq = pa, pq
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        if not resume:
+            for name in os.listdir(path):
+                if name.startswith("part-") and name.endswith(".parquet"):
+                    os.remove(os.path.join(path, name))
+        self._next_part = len(self._parts(path))
+
+    @staticmethod
+    def _pyarrow():
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit(
+                "Parquet output needs pyarrow: pip install pyarrow (or write .csv)"
+            )
+        return pa, pq
+
+    @staticmethod
+    def _parts(path: str) -> List[str]:
+        if not os.path.isdir(path):
+            return []
+        return sorted(
+            os.path.join(path, name)
+            for name in os.listdir(path)
+            if name.startswith("part-") and name.endswith(".parquet")
+        )
+
+    @classmethod
+    def done_paths(cls, path: str) -> Set[str]:
+        parts = cls._parts(path)
+        if not parts:
+            return set()
+        _, pq = cls._pyarrow()
+        done = set()
+        for part in parts:
+            done.update(pq.read_table(part, columns=["path"]).column("path").to_pylist())
+        return done
+
+    def write(self, rows: List[dict]) -> None:
+        table = self._pa.Table.from_pylist(rows)
+        part = os.path.join(self.path, f"part-{self._next_part:05d}.parquet")
+        tmp = part + ".tmp"
+        self._pq.write_table(table, tmp)
+        os.replace(tmp, part)  # a part is either complete or absent
+        self._next_part += 1
+
+    def close(self) -> None:
+        pass
+
+
+def _sink_class(output: str):
+    return ParquetSink if output.lower().endswith(".parquet") else CsvSink
+
+
+def _row(path: str, result: Optional[dict], error: Optional[str]) -> dict:
+    row = {"path": path, "true_label": true_label(path), "error": error}
+    if result is not None:
+        row.update(result)
+    return row
+
+
+def score(
+    root: str,
+    output: str,
+    model_path: str = DEFAULT_MODEL_PATH,
+    batch_size: int = 32,
+    workers: Optional[int] = None,
+    resume: bool = False,
+    classifier: Optional[BrainTumorClassifier] = None,
+) -> Tuple[int, int]:
+    """
+    Score every image under `root` into `output`.
+    Returns (number of images scored now, number skipped as already done).
+    """
+    classifier = classifier or BrainTumorClassifier(model_path=model_path)
+    classifier.load()  # fail fast before spinning up workers
+
+    sink_class = _sink_class(output)
+    done = sink_class.done_paths(output) if resume else set()
+    paths = [p for p in iter_images(root) if p not in done]
+    skipped = len(done)
+
+    workers = workers or os.cpu_count() or 1
+    # Keep a few batches decoded ahead of the model, but never the whole tree
+    prefetch = max(batch_size * 2, workers * 2)
+
+    sink = sink_class(output, resume)
+    scored = 0
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(classifier.arch,)
+        ) as pool:
+            pending = deque()
+            todo = iter(paths)
+
+            def refill():
+                while len(pending) < prefetch:
+                    path = next(todo, None)
+                    if path is None:
+                        return
+                    pending.append(pool.submit(_decode, path))
+
+            refill()
+            while pending:
+                decoded = []
+                while pending and len(decoded) < batch_size:
+                    decoded.append(pending.popleft().result())
+                    refill()
+
+                ok = [(path, image) for path, image, error in decoded if image is not None]
+                results = classifier.predict_batch([image for _, image in ok])
+                by_path = {path: result for (path, _), result in zip(ok, results)}
+
+                sink.write(
+                    [_row(path, by_path.get(path), error) for path, _, error in decoded]
+                )
+                scored += len(decoded)
+
+                rate = scored / (time.perf_counter() - started)
+                print(
+                    f"scored {scored}/{len(paths)} ({rate:.1f} img/s)",
+                    file=sys.stderr,
+                )
+    finally:
+        sink.close()
+
+    return scored, skipped
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.score",
+        description="Bulk-score a directory of MRI slices to CSV or Parquet.",
+    )
+    parser.add_argument("root", help="Directory to walk, e.g. data_raw")
+    parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        help="Output .csv file or .parquet dataset directory",
+    )
+    parser.add_argument("--model-path", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Decode processes (default: number of CPU cores)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip images already present in the output instead of overwriting it",
+    )
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        parser.error(f"not a directory: {args.root}")
+
+    scored, skipped = score(
+        args.root,
+        args.output,
+        model_path=args.model_path,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        resume=args.resume,
+    )
+    print(f"done: {scored} scored, {skipped} already in {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import os
+import sys
+from typing import Optional
+
+# Set by configure_torch_threads() in each gunicorn worker
+_torch_threads: Optional[int] = None
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on (respects container CPU affinity)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS
+        return os.cpu_count() or 1
+
+
+def default_workers(cpus: Optional[int] = None) -> int:
+    """Gunicorn worker count when WEB_CONCURRENCY is not set."""
+    cpus = cpus or available_cpus()
+    return max(1, min(cpus, 4))
+
+
+def torch_threads_per_worker(workers: int, cpus: Optional[int] = None) -> int:
+    """
+    Intra-op threads per worker so that workers x threads never exceeds the
+    number of cores (TORCH_NUM_THREADS overrides the computed value).
+    """
+    configured = os.environ.get("TORCH_NUM_THREADS")
+    if configured:
+        return max(1, int(configured))
+    cpus = cpus or available_cpus()
+    return max(1, cpus // max(1, workers))
+
+
+def limit_thread_env(threads: int) -> None:
+    """
+    Cap OpenMP / MKL pools through the environment. Must run before torch
+    is imported to take effect for those libraries.
+    """
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(name, str(threads))
+
+
+def configure_torch_threads(threads: int) -> None:
+    """
+    Apply the per-worker thread budget to torch: at once if it is already
+    imported, otherwise when src/models.py imports it (see
+    apply_torch_threads), so that forking a worker does not pay for
+    importing torch before it can answer /health.
+    """
+    global _torch_threads
+    _torch_threads = threads
+    if "torch" in sys.modules:
+        apply_torch_threads()
+
+
+def apply_torch_threads() -> None:
+    """Set torch's thread pools to the budget from configure_torch_threads()."""
+    if _torch_threads is None:
+        return
+    import torch
+
+    torch.set_num_threads(_torch_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only allowed before any inter-op work has started in this process
+        pass
@@ -0,0 +1,283 @@
+"""
+Study-level scoring of 3D MRI volumes.
+
+A volume is memory-mapped from disk (.npy, or .nii / .nii.gz when the
+optional nibabel package is installed) and only the slices that are
+scored are ever read. Slices are visited from the middle of the volume
+outwards, every `stride`-th one, mapped to uint8 one at a time (through
+an intensity window taken from the central slices) and classified in
+batches. The study probability is the mean tumor
+probability of the `top_k` most suspicious slices; with early exit,
+scoring stops after the first batch that brings the count of slices at
+or above `confidence` to `top_k`.
+
+Slices are cheapest to read along the volume's outermost storage axis:
+axis 0 of a C-order .npy (slices, H, W), axis 2 of a NIfTI file.
+
+    python -m src.study volume.npy --stride 2
+    python -m src.study scan.nii.gz --axis 2 --no-early-exit
+"""
+
+import argparse
+import heapq
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .inference import (
+    LABEL_NAMES,
+    BrainTumorClassifier,
+    InvalidImageError,
+    ModelUnavailableError,
+    tumor_probability,
+)
+
+VOLUME_EXTENSIONS = (".npy", ".nii", ".nii.gz")
+
+# Slices whose brightest pixel is at most this (after normalization) are
+# background above / below the head and are not scored
+BLANK_MAX_INTENSITY = 8
+
+# Intensity percentiles mapped to 0 / 255 when normalizing slices, taken
+# over the WINDOW_SLICES central slices
+NORMALIZE_PERCENTILES = (0.5, 99.5)
+WINDOW_SLICES = 5
+
+DEFAULT_MODEL_PATH = str(
+    Path(__file__).resolve().parent.parent / "models" / "resnet18_brain_mri_mps.pth"
+)
+
+
+def _bad_volume(message: str, reason: str = "bad_volume") -> InvalidImageError:
+    return InvalidImageError(message, reason)
+
+
+def volume_suffix(path: str) -> str:
+    """The volume extension of `path` (.npy, .nii or .nii.gz), or ""."""
+    name = os.path.basename(path).lower()
+    for suffix in VOLUME_EXTENSIONS[::-1]:  # .nii.gz before .nii
+        if name.endswith(suffix):
+            return suffix
+    return ""
+
+
+def open_volume(path: str):
+    """
+    Open a 3D volume without reading its voxels. Returns an object that
+    supports `.shape` and indexing (a memory-mapped ndarray for .npy and
+    uncompressed .nii; nibabel's lazy proxy for .nii.gz).
+    """
+    suffix = volume_suffix(path)
+    try:
+        if suffix == ".npy":
+            volume = np.load(path, mmap_mode="r", allow_pickle=False)
+        elif suffix in (".nii", ".nii.gz"):
+            try:
+                import nibabel
+            except ImportError:
+                raise _bad_volume(
+                    "NIfTI volumes need nibabel: pip install nibabel",
+                    "unsupported_volume",
+                )
+            volume = nibabel.load(path, mmap=True).dataobj
+        else:
+            raise _bad_volume(
+                "Unsupported volume format; send .npy, .nii or .nii.gz",
+                "unsupported_volume",
+            )
+    except InvalidImageError:
+        raise
+    except Exception as e:
+        raise _bad_volume(f"Could not read volume: {e}")
+
+    if len(volume.shape) != 3 or min(volume.shape) < 1:
+        raise _bad_volume(f"Expected a 3D volume, got shape {tuple(volume.shape)}")
+    return volume
+
+
+def default_axis(path: str) -> int:
+    """Slice axis: NumPy stacks are (slices, H, W); NIfTI is (x, y, z)."""
+    return 0 if volume_suffix(path) == ".npy" else 2
+
+
+def slice_order(count: int, stride: int = 1) -> List[int]:
+    """Every `stride`-th slice index, from the middle of the volume outwards."""
+    middle = count // 2
+    below = list(range(middle, -1, -stride))
+    above = list(range(middle + stride, count, stride))
+    order = []
+    for i in range(max(len(below), len(above))):
+        if i < len(below):
+            order.append(below[i])
+        if i < len(above):
+            order.append(above[i])
+    return order
+
+
+def intensity_window(volume, axis: int, indices: List[int]) -> Tuple[float, float]:
+    """
+    (low, high) intensities mapped to 0 / 255 for the whole volume, from
+    the NORMALIZE_PERCENTILES of the first few slices in `indices` (the
+    central ones), so background slices stay dark and can be skipped.
+    """
+    if volume_dtype(volume) == np.uint8:
+        return 0.0, 255.0
+    lows, highs = [], []
+    for index in indices[:WINDOW_SLICES]:
+        pixels = np.asarray(_read_slice(volume, axis, index), dtype=np.float32)
+        low, high = np.percentile(pixels, NORMALIZE_PERCENTILES)
+        lows.append(low)
+        highs.append(high)
+    return float(min(lows)), float(max(highs))
+
+
+def to_uint8(pixels: np.ndarray, low: float, high: float) -> np.ndarray:
+    """Map one slice to uint8 through the volume's intensity window."""
+    if pixels.dtype == np.uint8 and (low, high) == (0.0, 255.0):
+        return np.ascontiguousarray(pixels)
+    if high <= low:
+        return np.zeros(pixels.shape, dtype=np.uint8)
+    scaled = (np.asarray(pixels, dtype=np.float32) - low) * (255.0 / (high - low))
+    return np.clip(scaled, 0, 255, out=scaled).astype(np.uint8)
+
+
+def volume_dtype(volume) -> np.dtype:
+    """Dtype of the slices read from `volume` (nibabel may scale them)."""
+    if (getattr(volume, "slope", 1.0), getattr(volume, "inter", 0.0)) != (1.0, 0.0):
+        return np.dtype(np.float64)
+    return np.dtype(volume.dtype)
+
+
+def _read_slice(volume, axis: int, index: int) -> np.ndarray:
+    selector = [slice(None)] * 3
+    selector[axis] = index
+    return np.asarray(volume[tuple(selector)])
+
+
+def iter_slices(volume, axis: int, indices: List[int]) -> Iterator[tuple]:
+    """Yield (index, uint8 HxW slice), reading one slice at a time."""
+    low, high = intensity_window(volume, axis, indices)
+    for index in indices:
+        yield index, to_uint8(_read_slice(volume, axis, index), low, high)
+
+
+def score_study(
+    classifier: BrainTumorClassifier,
+    volume,
+    axis: int = 0,
+    stride: int = 1,
+    batch_size: int = 16,
+    top_k: int = 3,
+    confidence: float = 0.9,
+    early_exit: bool = True,
+) -> dict:
+    """
+    Score a volume slice by slice and aggregate a study-level result
+    (same label / label_name / probability fields as a slice prediction).
+    """
+    if not 0 <= axis < 3:
+        raise _bad_volume(f"axis must be 0, 1 or 2, got {axis}")
+    if stride < 1 or batch_size < 1 or top_k < 1:
+        raise _bad_volume("stride, batch_size and top_k must be positive")
+
+    count = volume.shape[axis]
+    indices = slice_order(count, stride)
+
+    scores = []  # (p_tumor, index)
+    blank = 0
+    confident = 0
+    stopped_early = False
+    pending, pending_indices = [], []
+
+    def flush():
+        nonlocal confident
+        for index, result in zip(pending_indices, classifier.predict_batch(pending)):
+            p_tumor = tumor_probability(result)
+            scores.append((p_tumor, index))
+            if p_tumor >= confidence:
+                confident += 1
+        pending.clear()
+        pending_indices.clear()
+
+    for index, pixels in iter_slices(volume, axis, indices):
+        if int(pixels.max()) <= BLANK_MAX_INTENSITY:
+            blank += 1
+            continue
+        # Volume slices skip the single-upload plausibility rules (size,
+        # color): they are known to be MRI, only the resize applies
+        model_input, _ = classifier.preprocessor.prepare_array(pixels)
+        pending.append(model_input)
+        pending_indices.append(index)
+        if len(pending) >= batch_size:
+            flush()
+            if early_exit and confident >= top_k:
+                stopped_early = True
+                break
+    if pending:
+        flush()
+
+    if not scores:
+        raise _bad_volume("No non-blank slices in the volume", "blank_volume")
+
+    top = heapq.nlargest(top_k, scores)
+    p_tumor = float(np.mean([p for p, _ in top]))
+    label = 1 if p_tumor >= 0.5 else 0
+    return {
+        "label": label,
+        "label_name": LABEL_NAMES[label],
+        "probability": p_tumor if label == 1 else 1.0 - p_tumor,
+        "slices_total": count,
+        "slices_scored": len(scores),
+        "slices_blank": blank,
+        "early_exit": stopped_early,
+        "top_slices": [{"index": i, "tumor_probability": p} for p, i in top],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.study",
+        description="Score a 3D MRI volume (.npy / .nii / .nii.gz) as one study.",
+    )
+    parser.add_argument("volume", help="Path to the volume")
+    parser.add_argument("--model-path", default=DEFAULT_MODEL_PATH)
+    parser.add_argument(
+        "--axis", type=int, default=None, help="Slice axis (default: 0 for .npy, 2 for NIfTI)"
+    )
+    parser.add_argument("--stride", type=int, default=1, help="Score every n-th slice")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--confidence", type=float, default=0.9)
+    parser.add_argument(
+        "--no-early-exit",
+        dest="early_exit",
+        action="store_false",
+        help="Score every sampled slice",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        volume = open_volume(args.volume)
+        result = score_study(
+            BrainTumorClassifier(model_path=args.model_path),
+            volume,
+            axis=default_axis(args.volume) if args.axis is None else args.axis,
+            stride=args.stride,
+            batch_size=args.batch_size,
+            top_k=args.top_k,
+            confidence=args.confidence,
+            early_exit=args.early_exit,
+        )
+    except (InvalidImageError, ModelUnavailableError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import io
+from typing import BinaryIO, Dict
+
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse
+
+from .metrics import REJECTIONS
+
+# Largest image accepted by the upload endpoints
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # 10 MB
+
+# Room for multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+CHUNK_SIZE = 64 * 1024
+
+TOO_LARGE_MESSAGE = "File is too large. Please upload a brain MRI image under 10 MB."
+
+
+class UploadTooLargeError(HTTPException):
+    """Raised as soon as an upload is known to exceed its size limit."""
+
+    def __init__(self, message: str = TOO_LARGE_MESSAGE) -> None:
+        super().__init__(status_code=413, detail=message)
+
+
+def too_large_response(message: str = TOO_LARGE_MESSAGE) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=413)
+
+
+async def read_upload(
+    file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES
+) -> bytearray:
+    """
+    Read an uploaded file in chunks into one preallocated buffer.
+
+    Raises UploadTooLargeError as soon as more than `max_bytes` have been
+    seen, so an oversized upload never costs more than `max_bytes` of memory.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError()
+
+    # The multipart parser normally knows the exact size; otherwise reserve
+    # the limit plus one byte so an overflow can still be detected.
+    capacity = file.size if file.size is not None else max_bytes + 1
+    buffer = bytearray(capacity)
+    view = memoryview(buffer)
+
+    length = 0
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        end = length + len(chunk)
+        if end > max_bytes or end > capacity:
+            raise UploadTooLargeError()
+        view[length:end] = chunk
+        length = end
+
+    view.release()
+    if length < capacity:
+        del buffer[length:]
+    return buffer
+
+
+async def read_body(request: Request, max_bytes: int = MAX_UPLOAD_BYTES) -> bytearray:
+    """
+    read_upload() for a raw (non-multipart) request body: streamed into one
+    buffer sized from Content-Length when the client sent it.
+    """
+    try:
+        declared = int(request.headers.get("content-length", ""))
+    except ValueError:
+        declared = None
+    if declared is not None and declared > max_bytes:
+        raise UploadTooLargeError()
+
+    capacity = declared if declared is not None else max_bytes + 1
+    buffer = bytearray(capacity)
+    view = memoryview(buffer)
+
+    length = 0
+    async for chunk in request.stream():
+        end = length + len(chunk)
+        if end > max_bytes or end > capacity:
+            raise UploadTooLargeError()
+        view[length:end] = chunk
+        length = end
+
+    view.release()
+    if length < capacity:
+        del buffer[length:]
+    return buffer
+
+
+def read_file(fileobj: BinaryIO, max_bytes: int = MAX_UPLOAD_BYTES) -> bytearray:
+    """
+    Blocking counterpart of read_upload() for a seekable file object:
+    the size is checked first, then the data is read into one buffer.
+    """
+    size = fileobj.seek(0, io.SEEK_END)
+    if size > max_bytes:
+        raise UploadTooLargeError()
+    fileobj.seek(0)
+
+    buffer = bytearray(size)
+    length = fileobj.readinto(buffer)
+    if length < size:
+        del buffer[length:]
+    return buffer
+
+
+def detach_upload(upload: UploadFile) -> BinaryIO:
+    """
+    Take ownership of an upload's underlying file.
+
+    FastAPI closes uploads as soon as the endpoint returns, which is too
+    early for streaming responses that keep reading them. The caller must
+    close the returned file itself.
+    """
+    fileobj = upload.file
+    upload.file = io.BytesIO()
+    return fileobj
+
+
+class BodySizeLimitMiddleware:
+    """
+    ASGI middleware that caps request bodies for selected paths.
+
+    Requests whose Content-Length already exceeds the limit are answered
+    with 413 before any of the body is read. Bodies without (or with a
+    lying) Content-Length are counted while they stream in and aborted at
+    the limit, before the multipart parser has buffered them.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]) -> None:
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            return await self.app(scope, receive, send)
+
+        limit = self.limits.get(scope["path"])
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    break
+                if declared > limit:
+                    REJECTIONS.inc(error="UploadTooLargeError", reason="upload_too_large")
+                    return await too_large_response()(scope, receive, send)
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise UploadTooLargeError()
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -1,4 +1,6 @@
 #!/bin/bash
 
-# Start the app using Gunicorn with Uvicorn worker
-gunicorn -k uvicorn.workers.UvicornWorker -w 1 -b 0.0.0.0:8000 src.api:app
\ No newline at end of file
+# Start the app using Gunicorn with Uvicorn workers.
+# Worker and thread counts are derived from the available cores in
+# gunicorn.conf.py; override with WEB_CONCURRENCY / TORCH_NUM_THREADS.
+gunicorn -c gunicorn.conf.py src.api:app
@@ -0,0 +1,156 @@
+"""
+Opt-in timing suite for the request pipeline.
+
+    RUN_BENCHMARKS=1 python -m pytest -q tests/benchmarks
+
+Every measured stage is recorded (one JSON line per run) in
+BENCHMARK_HISTORY (default reports/benchmark_history.jsonl). A stage fails
+when its median exceeds its budget in thresholds.json, or is more than
+`max_regression` times (and `min_regression_ms` slower than) its median
+over the last `baseline_runs` runs recorded on the same machine. Failed
+runs are not added to the history.
+"""
+
+import json
+import os
+import platform
+import statistics
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+import torch
+
+ENABLED = os.environ.get("RUN_BENCHMARKS") == "1"
+
+ROOT = Path(__file__).resolve().parent.parent.parent
+THRESHOLDS_PATH = Path(__file__).resolve().parent / "thresholds.json"
+HISTORY_PATH = Path(
+    os.environ.get("BENCHMARK_HISTORY", ROOT / "reports" / "benchmark_history.jsonl")
+)
+
+# Keep repeating a stage until this much time was spent (or MAX_REPEATS)
+MIN_TIME_S = float(os.environ.get("BENCHMARK_MIN_TIME_S", "0.5"))
+MIN_REPEATS = 5
+MAX_REPEATS = 200
+
+
+def machine() -> dict:
+    """What a run's numbers are comparable across."""
+    return {
+        "node": platform.node(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+    }
+
+
+def load_history(path: Path = HISTORY_PATH) -> list:
+    if not path.is_file():
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class Bench:
+    """Times stages, checks them against thresholds and keeps the results."""
+
+    def __init__(self, thresholds: dict, history: list) -> None:
+        self.machine = machine()
+        self.budgets = thresholds.get("budgets_ms", {})
+        self.max_regression = thresholds.get("max_regression", 1.5)
+        # Sub-millisecond stages jitter by more than any sensible ratio
+        self.min_regression_ms = thresholds.get("min_regression_ms", 0.5)
+        runs = [run for run in history if run.get("machine") == self.machine]
+        self.baseline_runs = runs[-thresholds.get("baseline_runs", 5) :]
+        self.results = {}
+
+    def baseline(self, stage: str):
+        medians = [
+            run["stages"][stage]["median_ms"]
+            for run in self.baseline_runs
+            if stage in run["stages"]
+        ]
+        return statistics.median(medians) if medians else None
+
+    def __call__(self, stage: str, fn, *args, per: int = 1, warmup: int = 2) -> dict:
+        """
+        Time `fn(*args)`; `per` divides the result, e.g. per-image time for
+        a batch. Fails the calling test if the stage regressed.
+        """
+        for _ in range(warmup):
+            fn(*args)
+        timings = []
+        started = time.perf_counter()
+        while len(timings) < MAX_REPEATS and (
+            len(timings) < MIN_REPEATS or time.perf_counter() - started < MIN_TIME_S
+        ):
+            t0 = time.perf_counter()
+            fn(*args)
+            timings.append((time.perf_counter() - t0) * 1000.0 / per)
+
+        timings.sort()
+        result = {
+            "median_ms": statistics.median(timings),
+            "p95_ms": timings[min(len(timings) - 1, int(0.95 * len(timings)))],
+            "min_ms": timings[0],
+            "repeats": len(timings),
+        }
+        self.results[stage] = result
+
+        budget = self.budgets.get(stage)
+        if budget is not None:
+            assert result["median_ms"] <= budget, (
+                f"{stage}: median {result['median_ms']:.2f} ms exceeds budget {budget} ms"
+            )
+        baseline = self.baseline(stage)
+        if baseline is not None:
+            limit = max(baseline * self.max_regression, baseline + self.min_regression_ms)
+            assert result["median_ms"] <= limit, (
+                f"{stage}: median {result['median_ms']:.2f} ms is more than "
+                f"{self.max_regression}x the baseline {baseline:.2f} ms"
+            )
+        return result
+
+
+_bench = None
+
+
+@pytest.fixture(scope="session")
+def bench():
+    if not ENABLED:
+        pytest.skip("benchmarks are opt-in: set RUN_BENCHMARKS=1")
+    global _bench
+    if _bench is None:
+        with open(THRESHOLDS_PATH) as f:
+            thresholds = json.load(f)
+        _bench = Bench(thresholds, load_history())
+    return _bench
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus):
+    if _bench is None or not _bench.results:
+        return
+    # Only passing runs become part of the baseline for later runs
+    saved = exitstatus == 0
+    if saved:
+        run = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "machine": _bench.machine,
+            "stages": _bench.results,
+        }
+        HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(HISTORY_PATH, "a") as f:
+            f.write(json.dumps(run) + "\n")
+
+    where = f"appended to {HISTORY_PATH}" if saved else "not saved: run failed"
+    terminalreporter.write_sep("-", f"benchmarks ({where})")
+    width = max(len(stage) for stage in _bench.results)
+    terminalreporter.write_line(f"{'stage':<{width}}  median ms   p95 ms")
+    for stage, result in _bench.results.items():
+        terminalreporter.write_line(
+            f"{stage:<{width}}  {result['median_ms']:9.2f}  {result['p95_ms']:7.2f}"
+        )
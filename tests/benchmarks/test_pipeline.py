@@ -0,0 +1,103 @@
+import io
+
+import numpy as np
+import pytest
+import torch
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from src import api
+from src.inference import INPUT_SIZE, BrainTumorClassifier, build_model
+from tests.helpers import make_mri_like
+
+SIZES = [256, 512, 1024]
+FORMATS = ["PNG", "JPEG"]
+
+
+def synthetic_slice(size: int) -> Image.Image:
+    """MRI-like disc with noise, so codecs do realistic amounts of work."""
+    rng = np.random.default_rng(size)
+    pixels = np.asarray(make_mri_like(size=size)).astype(np.int16)
+    noise = rng.normal(0, 12, size=(size, size, 1)).astype(np.int16)
+    return Image.fromarray(np.clip(pixels + noise, 0, 255).astype(np.uint8))
+
+
+def encode(image: Image.Image, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, format=fmt, **({"quality": 90} if fmt == "JPEG" else {}))
+    return buf.getvalue()
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    torch.manual_seed(0)
+    # Untrained weights: the cost of a forward pass does not depend on them
+    return BrainTumorClassifier(model=build_model("resnet18"))
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+@pytest.mark.parametrize("size", SIZES)
+def test_header_parse(bench, classifier, fmt, size):
+    data = encode(synthetic_slice(size), fmt)
+
+    def parse():
+        classifier._validate_header(Image.open(io.BytesIO(data)))
+
+    bench(f"header/{fmt.lower()}/{size}", parse)
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+@pytest.mark.parametrize("size", SIZES)
+def test_decode(bench, classifier, fmt, size):
+    data = encode(synthetic_slice(size), fmt)
+    bench(f"decode/{fmt.lower()}/{size}", classifier.decode_validated, data)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_validate_image(bench, classifier, size):
+    image = synthetic_slice(size)
+    bench(f"validate/{size}", classifier._validate_image, image)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_preprocess(bench, classifier, size):
+    image = synthetic_slice(size)
+    bench(f"preprocess/{size}", classifier.preprocessor.prepare, image)
+
+
+@pytest.mark.parametrize("batch_size", [1, 8, 32])
+def test_to_batch(bench, classifier, batch_size):
+    prepared = [classifier.decode_and_validate(encode(synthetic_slice(256), "PNG"))]
+    bench(
+        f"to_batch/{batch_size}",
+        classifier.preprocessor.to_batch,
+        prepared * batch_size,
+        per=batch_size,
+    )
+
+
+@pytest.mark.parametrize("batch_size", [1, 8, 32])
+def test_inference(bench, classifier, batch_size):
+    model = classifier.load()
+    batch = torch.randn(batch_size, 3, INPUT_SIZE, INPUT_SIZE)
+
+    def forward():
+        with torch.inference_mode():
+            model(batch)
+
+    bench(f"inference/resnet18/{batch_size}", forward, per=batch_size)
+
+
+@pytest.mark.parametrize("size", [256, 512])
+def test_predict_end_to_end(bench, classifier, monkeypatch, size):
+    monkeypatch.setattr(api.classifier, "_model", classifier.load())
+    files = {"file": ("scan.png", encode(synthetic_slice(size), "PNG"), "image/png")}
+    client = TestClient(api.app)
+
+    def post():
+        api.prediction_cache.clear()  # time the full pipeline, not cache hits
+        response = client.post("/predict", files=files)
+        assert response.status_code == 200
+
+    bench(f"e2e/predict/png/{size}", post)
+    api.prediction_cache.clear()
@@ -0,0 +1,18 @@
+import io
+
+from PIL import Image, ImageDraw
+
+
+def make_mri_like(size=256, shade=120):
+    """Grayscale disc on a black background, roughly like an axial slice."""
+    image = Image.new("L", (size, size), 0)
+    draw = ImageDraw.Draw(image)
+    margin = size // 8
+    draw.ellipse((margin, margin, size - margin, size - margin), fill=shade)
+    return image.convert("RGB")
+
+
+def to_png(image):
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
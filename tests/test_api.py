@@ -1,6 +1,18 @@
+import asyncio
+import io
+import json
+import time
+import zipfile
+
+import httpx
+import numpy as np
+import pytest
 from fastapi.testclient import TestClient
 
+from src import api
 from src.api import app
+from src.inference import SimpleCNN
+from tests.helpers import make_mri_like, to_png
 
 
 client = TestClient(app)
@@ -32,4 +44,339 @@ def test_health_endpoint():
     """Ensure the health check endpoint works."""
     response = client.get("/health")
     assert response.status_code == 200
-    assert response.json() == {"status": "ok"}
\ No newline at end of file
+    assert response.json() == {"status": "ok"}
+
+
+def test_stats_endpoint():
+    """Batching metrics are exposed for tuning."""
+    response = client.get("/stats")
+    assert response.status_code == 200
+    assert "batch_size_distribution" in response.json()["batching"]
+
+
+@pytest.fixture
+def loaded_model(monkeypatch):
+    """Serve predictions from an untrained SimpleCNN instead of a checkpoint."""
+    monkeypatch.setattr(api.classifier, "_model", SimpleCNN().eval())
+    api.prediction_cache.clear()
+    yield
+    api.prediction_cache.clear()
+
+
+def test_predict_returns_model_output(loaded_model):
+    files = {"file": ("scan.png", to_png(make_mri_like()), "image/png")}
+    response = client.post("/predict", files=files)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["filename"] == "scan.png"
+    assert data["label_name"] in ("tumor", "no_tumor")
+    assert 0.5 <= data["probability"] <= 1.0
+
+
+def test_predict_rejects_non_mri(loaded_model):
+    files = {"file": ("tiny.png", to_png(make_mri_like(size=64)), "image/png")}
+    response = client.post("/predict", files=files)
+    assert response.status_code == 400
+    assert "too small" in response.json()["error"]
+
+
+def test_predict_applies_backpressure(loaded_model, monkeypatch):
+    """A full executor queue answers 429 with Retry-After instead of queuing."""
+    monkeypatch.setattr(api.executor, "_pending", api.executor.capacity)
+    files = {"file": ("scan.png", to_png(make_mri_like()), "image/png")}
+    response = client.post("/predict", files=files)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_predict_on_named_backend(loaded_model, monkeypatch):
+    monkeypatch.setattr(api.router.get("simple_cnn").classifier, "_model", SimpleCNN().eval())
+    files = {"file": ("scan.png", to_png(make_mri_like()), "image/png")}
+
+    assert client.post("/predict", files=files).json()["backend"] == api.router.default.name
+    response = client.post("/predict?backend=simple_cnn", files=files)
+    assert response.status_code == 200
+    assert response.json()["backend"] == "simple_cnn"
+
+    response = client.post("/predict?backend=nope", files=files)
+    assert response.status_code == 400
+    assert "Unknown backend" in response.json()["error"]
+
+
+def test_predict_rejects_oversized_upload_by_content_length():
+    """The declared size alone is enough to refuse the upload."""
+    body = b"x" * (11 * 1024 * 1024)
+    files = {"file": ("huge.png", body, "image/png")}
+    response = client.post("/predict", files=files)
+    assert response.status_code == 413
+    assert "too large" in response.json()["error"]
+
+
+def test_predict_rejects_oversized_streamed_upload():
+    """Without Content-Length the body is cut off once it crosses the limit."""
+    chunk = b"x" * (1024 * 1024)
+
+    def body():
+        for _ in range(12):
+            yield chunk
+
+    response = client.post(
+        "/predict",
+        content=body(),
+        headers={"Content-Type": "multipart/form-data; boundary=xyz"},
+    )
+    assert response.status_code == 413
+
+
+def test_repeat_uploads_are_served_from_cache(loaded_model):
+    files = {"file": ("scan.png", to_png(make_mri_like()), "image/png")}
+    first = client.post("/predict", files=files)
+    hits_before = api.prediction_cache.hits
+    second = client.post("/predict", files=files)
+
+    assert second.status_code == first.status_code == 200
+    assert second.json() == first.json()
+    assert api.prediction_cache.hits == hits_before + 1
+
+
+def test_predict_accepts_client_downscaled_uploads(loaded_model):
+    """Size rules apply to the declared original, not the shrunk upload."""
+    files = {"file": ("scan.jpg", to_png(make_mri_like(size=256)), "image/png")}
+
+    declared = {"X-Original-Width": "1000", "X-Original-Height": "1000"}
+    assert client.post("/predict", files=files, headers=declared).status_code == 200
+
+    too_large = {"X-Original-Width": "2000", "X-Original-Height": "2000"}
+    response = client.post("/predict", files=files, headers=too_large)
+    assert response.status_code == 400
+    assert "unusually large" in response.json()["error"]
+
+    # A 256x256 upload cannot be a downscale of a 1000x500 original
+    mismatch = {"X-Original-Width": "1000", "X-Original-Height": "500"}
+    assert client.post("/predict", files=files, headers=mismatch).status_code == 400
+
+    bad = {"X-Original-Width": "wide", "X-Original-Height": "1000"}
+    assert client.post("/predict", files=files, headers=bad).status_code == 400
+
+
+def test_predict_array_accepts_npy_and_raw_pixels(loaded_model):
+    pixels = np.asarray(make_mri_like(size=256))
+    buf = io.BytesIO()
+    np.save(buf, pixels)
+
+    npy = client.post(
+        "/predict/array",
+        content=buf.getvalue(),
+        headers={"Content-Type": "application/x-npy"},
+    )
+    raw = client.post(
+        "/predict/array",
+        content=pixels.tobytes(),
+        headers={"Content-Type": "application/octet-stream", "X-Array-Shape": "256,256,3"},
+    )
+    assert npy.status_code == raw.status_code == 200
+    assert npy.json()["shape"] == [256, 256, 3]
+    assert npy.json()["probability"] == raw.json()["probability"]
+
+    small = np.zeros((64, 64), dtype=np.uint8)
+    response = client.post(
+        "/predict/array", content=small.tobytes(), headers={"X-Array-Shape": "64,64"}
+    )
+    assert response.status_code == 400
+    assert "too small" in response.json()["error"]
+
+    response = client.post(
+        "/predict/array", content=pixels.tobytes(), headers={"X-Array-Shape": "256,256"}
+    )
+    assert response.status_code == 400
+    assert "expected 65536" in response.json()["error"]
+
+
+def test_metrics_expose_stages_and_rejection_reasons(loaded_model):
+    from src.metrics import REJECTIONS
+
+    tiny = {"file": ("tiny.png", to_png(make_mri_like(size=64)), "image/png")}
+    before = REJECTIONS.value(error="NotBrainMRIError", reason="too_small")
+    for _ in range(2):  # the second rejection is answered from the cache
+        assert client.post("/predict", files=tiny).status_code == 400
+    files = {"file": ("scan.png", to_png(make_mri_like()), "image/png")}
+    assert client.post("/predict", files=files).status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    for stage in ("upload_read", "header", "decode", "preprocess", "validate",
+                  "queue_wait", "batch_assembly", "inference", "serialize"):
+        assert f'brain_mri_stage_seconds_count{{stage="{stage}"}}' in text
+    assert 'brain_mri_request_seconds_count{endpoint="/predict",status="200"}' in text
+    assert "brain_mri_in_flight_requests 0" in text
+    assert "brain_mri_batch_queue_depth 0" in text
+    assert REJECTIONS.value(error="NotBrainMRIError", reason="too_small") == before + 2
+
+
+def read_ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+def test_batch_predict_streams_one_line_per_file(loaded_model):
+    files = [
+        ("files", (f"slice{i}.png", to_png(make_mri_like(shade=60 + i)), "image/png"))
+        for i in range(5)
+    ]
+    files.append(("files", ("broken.png", b"not an image", "image/png")))
+    response = client.post("/predict/batch", files=files)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = sorted(read_ndjson(response), key=lambda line: line["index"])
+    assert [line["filename"] for line in lines[:5]] == [f"slice{i}.png" for i in range(5)]
+    assert all(line["label_name"] in ("tumor", "no_tumor") for line in lines[:5])
+    assert lines[5]["status"] == 400 and "error" in lines[5]
+
+
+
+def test_batch_predict_cleans_up_after_early_disconnect(loaded_model, monkeypatch):
+    """A client gone before the first line still releases its uploads."""
+    owned = []
+
+    def detach(upload):
+        owned.append(upload.file)
+        upload.file = io.BytesIO()
+        return owned[-1]
+
+    monkeypatch.setattr(api, "detach_upload", detach)
+    request = httpx.Request(
+        "POST",
+        "http://testserver/predict/batch",
+        files=[("files", ("slice.png", to_png(make_mri_like()), "image/png"))],
+    )
+    body = request.read()
+    messages = [
+        {"type": "http.request", "body": body, "more_body": False},
+        {"type": "http.disconnect"},
+    ]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/predict/batch",
+        "raw_path": b"/predict/batch",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in request.headers.items()],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+    before = api.in_flight["requests"]
+    asyncio.run(app(scope, receive, send))
+
+    assert len(owned) == 1 and owned[0].closed
+    assert api.in_flight["requests"] == before
+
+def test_batch_predict_accepts_zip_archives(loaded_model):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        for i in range(3):
+            zf.writestr(f"study/slice{i}.png", to_png(make_mri_like(shade=90 + i)))
+        zf.writestr("__MACOSX/study/._slice0.png", b"resource fork")
+        zf.writestr("study/notes.txt", b"ignored")
+
+    files = {"files": ("study.zip", archive.getvalue(), "application/zip")}
+    response = client.post("/predict/batch", files=files)
+
+    assert response.status_code == 200
+    names = sorted(line["filename"] for line in read_ndjson(response))
+    assert names == [f"study/slice{i}.png" for i in range(3)]
+
+
+def test_ready_after_warmup(loaded_model):
+    """/ready flips to 200 once the lifespan warm-up has finished."""
+    with TestClient(app) as warm_client:
+        for _ in range(100):
+            response = warm_client.get("/ready")
+            if response.status_code == 200:
+                break
+            assert response.json()["status"] == "not_ready"
+            time.sleep(0.05)
+        assert response.status_code == 200
+        assert response.json() == {"status": "ready"}
+
+
+def test_not_ready_without_model(monkeypatch):
+    monkeypatch.setattr(api.classifier, "model_path", "/nonexistent/model.pth")
+    monkeypatch.setattr(api.classifier, "_model", None)
+    with TestClient(app) as warm_client:
+        for _ in range(100):
+            if "failed" in (api.readiness["reason"] or ""):
+                break
+            time.sleep(0.05)
+        response = warm_client.get("/ready")
+        assert response.status_code == 503
+        assert "not found" in response.json()["reason"]
+
+
+
+def test_failed_warmup_is_retried(loaded_model, monkeypatch):
+    """A slow thread start or a failed first warm-up does not stick."""
+    backend = api.warm_backends[0]
+    real_warmup = backend.warmup
+    attempts = []
+
+    def flaky_warmup(sizes):
+        attempts.append(sizes)
+        if len(attempts) == 1:
+            raise RuntimeError("first forward timed out")
+        return real_warmup(sizes)
+
+    monkeypatch.setattr(api.executor, "warmup", lambda: False)
+    monkeypatch.setattr(backend, "warmup", flaky_warmup)
+    monkeypatch.setattr(api, "WARMUP_RETRY_S", 0.05)
+    with TestClient(app) as warm_client:
+        for _ in range(100):
+            response = warm_client.get("/ready")
+            if response.status_code == 200:
+                break
+            time.sleep(0.05)
+        assert response.status_code == 200
+        assert len(attempts) == 2
+
+def test_index_is_compressed_and_cacheable():
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/html")
+    assert "max-age" in response.headers["cache-control"]
+    assert "Brain MRI Tumor Detection" in response.text
+
+    etag = response.headers["etag"]
+    assert not etag.startswith("W/")
+    revalidated = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+
+    # The cached gzip body does not stand in for another encoding
+    uncompressed = client.get("/", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+    assert uncompressed.status_code == 200
+    assert "content-encoding" not in uncompressed.headers
+    assert uncompressed.headers["etag"] != etag
+
+
+def test_vendored_bootstrap_is_served_immutable():
+    index_html = client.get("/").text
+    assert "cdn.jsdelivr.net" not in index_html
+
+    response = client.get("/static/vendor/bootstrap-5.3.2.min.css")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/css")
+    assert "immutable" in response.headers["cache-control"]
+    assert client.get("/static/../api.py").status_code == 404
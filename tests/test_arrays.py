@@ -0,0 +1,57 @@
+import io
+
+import numpy as np
+import pytest
+
+from src.arrays import parse_npy, parse_shape, wrap_raw
+from src.inference import BrainTumorClassifier, InvalidImageError
+from tests.helpers import make_mri_like
+
+
+def to_npy(array):
+    buf = io.BytesIO()
+    np.save(buf, array)
+    return bytearray(buf.getvalue())
+
+
+def test_npy_is_wrapped_without_copying():
+    array = np.arange(300 * 200 * 3, dtype=np.uint8).reshape(300, 200, 3)
+    data = to_npy(array)
+    parsed = parse_npy(data)
+    assert np.array_equal(parsed, array)
+    assert np.shares_memory(parsed, np.frombuffer(data, dtype=np.uint8))
+
+
+def test_fortran_order_npy():
+    array = np.asfortranarray(np.arange(40 * 30, dtype=np.uint8).reshape(40, 30))
+    assert np.array_equal(parse_npy(to_npy(array)), array)
+
+
+def test_npy_rejects_other_dtypes_and_junk():
+    with pytest.raises(InvalidImageError):
+        parse_npy(to_npy(np.zeros((10, 10), dtype=np.float32)))
+    with pytest.raises(InvalidImageError):
+        parse_npy(b"not an npy file")
+
+
+def test_raw_buffer_must_match_shape():
+    assert parse_shape("256, 256,3") == (256, 256, 3)
+    with pytest.raises(InvalidImageError):
+        parse_shape("256")
+    assert wrap_raw(bytearray(12), (2, 2, 3)).shape == (2, 2, 3)
+    with pytest.raises(InvalidImageError):
+        wrap_raw(bytearray(11), (2, 2, 3))
+
+
+@pytest.mark.parametrize("arch", ["resnet18", "simple_cnn"])
+@pytest.mark.parametrize("size", [224, 256, 512])
+def test_array_input_matches_image_input(arch, size):
+    clf = BrainTumorClassifier(arch=arch)
+    image = make_mri_like(size=size)
+    expected, _ = clf.preprocessor.prepare(image)
+    assert np.array_equal(clf.validate_array(np.asarray(image)), expected)
+
+    # Grayscale arrays give the same batch as their RGB conversion
+    gray = np.asarray(image.convert("L"))
+    batch = clf.preprocessor.to_batch([clf.validate_array(gray)])
+    assert np.allclose(batch.numpy(), clf.preprocessor.to_batch([expected]).numpy())
@@ -0,0 +1,69 @@
+import pytest
+
+from src.backends import (
+    BackendRouter,
+    OnnxBackend,
+    SimpleCNNBackend,
+    TorchScriptBackend,
+    UnknownBackendError,
+    make_backend,
+    parse_backend_specs,
+)
+
+
+def test_make_backend_follows_the_file():
+    assert isinstance(make_backend("models/simple_cnn_baseline_mps.pth"), SimpleCNNBackend)
+    assert isinstance(make_backend("models/resnet18_brain_mri_fp32.onnx"), OnnxBackend)
+    scripted = make_backend("models/resnet18_brain_mri_int8_static.ts", name="int8")
+    assert isinstance(scripted, TorchScriptBackend) and scripted.name == "int8"
+    assert make_backend("models/resnet18_brain_mri_mps.pth").classifier.arch == "resnet18"
+    with pytest.raises(ValueError):
+        make_backend("models/resnet18_brain_mri_mps.pth", kind="tensorrt")
+
+
+def test_parse_backend_specs():
+    assert parse_backend_specs(" onnx=a.onnx, int8=b.ts ,") == [
+        ("onnx", "a.onnx"),
+        ("int8", "b.ts"),
+    ]
+    with pytest.raises(ValueError):
+        parse_backend_specs("a.onnx")
+
+
+def make_router(**kwargs):
+    backends = [
+        make_backend("resnet18_brain_mri_mps.pth"),
+        make_backend("simple_cnn_baseline_mps.pth"),
+    ]
+    return BackendRouter(backends, default="eager", fallback="simple_cnn", **kwargs)
+
+
+def test_router_selects_named_or_default_backend():
+    router = make_router()
+    assert router.select().name == "eager"
+    assert router.select("simple_cnn").name == "simple_cnn"
+    with pytest.raises(UnknownBackendError):
+        router.select("onnx")
+
+
+def test_router_falls_back_when_p99_exceeds_budget(monkeypatch):
+    router = make_router(latency_budget_ms=100, min_samples=10, cooldown_s=30)
+    for _ in range(20):
+        router.record(router.default, 50.0)
+    assert router.select().name == "eager"
+
+    router.record(router.default, 500.0)
+    assert router.select().name == "simple_cnn"
+    assert router.stats()["degraded"] and router.fallbacks_total == 1
+
+    # The fallback's own latency is not held against the default
+    router.record(router.fallback, 10_000.0)
+    monkeypatch.setattr("src.backends.time.monotonic", lambda: float("inf"))
+    assert router.select().name == "eager"
+
+
+def test_router_without_budget_never_falls_back():
+    router = make_router()
+    for _ in range(100):
+        router.record(router.default, 10_000.0)
+    assert router.select().name == "eager"
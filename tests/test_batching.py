@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from src.batching import MicroBatcher
+
+
+class RecordingModel:
+    """Stand-in for BrainTumorClassifier.predict_batch that logs batch sizes."""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict_batch(self, images):
+        self.calls.append(len(images))
+        return [{"label": 0, "label_name": "no_tumor", "probability": i} for i in images]
+
+
+def test_concurrent_requests_are_coalesced():
+    model = RecordingModel()
+    batcher = MicroBatcher(model.predict_batch, max_batch_size=4, max_wait_ms=50)
+
+    async def run():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+
+    results = asyncio.run(run())
+
+    # Every caller gets its own result back, in order
+    assert [r["probability"] for r in results] == list(range(10))
+    # ...from far fewer forward passes, none larger than the cap
+    assert model.calls == [4, 4, 2]
+
+    stats = batcher.stats()
+    assert stats["requests_total"] == 10
+    assert stats["batches_total"] == 3
+    assert stats["batch_size_distribution"] == {"2": 1, "4": 2}
+    assert stats["queue_wait_max_ms"] >= 0
+
+
+def test_errors_are_fanned_out_to_every_waiter():
+    def failing(images):
+        raise RuntimeError("boom")
+
+    batcher = MicroBatcher(failing, max_batch_size=8, max_wait_ms=10)
+
+    async def run():
+        return await asyncio.gather(
+            *(batcher.submit(i) for i in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_invalid_limits_are_rejected():
+    with pytest.raises(ValueError):
+        MicroBatcher(lambda images: [], max_batch_size=0)
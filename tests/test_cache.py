@@ -0,0 +1,78 @@
+import gc
+import weakref
+
+import pytest
+
+from src.cache import MISSING, PredictionCache
+from src.inference import NotBrainMRIError
+
+
+def test_lru_eviction_by_entry_count():
+    cache = PredictionCache(max_entries=2)
+    cache.put(b"a", {"label": 0})
+    cache.put(b"b", {"label": 1})
+    assert cache.get(b"a") == {"label": 0}  # "a" is now most recent
+
+    cache.put(b"c", {"label": 1})
+    assert cache.get(b"b") is MISSING
+    assert cache.get(b"a") is not MISSING
+    assert cache.stats()["evictions"] == 1
+
+
+def test_memory_bound_is_respected():
+    cache = PredictionCache(max_entries=1000, max_bytes=4096)
+    for i in range(100):
+        cache.put(bytes([i]), {"label": 0, "label_name": "no_tumor", "probability": 0.9})
+    stats = cache.stats()
+    assert 0 < stats["entries"] < 100
+    assert stats["bytes"] <= 4096
+
+
+def test_ttl_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.cache.time.monotonic", lambda: now[0])
+    cache = PredictionCache(ttl_seconds=10)
+    cache.put(b"k", {"label": 0})
+    now[0] += 5
+    assert cache.get(b"k") is not MISSING
+    now[0] += 6
+    assert cache.get(b"k") is MISSING
+
+
+def test_errors_are_cached_and_counted():
+    cache = PredictionCache()
+    key = cache.make_key(b"holiday photo")
+    assert key != cache.make_key(b"holiday photo", namespace="other-model")
+
+    cache.put(key, NotBrainMRIError("Image too small to be a brain MRI"))
+    cached = cache.get(key)
+    with pytest.raises(NotBrainMRIError, match="too small"):
+        raise cached
+    assert cache.get(b"unknown") is MISSING
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+class _Upload:
+    """Stands in for an upload: bytes cannot be weakly referenced."""
+
+
+def test_cached_errors_do_not_keep_the_upload_alive():
+    cache = PredictionCache()
+    key = cache.make_key(b"holiday photo")
+
+    def validate(upload):
+        raise NotBrainMRIError("Image colors suggest it is not an MRI", "color")
+
+    upload = _Upload()
+    alive = weakref.ref(upload)
+    try:
+        validate(upload)
+    except NotBrainMRIError as e:
+        cache.put(key, e)
+    del upload
+    gc.collect()
+    assert alive() is None
+
+    cached = cache.get(key)
+    assert cached.reason == "color" and cached.__traceback__ is None
@@ -0,0 +1,89 @@
+import json
+
+import numpy as np
+import pytest
+import torch
+
+from src.backends import CascadeBackend, make_backend, parse_cascade_thresholds
+from src.cascade import calibrate, main, summarize
+from src.inference import SimpleCNN, build_model
+from tests.helpers import make_mri_like, to_png
+
+
+def test_calibration_escalates_only_what_the_accurate_model_fixes():
+    labels = np.array([0, 0, 0, 0, 1, 1, 1, 1])
+    # The cheap model is right when confident, wrong on 0.45 and 0.6
+    cheap = np.array([0.02, 0.1, 0.3, 0.6, 0.45, 0.7, 0.9, 0.97])
+    accurate = np.array([0.1, 0.2, 0.1, 0.2, 0.8, 0.9, 0.8, 0.9])
+
+    low, high = calibrate(cheap, accurate, labels)
+    assert 0.3 < low < 0.45 and 0.6 < high < 0.7
+    summary = summarize(cheap, accurate, labels, low, high)
+    assert summary["escalated"] == 2
+    assert summary["cascade_acc"] == summary["accurate_acc"] == 1.0
+    assert summary["cheap_acc"] == 0.75
+
+    # Giving up one image's worth of accuracy escalates less
+    low, high = calibrate(cheap, accurate, labels, tolerance=0.125)
+    assert summarize(cheap, accurate, labels, low, high)["escalated"] == 1
+
+
+def test_parse_cascade_thresholds(tmp_path):
+    assert parse_cascade_thresholds("0.2, 0.85") == (0.2, 0.85)
+    report = tmp_path / "cascade_results.json"
+    report.write_text(json.dumps({"thresholds": {"low": 0.1, "high": 0.9}}))
+    assert parse_cascade_thresholds(str(report)) == (0.1, 0.9)
+    with pytest.raises(ValueError):
+        parse_cascade_thresholds("0.2")
+
+
+def make_cascade(low, high):
+    cheap = make_backend("simple_cnn_baseline_mps.pth")
+    cheap.classifier._model = SimpleCNN().eval()
+    accurate = make_backend("resnet18_brain_mri_mps.pth")
+    accurate.classifier._model = build_model("resnet18").eval()
+    return CascadeBackend(cheap, accurate, low, high)
+
+
+def test_cascade_escalates_uncertain_images():
+    image = make_mri_like()
+    cascade = make_cascade(0.0, 1.0)  # everything is uncertain
+    inputs = [
+        cascade.decode_and_validate(to_png(image)),
+        cascade.validate_array(np.asarray(image.convert("L"))),
+        image,
+    ]
+    results = cascade.predict_batch(inputs)
+    assert all(result["escalated"] for result in results)
+    expected = cascade.accurate.predict_batch([image])[0]["probability"]
+    for result in results:
+        assert result["probability"] == pytest.approx(expected, abs=0.02)
+
+    cascade = make_cascade(0.5, 0.5)  # nothing is
+    results = cascade.predict_batch(inputs)
+    assert not any(result["escalated"] for result in results)
+    assert cascade.describe()["escalation_rate"] == 0.0
+
+
+def test_cascade_report(tmp_path):
+    pytest.importorskip("sklearn")
+    data_raw = tmp_path / "data_raw"
+    for folder, shade in (("yes", 150), ("no", 80)):
+        (data_raw / folder).mkdir(parents=True)
+        for i in range(10):
+            make_mri_like(shade=shade + i).save(data_raw / folder / f"{i}.png")
+    cheap = tmp_path / "simple_cnn_baseline_mps.pth"
+    torch.save(SimpleCNN().state_dict(), cheap)
+    accurate = tmp_path / "resnet18_brain_mri_mps.pth"
+    torch.save(build_model("resnet18").state_dict(), accurate)
+
+    argv = ["--data-dir", str(data_raw), "--reports-dir", str(tmp_path)]
+    argv += ["--cheap-model", str(cheap), "--accurate-model", str(accurate)]
+    assert main(argv) == 0
+    report = json.loads((tmp_path / "cascade_results.json").read_text())
+    assert report["val"]["cascade_acc"] >= report["val"]["accurate_acc"]
+    assert 0.0 <= report["test"]["escalation_rate"] <= 1.0
+    assert parse_cascade_thresholds(str(tmp_path / "cascade_results.json")) == (
+        report["thresholds"]["low"],
+        report["thresholds"]["high"],
+    )
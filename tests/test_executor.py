@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.executor import BoundedExecutor, QueueFullError
+
+
+def test_runs_work_off_the_event_loop():
+    executor = BoundedExecutor(max_workers=2, max_queue=0)
+
+    async def run():
+        return await executor.run(threading.get_ident)
+
+    assert asyncio.run(run()) != threading.get_ident()
+    assert executor.pending == 0
+
+
+def test_refuses_work_beyond_capacity():
+    executor = BoundedExecutor(max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def run():
+        blocked = [
+            asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)
+        ]
+        await asyncio.sleep(0.05)
+        with pytest.raises(QueueFullError):
+            await executor.run(release.wait)
+        release.set()
+        await asyncio.gather(*blocked)
+
+    asyncio.run(run())
+    assert executor.rejected_total == 1
+    assert executor.pending == 0
+
+
+def test_warmup_reports_threads_that_are_slow_to_start():
+    executor = BoundedExecutor(max_workers=2, max_queue=0)
+    assert executor.warmup(timeout=1.0)
+
+    # One thread busy: the barrier times out instead of raising
+    release = threading.Event()
+    executor.pool.submit(release.wait)
+    assert not executor.warmup(timeout=0.05)
+    release.set()
+    executor.shutdown()
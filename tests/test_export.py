@@ -0,0 +1,76 @@
+import json
+
+import pytest
+import torch
+
+from src.export import artifact_stem, main
+from src.inference import BrainTumorClassifier, SimpleCNN, infer_backend
+from tests.helpers import make_mri_like
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    path = tmp_path / "simple_cnn_baseline_mps.pth"
+    torch.save(SimpleCNN().state_dict(), path)
+    return path
+
+
+@pytest.fixture
+def data_raw(tmp_path):
+    for folder, shade in (("yes", 150), ("no", 80)):
+        (tmp_path / "data_raw" / folder).mkdir(parents=True)
+        for i in range(10):
+            make_mri_like(shade=shade + i).save(tmp_path / "data_raw" / folder / f"{i}.png")
+    return tmp_path / "data_raw"
+
+
+def test_artifact_names_and_backends():
+    assert artifact_stem("models/resnet18_brain_mri_mps.pth") == "resnet18_brain_mri"
+    assert infer_backend("m/resnet18_brain_mri_int8_static.ts") == "torchscript"
+    assert infer_backend("m/resnet18_brain_mri_fp32.onnx") == "onnx"
+    assert infer_backend("m/resnet18_brain_mri_mps.pth") == "eager"
+
+
+def test_torchscript_variants_match_eager(checkpoint, tmp_path):
+    out = tmp_path / "artifacts"
+    reports = tmp_path / "reports"
+    argv = [str(checkpoint), "--out-dir", str(out), "--reports-dir", str(reports)]
+    assert main(argv + ["--formats", "torchscript", "--precisions", "fp32", "int8_dynamic"]) == 0
+
+    image = make_mri_like()
+    eager = BrainTumorClassifier(model_path=str(checkpoint)).predict_batch([image])[0]
+    for name in ("simple_cnn_baseline_fp32.ts", "simple_cnn_baseline_int8_dynamic.ts"):
+        served = BrainTumorClassifier(model_path=str(out / name)).predict_batch([image])[0]
+        assert served["label"] == eager["label"]
+        assert served["probability"] == pytest.approx(eager["probability"], abs=0.02)
+
+        report = json.loads((reports / name.replace(".ts", "_results.json")).read_text())
+        assert report["test_acc"] is None  # no --data-dir
+        assert set(report["latency_ms_per_image"]) == {"batch_1", "batch_8"}
+        assert report["size_mb"] > 0
+
+
+def test_static_and_onnx_variants_with_data(checkpoint, data_raw, tmp_path):
+    pytest.importorskip("sklearn")
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+
+    out = tmp_path / "artifacts"
+    reports = tmp_path / "reports"
+    argv = [str(checkpoint), "--data-dir", str(data_raw)]
+    assert main(argv + ["--out-dir", str(out), "--reports-dir", str(reports)]) == 0
+
+    for name in (
+        "simple_cnn_baseline_int8_static.ts",
+        "simple_cnn_baseline_fp32.onnx",
+        "simple_cnn_baseline_int8_dynamic.onnx",
+        "simple_cnn_baseline_int8_static.onnx",
+    ):
+        assert (out / name).is_file()
+        report = json.loads((reports / f"{name.rsplit('.', 1)[0]}_results.json").read_text())
+        assert (report["train_size"], report["val_size"], report["test_size"]) == (14, 3, 3)
+        assert sum(map(sum, report["confusion_matrix"])) == 3
+        assert 0.0 <= report["test_acc"] <= 1.0
+
+    result = BrainTumorClassifier(model_path=str(out / "simple_cnn_baseline_fp32.onnx"))
+    assert result.predict_batch([make_mri_like()])[0]["label_name"] in ("tumor", "no_tumor")
@@ -0,0 +1,188 @@
+import io
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from src.inference import (
+    BrainTumorClassifier,
+    ImageDecodeError,
+    InvalidImageError,
+    ModelUnavailableError,
+    NotBrainMRIError,
+    SimpleCNN,
+    _color_stats,
+)
+from tests.helpers import make_mri_like
+
+
+@pytest.fixture(scope="module")
+def simple_cnn_checkpoint(tmp_path_factory):
+    torch.manual_seed(0)
+    path = tmp_path_factory.mktemp("models") / "simple_cnn_baseline_mps.pth"
+    torch.save(SimpleCNN().state_dict(), path)
+    return str(path)
+
+
+def test_checkpoint_is_loaded_once(simple_cnn_checkpoint):
+    """The model is loaded lazily and then reused for every call."""
+    clf = BrainTumorClassifier(model_path=simple_cnn_checkpoint)
+    assert clf.arch == "simple_cnn"
+    assert not clf.is_loaded
+
+    model = clf.load()
+    assert clf.is_loaded
+    assert not model.training
+    assert clf.load() is model
+
+
+def test_predict_batch_matches_single_predictions(simple_cnn_checkpoint):
+    """One batched forward pass gives the same answers as N single calls."""
+    clf = BrainTumorClassifier(model_path=simple_cnn_checkpoint)
+    images = [make_mri_like(shade=s) for s in (60, 120, 180)]
+
+    batched = clf.predict_batch(images)
+    single = [clf.predict_image_from_pil(img) for img in images]
+
+    assert len(batched) == len(images)
+    for b, s in zip(batched, single):
+        assert b["label"] == s["label"]
+        assert b["label_name"] in ("tumor", "no_tumor")
+        assert b["probability"] == pytest.approx(s["probability"], abs=1e-5)
+        assert 0.5 <= b["probability"] <= 1.0
+
+
+def test_validation_runs_before_inference(simple_cnn_checkpoint):
+    clf = BrainTumorClassifier(model_path=simple_cnn_checkpoint)
+    with pytest.raises(NotBrainMRIError):
+        clf.predict_image_from_pil(make_mri_like(size=100))
+    assert not clf.is_loaded
+
+
+def test_missing_checkpoint_raises(tmp_path):
+    clf = BrainTumorClassifier(model_path=str(tmp_path / "missing.pth"))
+    with pytest.raises(ModelUnavailableError):
+        clf.predict_batch([make_mri_like()])
+
+
+def reference_color_stats(thumb):
+    """The original pure-Python loops from _validate_image."""
+    pixels = list(thumb.getdata())
+    diffs = [abs(r - g) + abs(g - b) + abs(b - r) for (r, g, b) in pixels]
+    avg_diff = sum(diffs) / len(diffs)
+
+    bright_or_saturated = 0
+    for (r, g, b) in pixels:
+        if max(r, g, b) > 230:
+            bright_or_saturated += 1
+        if max(r, g, b) - min(r, g, b) > 80:
+            bright_or_saturated += 1
+    return avg_diff, bright_or_saturated / (len(pixels) * 2.0)
+
+
+def test_color_stats_match_reference_implementation():
+    """The vectorized heuristics give bit-identical numbers and decisions."""
+    rng = np.random.default_rng(0)
+    thumbs = [make_mri_like(size=64, shade=s) for s in (0, 90, 231, 255)]
+    for _ in range(50):
+        # Mix of gray-ish and colorful noise around random base levels
+        base = rng.integers(0, 256, size=(64, 64, 1))
+        noise = rng.integers(-120, 121, size=(64, 64, 3)) * rng.random()
+        pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+        thumbs.append(Image.fromarray(pixels, "RGB"))
+
+    decisions = set()
+    for thumb in thumbs:
+        expected = reference_color_stats(thumb)
+        assert _color_stats(thumb) == expected
+        decisions.add(expected[0] > 30 or expected[1] > 0.15)
+
+    # The sample covers both accepted and rejected images
+    assert decisions == {True, False}
+
+
+def test_color_decisions_match_the_original_resize_path():
+    """Both architectures accept / reject exactly what the original
+    image.resize((64, 64)) check did, for the same upload."""
+    rng = np.random.default_rng(1)
+    uploads = []
+    for _ in range(40):
+        size = int(rng.integers(170, 600))
+        base = rng.integers(0, 256, size=(size, size, 1))
+        noise = rng.integers(-120, 121, size=(size, size, 3)) * rng.random()
+        pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+        uploads.append(encode(Image.fromarray(pixels, "RGB"), "PNG"))
+    for shade in range(60, 255, 15):
+        uploads.append(encode(make_mri_like(size=int(rng.integers(170, 600)), shade=shade), "JPEG"))
+
+    classifiers = [BrainTumorClassifier(arch=arch) for arch in ("resnet18", "simple_cnn")]
+    decisions = set()
+    for data in uploads:
+        thumb = classifiers[0].decode_validated(data).resize((64, 64))
+        avg_diff, ratio = reference_color_stats(thumb)
+        rejected = avg_diff > 30 or ratio > 0.15
+        decisions.add(rejected)
+        for clf in classifiers:
+            if rejected:
+                with pytest.raises(NotBrainMRIError):
+                    clf.decode_and_validate(data)
+            else:
+                clf.decode_and_validate(data)
+            # Arrays of the same pixels get the same decision
+            pixels = np.asarray(clf.decode_validated(data))
+            try:
+                clf.validate_array(pixels)
+                assert not rejected
+            except NotBrainMRIError:
+                assert rejected
+    assert decisions == {True, False}
+
+
+def encode(image, fmt):
+    buf = io.BytesIO()
+    image.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def test_header_rules_reject_before_decoding():
+    """A truncated file is still rejected on its header dimensions alone."""
+    clf = BrainTumorClassifier()
+    data = encode(make_mri_like(size=1600), "PNG")[:2048]
+    with pytest.raises(NotBrainMRIError, match="unusually large"):
+        clf.decode_and_validate(data)
+
+
+def test_header_rules_reject_unsupported_modes():
+    clf = BrainTumorClassifier()
+    data = encode(Image.new("I;16", (256, 256)), "PNG")
+    with pytest.raises(InvalidImageError):
+        clf.decode_and_validate(data)
+
+
+def test_jpeg_is_decoded_at_reduced_scale():
+    clf = BrainTumorClassifier()
+    image = clf.decode_validated(encode(make_mri_like(size=1024), "JPEG"))
+    assert image.mode == "RGB"
+    assert image.size == (256, 256)
+
+
+@pytest.mark.parametrize("arch", ["resnet18", "simple_cnn"])
+@pytest.mark.parametrize("size", [(256, 256), (300, 280), (180, 200)])
+def test_preprocessing_matches_training_transform(arch, size):
+    """One resize + in-place normalization gives the torchvision tensors."""
+    clf = BrainTumorClassifier(arch=arch)
+    image = make_mri_like(size=max(size), shade=140).resize(size)
+    expected = torch.stack([clf.transform(image), clf.transform(image)])
+
+    prepared = clf.decode_and_validate(encode(image, "PNG"))
+    assert prepared.shape == (224, 224, 3) and prepared.dtype == np.uint8
+    batch = clf.preprocessor.to_batch([prepared, image])
+    assert batch.shape == expected.shape and batch.is_contiguous()
+    assert torch.allclose(batch, expected, atol=1e-5)
+
+
+def test_corrupt_bytes_raise_decode_error():
+    clf = BrainTumorClassifier()
+    with pytest.raises(ImageDecodeError):
+        clf.decode_and_validate(b"not an image")
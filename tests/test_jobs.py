@@ -0,0 +1,235 @@
+import io
+import os
+import threading
+import time
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import api
+from src.inference import SimpleCNN
+from src.jobs import JobStore, JobWorkers
+from tests.helpers import make_mri_like, to_png
+
+
+def _store(tmp_path, lease_s=300.0):
+    return JobStore(str(tmp_path / "jobs.sqlite3"), lease_s=lease_s)
+
+
+def _open_files():
+    paths = []
+    for fd in os.listdir("/proc/self/fd"):
+        try:
+            paths.append(os.readlink(f"/proc/self/fd/{fd}"))
+        except OSError:
+            pass  # the directory listing's own descriptor
+    return paths
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_store_keeps_no_connection_open_until_used(tmp_path):
+    # Created in the gunicorn master at import; nothing may be inherited
+    store = _store(tmp_path)
+    assert not any("jobs.sqlite3" in path for path in _open_files())
+
+    store.queued()
+    assert any("jobs.sqlite3" in path for path in _open_files())
+    # A forked child does not reuse the parent's connection
+    parent = store._connect()
+    store._local.pid = -1
+    assert store._connect() is not parent
+
+
+def test_job_lifecycle(tmp_path):
+    store = _store(tmp_path)
+    too_large = {"index": 1, "filename": "b.png", "status": 413, "error": "too large"}
+    job_id = store.create("default", [("a.png", b"a", None), ("b.png", None, too_large)])
+
+    job = store.get(job_id)
+    assert (job["status"], job["total"], job["completed"]) == ("queued", 2, 1)
+    assert store.queued() == 1
+
+    backend, rows = store.claim(8)
+    assert backend == "default"
+    assert rows == [(job_id, 0, "a.png", b"a")]
+    assert store.get(job_id)["status"] == "running"
+    assert store.claim(8) == (None, [])
+
+    store.complete([(job_id, 0, {"index": 0, "filename": "a.png", "label": 1})])
+    job = store.get(job_id)
+    assert job["status"] == "done"
+    assert [line["filename"] for line in job["results"]] == ["a.png", "b.png"]
+    assert store.queued() == 0
+
+
+def test_claim_batches_across_jobs_of_one_backend(tmp_path):
+    store = _store(tmp_path)
+    first = store.create("default", [("a.png", b"a", None)])
+    other = store.create("simple_cnn", [("b.png", b"b", None)])
+    second = store.create("default", [("c.png", b"c", None), ("d.png", b"d", None)])
+
+    backend, rows = store.claim(8)
+    assert backend == "default"
+    assert [(job_id, index) for job_id, index, _, _ in rows] == [
+        (first, 0), (second, 0), (second, 1)
+    ]
+    assert store.claim(8)[1] == [(other, 0, "b.png", b"b")]
+
+
+def test_expired_claims_are_retried(tmp_path):
+    store = _store(tmp_path, lease_s=0.05)
+    job_id = store.create("default", [("a.png", b"a", None)])
+    assert len(store.claim(8)[1]) == 1
+    assert store.claim(8)[1] == []
+    time.sleep(0.1)
+    assert store.claim(8)[1] == [(job_id, 0, "a.png", b"a")]
+
+
+def test_items_are_inserted_as_they_are_read(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.jobs.CREATE_CHUNK", 2)
+    store = _store(tmp_path)
+    job_id = store.create("default", ((f"{i}.png", b"x", None) for i in range(5)), 5)
+    assert store.get(job_id)["total"] == 5 and store.queued() == 5
+
+    def broken_upload():
+        yield "a.png", b"a", None
+        yield "b.png", b"b", None
+        raise OSError("client went away")
+
+    with pytest.raises(OSError):
+        store.create("default", broken_upload(), 3)
+    assert store.queued() == 5  # the partial job was deleted
+
+
+def test_failed_batch_is_left_for_retry_and_old_jobs_are_purged(tmp_path):
+    store = _store(tmp_path, lease_s=0.0)
+    job_id = store.create("default", [("a.png", b"a", None)])
+
+    def broken(backend, rows):
+        raise RuntimeError("model crashed")
+
+    assert JobWorkers(store, broken).run_once() == 0
+    assert store.get(job_id)["status"] == "running"
+
+    workers = JobWorkers(store, lambda backend, rows: [{"label": 0} for _ in rows])
+    assert workers.run_once() == 1
+    assert store.get(job_id)["status"] == "done"
+    assert store.purge(older_than_s=3600) == 0
+    assert store.purge(older_than_s=0) == 1
+    assert store.get(job_id) is None
+
+
+def test_poison_image_fails_alone_after_max_attempts(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), max_attempts=3)
+    job_id = store.create(
+        "default", [("a.png", b"a", None), ("bad.png", b"bad", None), ("c.png", b"c", None)]
+    )
+
+    def process(backend, rows):
+        if any(data == b"bad" for _, _, _, data in rows):
+            raise RuntimeError("model crashed")
+        return [{"index": index, "filename": name, "label": 0} for _, index, name, _ in rows]
+
+    workers = JobWorkers(store, process)
+    # The batch fails; its images are retried one by one, only bad.png is left
+    assert workers.run_once() == 2
+    assert store.queued() == 1
+    assert workers.run_once() == 0  # attempt 2
+    assert workers.run_once() == 0  # attempt 3
+    assert workers.run_once() == 0  # no attempts left: failed, nothing to claim
+
+    job = store.get(job_id)
+    assert job["status"] == "done"
+    good, bad, _ = job["results"]
+    assert good["label"] == 0
+    assert bad["status"] == 500 and "3 attempts" in bad["error"]
+
+
+def test_jobs_endpoints(monkeypatch, tmp_path):
+    monkeypatch.setattr(api.classifier, "_model", SimpleCNN().eval())
+    store = _store(tmp_path)
+    monkeypatch.setattr(api, "job_store", store)
+    monkeypatch.setattr(api.job_workers, "store", store)
+    client = TestClient(api.app)
+
+    files = [
+        ("files", ("mri.png", to_png(make_mri_like()), "image/png")),
+        ("files", ("notes.png", b"not an image", "image/png")),
+    ]
+    response = client.post("/jobs", files=files)
+    assert response.status_code == 202
+    job = response.json()
+    assert job["total"] == 2
+    assert response.headers["location"] == job["url"]
+    assert client.get(job["url"]).json()["status"] == "queued"
+
+    # The lifespan (and with it the worker threads) does not run here
+    assert api.job_workers.run_once() == 2
+    data = client.get(job["url"], params={"wait": 1}).json()
+    assert data["status"] == "done"
+    scored, rejected = data["results"]
+    assert scored["label_name"] in ("tumor", "no_tumor")
+    assert rejected["status"] == 400
+
+    assert client.get("/jobs/unknown").status_code == 404
+
+
+
+def test_job_forward_passes_yield_to_interactive_requests(monkeypatch):
+    monkeypatch.setattr(api, "JOB_CHUNK_SIZE", 1)
+    monkeypatch.setitem(api.readiness, "ready", True)
+    monkeypatch.setitem(api.in_flight, "requests", 0)
+    backend = api.router.default
+    calls = []
+
+    def request_done():
+        api.in_flight["requests"] -= 1
+
+    def predict_batch(images):
+        calls.append((len(images), api.in_flight["requests"]))
+        if len(calls) == 1:
+            api.in_flight["requests"] += 1  # a /predict arrives meanwhile
+            threading.Timer(0.1, request_done).start()
+        return [{"label": 0} for _ in images]
+
+    monkeypatch.setattr(backend, "predict_batch", predict_batch)
+    data = to_png(make_mri_like())
+    rows = [("job", i, f"{i}.png", data) for i in range(2)]
+    lines = api._score_job_items(backend.name, rows)
+
+    assert [line["label"] for line in lines] == [0, 0]
+    # The second image only went through once the request had finished
+    assert calls == [(1, 0), (1, 0)]
+
+def _zip(members, compression=zipfile.ZIP_DEFLATED):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return buf.getvalue()
+
+
+def test_job_uploads_are_capped_before_decompressing(monkeypatch, tmp_path):
+    store = _store(tmp_path)
+    monkeypatch.setattr(api, "job_store", store)
+    monkeypatch.setattr(api, "JOB_MAX_BYTES", 1024 * 1024)
+    client = TestClient(api.app)
+
+    def post(data):
+        return client.post("/jobs", files={"files": ("scans.zip", data, "application/zip")})
+
+    # Incompressible images over the total cap
+    members = [(f"{i}.png", bytes(range(256)) * 1024) for i in range(5)]
+    response = post(_zip(members, zipfile.ZIP_STORED))
+    assert response.status_code == 413
+    assert "at most 1 MB per job" in response.json()["error"]
+
+    # Under the cap, but zero-filled: far more than ZIP_MAX_RATIO x the archive
+    response = post(_zip([("bomb.png", bytes(512 * 1024))]))
+    assert response.status_code == 413
+    assert store.queued() == 0
+
+    response = post(_zip(members[:2], zipfile.ZIP_STORED))
+    assert response.status_code == 202
+    assert store.queued() == 2
@@ -0,0 +1,46 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src import api
+from src.inference import SimpleCNN
+from src.loadgen import make_payloads, parse_mix, run_level, summarize, sustainable
+
+
+def test_parse_mix_normalizes_weights():
+    assert parse_mix("valid=3,rejected=1") == {"valid": 0.75, "rejected": 0.25}
+    with pytest.raises(ValueError):
+        parse_mix("valid=1,bogus=1")
+
+
+def test_payloads_are_reproducible():
+    first, second = make_payloads(seed=3), make_payloads(seed=3)
+    assert [p.body for p in first["valid"]] == [p.body for p in second["valid"]]
+
+
+def test_run_level_against_the_app(monkeypatch):
+    """One short level in-process: every kind gets its expected status."""
+    monkeypatch.setattr(api.classifier, "_model", SimpleCNN().eval())
+    monkeypatch.setattr(api.prediction_cache, "max_entries", 0)
+    mix = {"valid": 0.6, "rejected": 0.3, "oversized": 0.1}
+
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+            return await run_level(
+                client, make_payloads(variants=2), mix, concurrency=3, duration=1.0
+            )
+
+    samples, elapsed = asyncio.run(run())
+    level = summarize(samples, elapsed)
+
+    assert level["requests"] == len(samples) > 0
+    assert level["error_rate"] == 0.0
+    assert set(level["kinds"]) <= {"valid", "rejected", "oversized"}
+    valid = level["kinds"]["valid"]["latency_ms"]
+    assert valid["p50"] <= valid["p99"] <= valid["max"]
+
+    capacity = sustainable([{"concurrency": 3, **level}], 60_000, 0.01)
+    assert capacity["at_concurrency"] == 3
+    assert sustainable([{"concurrency": 3, **level}], 0.0, 0.01)["sustainable_rps"] is None
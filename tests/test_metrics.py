@@ -0,0 +1,34 @@
+from src.metrics import Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    hist = registry.histogram("stage_seconds", "Stage time.", ("stage",), buckets=(0.01, 0.1))
+    hist.observe(0.005, stage="decode")
+    hist.observe(0.05, stage="decode")
+    hist.observe(5.0, stage="decode")
+    with hist.time(stage="inference"):
+        pass
+
+    text = registry.render()
+    assert "# TYPE stage_seconds histogram" in text
+    assert 'stage_seconds_bucket{stage="decode",le="0.01"} 1' in text
+    assert 'stage_seconds_bucket{stage="decode",le="0.1"} 2' in text
+    assert 'stage_seconds_bucket{stage="decode",le="+Inf"} 3' in text
+    assert 'stage_seconds_count{stage="decode"} 3' in text
+    assert hist.count(stage="inference") == 1
+
+
+def test_counters_and_gauges():
+    registry = Registry()
+    rejections = registry.counter("rejections_total", "Rejections.", ("reason",))
+    rejections.inc(reason="too_small")
+    rejections.inc(reason="too_small")
+    rejections.inc(reason='odd "reason"')
+    registry.gauge("queue_depth", "Waiting.", lambda: 3)
+
+    text = registry.render()
+    assert 'rejections_total{reason="too_small"} 2.0' in text
+    assert 'rejections_total{reason="odd \\"reason\\""} 1.0' in text
+    assert "# TYPE queue_depth gauge\nqueue_depth 3" in text
+    assert rejections.value(reason="too_small") == 2
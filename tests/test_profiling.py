@@ -0,0 +1,103 @@
+import json
+import time
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import api
+from src.inference import BrainTumorClassifier, SimpleCNN
+from src.profiling import Profiler, ProfilerBusyError
+from tests.helpers import make_mri_like, to_png
+
+
+client = TestClient(api.app)
+
+
+@pytest.fixture
+def classifier():
+    model = BrainTumorClassifier(model_path=None, arch="simple_cnn")
+    model._model = SimpleCNN().eval()
+    return model
+
+
+def test_capture_writes_profiles_and_restores_methods(classifier, tmp_path):
+    profiler = Profiler([classifier], str(tmp_path), sample_interval_ms=1)
+    profiler.start(max_requests=2)
+    assert "predict_batch" in vars(classifier)
+
+    image = classifier.decode_and_validate(to_png(make_mri_like()))
+    classifier.predict_batch([image, image])
+    profiler.request_finished()
+    assert profiler.active
+    profiler.request_finished()
+
+    deadline = time.monotonic() + 10
+    while profiler.last is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    summary = profiler.last
+    assert summary["requests"] == 2
+    assert summary["forward_passes"] == 1
+    assert {"stacks.folded", "cprofile.pstats", "torch_ops.txt", "torch_trace_0.json"} <= set(
+        summary["files"]
+    )
+
+    directory = Path(summary["directory"])
+    assert "predict_batch" in (directory / "cprofile.txt").read_text()
+    assert "aten::conv2d" in (directory / "torch_ops.txt").read_text()
+    assert json.loads((directory / "summary.json").read_text())["requests"] == 2
+
+    # Nothing stays wrapped once the capture is over
+    assert not {"predict_batch", "decode_and_validate"} & set(vars(classifier))
+    assert not profiler.active
+
+
+def test_capture_stops_after_its_time_limit(classifier, tmp_path):
+    profiler = Profiler([classifier], str(tmp_path))
+    profiler.start(max_seconds=0.05)
+    with pytest.raises(ProfilerBusyError):
+        profiler.start(max_requests=1)
+
+    deadline = time.monotonic() + 10
+    while profiler.last is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert profiler.last is not None
+    assert not profiler.active
+
+
+def test_start_needs_a_limit(classifier, tmp_path):
+    with pytest.raises(ValueError):
+        Profiler([classifier], str(tmp_path)).start()
+
+
+def test_admin_endpoint_is_hidden_without_token(monkeypatch):
+    monkeypatch.setattr(api, "PROFILING_TOKEN", "")
+    assert client.post("/admin/profile").status_code == 404
+
+
+def test_admin_endpoint_profiles_next_requests(monkeypatch, tmp_path):
+    monkeypatch.setattr(api, "PROFILING_TOKEN", "secret")
+    monkeypatch.setattr(api.profiler, "output_dir", tmp_path)
+    monkeypatch.setattr(api.classifier, "_model", SimpleCNN().eval())
+    api.prediction_cache.clear()
+
+    response = client.post("/admin/profile", headers={"X-Admin-Token": "wrong"})
+    assert response.status_code == 403
+
+    headers = {"X-Admin-Token": "secret"}
+    response = client.post("/admin/profile?requests=1&seconds=60", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["active"]
+    assert client.post("/admin/profile?requests=1", headers=headers).status_code == 409
+
+    files = {"file": ("scan.png", to_png(make_mri_like()), "image/png")}
+    assert client.post("/predict", files=files).status_code == 200
+
+    deadline = time.monotonic() + 10
+    status = client.get("/admin/profile", headers=headers).json()
+    while status["last"] is None and time.monotonic() < deadline:
+        time.sleep(0.02)
+        status = client.get("/admin/profile", headers=headers).json()
+    assert status["last"]["requests"] == 1
+    assert status["last"]["forward_passes"] == 1
+    api.prediction_cache.clear()
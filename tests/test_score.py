@@ -0,0 +1,74 @@
+import csv
+
+import pytest
+import torch
+
+from src.inference import SimpleCNN
+from src.score import iter_images, main
+from tests.helpers import make_mri_like
+
+
+@pytest.fixture
+def data_tree(tmp_path):
+    for folder, shade in (("yes", 150), ("no", 80)):
+        (tmp_path / "data_raw" / folder).mkdir(parents=True)
+        for i in range(3):
+            make_mri_like(shade=shade + i).save(tmp_path / "data_raw" / folder / f"{i}.png")
+    make_mri_like(size=64).save(tmp_path / "data_raw" / "no" / "tiny.png")
+    (tmp_path / "data_raw" / "no" / ".DS_Store").write_bytes(b"")
+
+    checkpoint = tmp_path / "simple_cnn_baseline_mps.pth"
+    torch.save(SimpleCNN().state_dict(), checkpoint)
+    return tmp_path / "data_raw", checkpoint
+
+
+def read_rows(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_scores_every_image_to_csv(data_tree, tmp_path):
+    root, checkpoint = data_tree
+    output = tmp_path / "scores.csv"
+    argv = [str(root), "-o", str(output), "--model-path", str(checkpoint)]
+    assert main(argv + ["--batch-size", "2", "--workers", "2"]) == 0
+
+    rows = read_rows(output)
+    assert sorted(r["path"] for r in rows) == sorted(iter_images(str(root)))
+    tiny = next(r for r in rows if r["path"].endswith("tiny.png"))
+    assert "too small" in tiny["error"] and tiny["label"] == ""
+    scored = [r for r in rows if not r["error"]]
+    assert len(scored) == 6
+    assert {r["true_label"] for r in scored} == {"0", "1"}
+    assert all(r["label_name"] in ("tumor", "no_tumor") for r in scored)
+
+
+def test_resume_skips_images_already_scored(data_tree, tmp_path):
+    root, checkpoint = data_tree
+    output = tmp_path / "scores.csv"
+    argv = [str(root), "-o", str(output), "--model-path", str(checkpoint), "--workers", "1"]
+    main(argv)
+
+    # Pretend the first run was interrupted after four images
+    rows = read_rows(output)
+    with open(output, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows[:4])
+
+    main(argv + ["--resume"])
+    resumed = read_rows(output)
+    assert len(resumed) == len(rows)
+    assert sorted(r["path"] for r in resumed) == sorted(r["path"] for r in rows)
+
+
+def test_parquet_output_is_written_per_batch(data_tree, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    root, checkpoint = data_tree
+    output = tmp_path / "scores.parquet"
+    argv = [str(root), "-o", str(output), "--model-path", str(checkpoint)]
+    main(argv + ["--batch-size", "3", "--workers", "1"])
+
+    table = pq.read_table(output)
+    assert table.num_rows == 7
+    assert len(list(output.glob("part-*.parquet"))) == 3
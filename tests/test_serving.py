@@ -0,0 +1,20 @@
+from src.serving import default_workers, torch_threads_per_worker
+
+
+def test_threads_never_oversubscribe_cores(monkeypatch):
+    monkeypatch.delenv("TORCH_NUM_THREADS", raising=False)
+    for cpus in (1, 2, 4, 8, 16):
+        for workers in (1, 2, 3, 4, 8):
+            threads = torch_threads_per_worker(workers, cpus=cpus)
+            assert threads >= 1
+            assert workers * threads <= max(cpus, workers)
+
+
+def test_thread_override(monkeypatch):
+    monkeypatch.setenv("TORCH_NUM_THREADS", "3")
+    assert torch_threads_per_worker(4, cpus=16) == 3
+
+
+def test_default_workers_is_capped():
+    assert default_workers(cpus=1) == 1
+    assert default_workers(cpus=64) == 4
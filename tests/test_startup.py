@@ -0,0 +1,174 @@
+"""
+Cold-start budgets for the API.
+
+Importing src.api must not import torch / torchvision (they are loaded by
+the background warm-up), and a fresh server, under uvicorn or through
+gunicorn.conf.py as deployed, must answer /health within
+STARTUP_BUDGET_S. The `-X importtime` breakdown of `import src.api` is
+written to IMPORTTIME_REPORT (default reports/importtime_api.txt),
+slowest modules first, for CI to keep as an artifact.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import torch
+
+from src.inference import SimpleCNN
+
+ROOT = Path(__file__).resolve().parent.parent
+REPORT_PATH = Path(
+    os.environ.get("IMPORTTIME_REPORT", ROOT / "reports" / "importtime_api.txt")
+)
+
+# Seconds; generous for slow CI runners (about 0.6 s / 1 s on a laptop)
+IMPORT_BUDGET_S = float(os.environ.get("IMPORT_BUDGET_S", "2.5"))
+STARTUP_BUDGET_S = float(os.environ.get("STARTUP_BUDGET_S", "5"))
+
+HEAVY_MODULES = ("torch", "torchvision", "onnxruntime", "sklearn")
+
+
+def parse_importtime(stderr: str) -> list:
+    """(module, self_us, cumulative_us) for each line of -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def write_report(rows: list, path: Path = REPORT_PATH) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        f.write(f"{'cumulative ms':>13} {'self ms':>9}  module\n")
+        for name, self_us, cumulative_us in sorted(rows, key=lambda row: -row[2]):
+            f.write(f"{cumulative_us / 1000:>13.1f} {self_us / 1000:>9.1f}  {name}\n")
+
+
+def test_api_import_is_light():
+    env = {**os.environ, "MODEL_PATH": "/nonexistent/model.pth"}
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.api"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    elapsed = time.perf_counter() - started
+    assert result.returncode == 0, result.stderr[-2000:]
+
+    rows = parse_importtime(result.stderr)
+    write_report(rows)
+
+    imported = {name for name, _, _ in rows}
+    heavy = sorted(
+        name for name in imported if name.split(".")[0] in HEAVY_MODULES
+    )
+    assert not heavy, f"import src.api pulled in {heavy[:5]} (see {REPORT_PATH})"
+
+    api_us = next(cumulative for name, _, cumulative in rows if name == "src.api")
+    assert api_us / 1e6 <= IMPORT_BUDGET_S, (
+        f"import src.api took {api_us / 1e6:.2f} s (budget {IMPORT_BUDGET_S} s, "
+        f"process {elapsed:.2f} s); see {REPORT_PATH}"
+    )
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _startup_times(command: list, env: dict, port: int, on_ready=None) -> tuple:
+    """
+    Seconds until /health, then /ready, answer 200 (None if never).
+    `on_ready(process)` runs once the server is ready, before it is stopped.
+    """
+    started = time.monotonic()
+    process = subprocess.Popen(
+        command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        health_s = ready_s = None
+        while time.monotonic() - started < 60 and ready_s is None:
+            assert process.poll() is None, "server exited during startup"
+            try:
+                if health_s is None:
+                    if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                        health_s = time.monotonic() - started
+                elif httpx.get(f"http://127.0.0.1:{port}/ready", timeout=1).status_code == 200:
+                    ready_s = time.monotonic() - started
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.05)
+        if ready_s is not None and on_ready is not None:
+            on_ready(process)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return health_s, ready_s
+
+
+def _server_env(tmp_path) -> dict:
+    checkpoint = tmp_path / "simple_cnn_baseline_mps.pth"
+    torch.save(SimpleCNN().state_dict(), checkpoint)
+    return {
+        **os.environ,
+        "MODEL_PATH": str(checkpoint),
+        "PREDICT_POOL_SIZE": "1",
+        "JOBS_DB": str(tmp_path / "jobs.sqlite3"),
+    }
+
+
+def test_server_answers_before_model_is_loaded(tmp_path):
+    port = _free_port()
+    health_s, ready_s = _startup_times(
+        [
+            sys.executable, "-m", "uvicorn", "src.api:app",
+            "--host", "127.0.0.1", "--port", str(port),
+        ],
+        _server_env(tmp_path),
+        port,
+    )
+    assert health_s is not None and health_s <= STARTUP_BUDGET_S, (
+        f"/health answered after {health_s} s (budget {STARTUP_BUDGET_S} s)"
+    )
+    # The model is then loaded and warmed up in the background
+    assert ready_s is not None
+
+
+def test_gunicorn_answers_before_model_is_loaded(tmp_path):
+    # As deployed: gunicorn.conf.py preloads the app in the master and
+    # must not import torch or load the model there
+    port = _free_port()
+    env = {**_server_env(tmp_path), "PORT": str(port), "WEB_CONCURRENCY": "2"}
+    master_maps = []
+
+    def read_master_maps(process):
+        maps = Path(f"/proc/{process.pid}/maps")
+        if maps.exists():  # Linux only
+            master_maps.append(maps.read_text())
+
+    health_s, ready_s = _startup_times(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-b",
+         f"127.0.0.1:{port}", "src.api:app"],
+        env,
+        port,
+        on_ready=read_master_maps,
+    )
+    assert not any("libtorch" in maps for maps in master_maps), (
+        "the gunicorn master loaded torch"
+    )
+    assert health_s is not None and health_s <= STARTUP_BUDGET_S, (
+        f"gunicorn /health answered after {health_s} s (budget {STARTUP_BUDGET_S} s)"
+    )
+    assert ready_s is not None
@@ -0,0 +1,89 @@
+import io
+
+import numpy as np
+import pytest
+import torch
+import torch.nn as nn
+from fastapi.testclient import TestClient
+
+from src import api
+from src.inference import BrainTumorClassifier, InvalidImageError, SimpleCNN
+from src.study import open_volume, score_study, slice_order
+
+
+class ConstantLogit(nn.Module):
+    """Scores every slice the same, e.g. confidently tumor."""
+
+    def __init__(self, logit: float) -> None:
+        super().__init__()
+        self.logit = logit
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return torch.full((x.shape[0], 1), self.logit)
+
+
+def make_volume(slices=40, size=256, blank=5):
+    """int16 stack of disc slices with empty slices at both ends."""
+    yy, xx = np.mgrid[:size, :size]
+    disc = ((yy - size / 2) ** 2 + (xx - size / 2) ** 2 < (size / 3) ** 2) * 900
+    volume = np.repeat(disc[None].astype(np.int16), slices, axis=0)
+    volume[:blank] = 0
+    volume[-blank:] = 0
+    return volume
+
+
+@pytest.fixture
+def volume_path(tmp_path):
+    path = tmp_path / "study.npy"
+    np.save(path, make_volume())
+    return str(path)
+
+
+def test_slice_order_starts_in_the_middle():
+    assert slice_order(7) == [3, 4, 2, 5, 1, 6, 0]
+    # The stride grid is anchored on the middle slice
+    assert slice_order(10, stride=3) == [5, 8, 2]
+
+
+def test_volume_is_memory_mapped(volume_path):
+    assert isinstance(open_volume(volume_path), np.memmap)
+    with pytest.raises(InvalidImageError):
+        open_volume(volume_path.replace(".npy", ".dcm"))
+
+
+def test_study_exits_early_on_confident_slices(volume_path):
+    clf = BrainTumorClassifier(arch="simple_cnn", model=ConstantLogit(5.0))
+    result = score_study(clf, open_volume(volume_path), batch_size=4, top_k=3)
+    assert result["label_name"] == "tumor"
+    assert result["early_exit"]
+    assert result["slices_scored"] == 4
+    assert result["top_slices"][0]["index"] in (18, 19, 20, 21, 22)
+
+
+def test_study_scores_every_sampled_slice_without_early_exit(volume_path):
+    clf = BrainTumorClassifier(arch="simple_cnn", model=ConstantLogit(-5.0))
+    result = score_study(clf, open_volume(volume_path), stride=2, batch_size=4)
+    assert result["label_name"] == "no_tumor"
+    assert not result["early_exit"]
+    # 20 even slices; 0, 2, 4, 36 and 38 are empty and skipped
+    assert result["slices_scored"] + result["slices_blank"] == 20
+    assert result["slices_blank"] == 5
+
+
+def test_study_endpoint(monkeypatch):
+    monkeypatch.setattr(api.classifier, "_model", SimpleCNN().eval())
+    buf = io.BytesIO()
+    np.save(buf, make_volume(slices=12))
+    client = TestClient(api.app)
+
+    files = {"file": ("study.npy", buf.getvalue(), "application/octet-stream")}
+    response = client.post("/predict/study?stride=2", files=files)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["slices_total"] == 12
+    assert data["label_name"] in ("tumor", "no_tumor")
+
+    files = {"file": ("study.npy", b"not a volume", "application/octet-stream")}
+    response = client.post("/predict/study", files=files)
+    assert response.status_code == 400
+    assert "Could not read volume" in response.json()["error"]